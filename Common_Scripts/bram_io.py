@@ -0,0 +1,320 @@
+# Helper functions to transfer interleaved data from/to ROACH brams using
+# more than one katcp connection, so that independent bram groups can be
+# read at the same time instead of one after another. It also allows to
+# read single channels from interleaved brams, to avoid downloading full
+# spectra when only one channel is needed, to detect when new 
+# accumulations are available after a change in the input, and to write
+# only the words of a bram that changed since the last write.
+
+# imports
+from multiprocessing.pool import ThreadPool
+import numpy as np
+import calandigital as cd
+
+def read_interleave_chnl(roach, brams, addr_width, word_width, data_type, chnl):
+    """
+    Read the value of a single channel from a set of interleaved brams. The
+    channel is mapped to its bram and address following the interleave of
+    cd.read_interleave_data, and only that word is read from the ROACH.
+    :param roach: FpgaClient object to communicate with roach.
+    :param brams: list of interleaved bram names.
+    :param addr_width: address width of the brams (bits).
+    :param word_width: word width of the brams (bits).
+    :param data_type: numpy data type of the brams.
+    :param chnl: channel to read.
+    :return: channel value.
+    """
+    bram = brams[chnl % len(brams)]
+    addr = chnl // len(brams)
+    if addr >= 2**addr_width:
+        raise ValueError("Channel " + str(chnl) + " out of range for brams " +
+            "of address width " + str(addr_width) + ".")
+    
+    nbytes = word_width // 8
+    data = roach.read(bram, nbytes, addr*nbytes)
+    data = np.frombuffer(data, dtype=data_type)
+
+    return float(data[0])
+
+class RoachPool(object):
+    """
+    Pool of katcp connections to the same ROACH. Every connection is used by
+    a single thread at a time, so bram groups assigned to different
+    connections are transferred concurrently.
+    """
+    def __init__(self, roach, roach_ip, nconnections, timer=None,
+        initialize_roach=None):
+        """
+        :param roach: FpgaClient object already connected to roach. It is used
+            as the first connection of the pool.
+        :param roach_ip: ROACH IP address, used to open the extra connections.
+        :param nconnections: total number of connections in the pool. If 1,
+            all reads are made serially with roach.
+        :param timer: PhaseTimer used to time the read of every bram group,
+            as "read group <group index>" phases. It can also be set later
+            with the timer attribute. If None, the reads are not timed.
+        :param initialize_roach: function used to open the extra connections
+            from roach_ip (e.g. the initialize_roach of an emulated ROACH).
+            If None, cd.initialize_roach is used.
+        """
+        initialize_roach = initialize_roach or cd.initialize_roach
+        self.timer   = timer
+        self.roaches = [roach]
+        for i in range(nconnections-1):
+            self.roaches.append(initialize_roach(roach_ip))
+        self.threads = ThreadPool(nconnections) if nconnections > 1 else None
+
+    def read_interleave_groups(self, bram_groups, addr_width, word_width,
+        data_types):
+        """
+        Read several groups of interleaved brams. Each group is read as with
+        cd.read_interleave_data, but groups assigned to different connections
+        are read at the same time.
+        :param bram_groups: list of bram name lists, one list per group.
+        :param addr_width: address width of the brams (bits).
+        :param word_width: word width of the brams (bits).
+        :param data_types: list of numpy data types, one per group.
+        :return: list of interleaved data arrays, in the same order as
+            bram_groups.
+        """
+        def read_group(roach, i):
+            return cd.read_interleave_data(roach, bram_groups[i], addr_width,
+                word_width, data_types[i])
+
+        return self.map_groups(self.time_groups(read_group), len(bram_groups))
+
+    def read_chnl_groups(self, bram_groups, addr_width, word_width,
+        data_types, chnl):
+        """
+        Read a single channel from several groups of interleaved brams. Groups 
+        assigned to different connections are read at the same time.
+        :param bram_groups: list of bram name lists, one list per group.
+        :param addr_width: address width of the brams (bits).
+        :param word_width: word width of the brams (bits).
+        :param data_types: list of numpy data types, one per group.
+        :param chnl: channel to read.
+        :return: list of channel values, in the same order as bram_groups.
+        """
+        def read_group(roach, i):
+            return read_interleave_chnl(roach, bram_groups[i], addr_width,
+                word_width, data_types[i], chnl)
+
+        return self.map_groups(self.time_groups(read_group), len(bram_groups))
+
+    def time_groups(self, read_group):
+        """
+        Time every call of a group read function with the timer of the pool.
+        :param read_group: function with arguments (roach, group index) that
+            returns the data of the group.
+        :return: timed read function, or read_group if there is no timer.
+        """
+        if self.timer is None:
+            return read_group
+
+        def timed_read_group(roach, i):
+            with self.timer.time("read group " + str(i)):
+                return read_group(roach, i)
+
+        return timed_read_group
+
+    def map_groups(self, read_group, ngroups):
+        """
+        Apply a read function to a number of bram groups. Groups are assigned
+        to connections in round robin, and every connection reads its groups
+        serially in its own thread.
+        :param read_group: function with arguments (roach, group index) that
+            returns the data of the group.
+        :param ngroups: number of groups to read.
+        :return: list with the data of every group, in group order.
+        """
+        if self.threads is None:
+            return [read_group(self.roaches[0], i) for i in range(ngroups)]
+
+        nroaches = len(self.roaches)
+        def read_groups(roach_id):
+            roach = self.roaches[roach_id]
+            return [(i, read_group(roach, i)) 
+                for i in range(roach_id, ngroups, nroaches)]
+        results = self.threads.map(read_groups, range(nroaches))
+
+        # sort data in the original group order
+        data_list = [None] * ngroups
+        for roach_results in results:
+            for i, data in roach_results:
+                data_list[i] = data
+
+        return data_list
+
+    def close(self):
+        """
+        Stop the reading threads of the pool, and close the extra connections
+        (the first connection is left open for its owner).
+        """
+        if self.threads is not None:
+            self.threads.close()
+            self.threads.join()
+            self.threads = None
+        for roach in self.roaches[1:]:
+            roach.stop()
+        self.roaches = self.roaches[:1]
+
+class AccPoller(object):
+    """
+    Detect new accumulations in the ROACH after a change in the input (e.g. a
+    tone change). If the model has an accumulation counter register it is
+    used, otherwise a new accumulation is detected when the value of the
+    channel of interest changes in the accumulation brams.
+    """
+    def __init__(self, roach, brams, addr_width, word_width, data_type, 
+        acc_cnt_reg=None, naccs=2):
+        """
+        :param roach: FpgaClient object to communicate with roach.
+        :param brams: list of interleaved bram names used to detect new
+            accumulations when there is no accumulation counter.
+        :param addr_width: address width of the brams (bits).
+        :param word_width: word width of the brams (bits).
+        :param data_type: numpy data type of the brams.
+        :param acc_cnt_reg: accumulation counter register name. If None, the
+            brams are used instead.
+        :param naccs: number of new accumulations to wait for. With 2, the 
+            accumulation running when the input changed is discarded and the
+            next one is fully computed with the new input.
+        """
+        self.roach       = roach
+        self.brams       = brams
+        self.addr_width  = addr_width
+        self.word_width  = word_width
+        self.data_type   = data_type
+        self.acc_cnt_reg = acc_cnt_reg
+        self.naccs       = naccs
+
+    def read_acc_id(self):
+        """
+        Read the value that identifies the current accumulation.
+        :return: accumulation counter, or the channel value if there is no
+            counter.
+        """
+        if self.acc_cnt_reg is not None:
+            return self.roach.read_uint(self.acc_cnt_reg)
+        return read_interleave_chnl(self.roach, self.brams, self.addr_width,
+            self.word_width, self.data_type, self.chnl)
+
+    def mark(self, chnl):
+        """
+        Set the reference accumulation. Must be called right after the input
+        change.
+        :param chnl: channel used to detect new accumulations when there is
+            no accumulation counter.
+        """
+        self.chnl     = chnl
+        self.last_id  = self.read_acc_id()
+        self.new_accs = 0
+
+    def ready(self):
+        """
+        Check if the required number of new accumulations have been computed
+        since the last mark(). When there is no counter, accumulations that
+        happen between two calls can't be counted, so the result is late in 
+        the worst case, but never early.
+        :return: True if the new accumulations are available.
+        """
+        acc_id = self.read_acc_id()
+        if self.acc_cnt_reg is not None:
+            self.new_accs = (acc_id - self.last_id) % 2**32
+        elif acc_id != self.last_id:
+            self.new_accs += 1
+            self.last_id = acc_id
+        
+        return self.new_accs >= self.naccs
+
+class BramWriter(object):
+    """
+    Write data into ROACH brams keeping a host copy of the last data written
+    into every bram, so that in the next writes only the word ranges that
+    changed are written. The host copy assumes that nothing else writes the
+    brams (or reprograms the FPGA) in between, use reset() if that happens.
+    """
+    def __init__(self, word_width, max_gap=16):
+        """
+        :param word_width: word width of the brams (bits).
+        :param max_gap: maximum number of unchanged words between two changed
+            ranges for the ranges to be merged and written in a single write.
+        """
+        self.nbytes  = word_width // 8
+        self.max_gap = max_gap
+        self.images  = {}
+
+    def write(self, roach, blobs, roach_pool=None, diff=True):
+        """
+        Write data into a set of brams.
+        :param roach: FpgaClient object to communicate with roach. Not used 
+            if roach_pool is given.
+        :param blobs: dictionary with the data of every bram as bytes.
+        :param roach_pool: RoachPool used to write the brams concurrently.
+        :param diff: if True, write only the word ranges that changed since
+            the last write. If False, write the full brams.
+        :return: number of bytes written.
+        """
+        writes = []
+        for bram, blob in blobs.items():
+            if diff:
+                ranges = self.diff_ranges(self.images.get(bram), blob)
+            else:
+                ranges = [(0, len(blob))]
+            if ranges:
+                writes.append((bram, blob, ranges))
+
+        def write_bram(roach, i):
+            bram, blob, ranges = writes[i]
+            for start, end in ranges:
+                roach.write(bram, blob[start:end], start)
+
+        if roach_pool is None:
+            for i in range(len(writes)):
+                write_bram(roach, i)
+        else:
+            roach_pool.map_groups(write_bram, len(writes))
+
+        # update host copy only after a successful write
+        for bram, blob, ranges in writes:
+            self.images[bram] = blob
+
+        return sum([end-start for bram, blob, ranges in writes 
+            for start, end in ranges])
+
+    def diff_ranges(self, old_blob, new_blob):
+        """
+        Get the byte ranges that differ between the old and new data of a
+        bram, in word units, merging ranges separated by less than max_gap
+        unchanged words.
+        :param old_blob: last data written into the bram. If None, the full
+            bram is considered changed.
+        :param new_blob: data to write.
+        :return: list of (start, end) byte ranges to write.
+        """
+        if old_blob is None or len(old_blob) != len(new_blob):
+            return [(0, len(new_blob))]
+
+        old_words = np.frombuffer(old_blob, dtype=np.uint8)
+        new_words = np.frombuffer(new_blob, dtype=np.uint8)
+        old_words = old_words.reshape((-1, self.nbytes))
+        new_words = new_words.reshape((-1, self.nbytes))
+        changed = np.flatnonzero(np.any(old_words != new_words, axis=1))
+        if len(changed) == 0:
+            return []
+
+        # split changed words where the gap is larger than max_gap
+        splits = np.flatnonzero(np.diff(changed) > self.max_gap + 1) + 1
+        ranges = []
+        for run in np.split(changed, splits):
+            ranges.append((int(run[0]) * self.nbytes, 
+                (int(run[-1])+1) * self.nbytes))
+
+        return ranges
+
+    def reset(self):
+        """
+        Forget the host copy of the brams, so that the next write is a full
+        write.
+        """
+        self.images = {}
@@ -0,0 +1,213 @@
+# Interpolation of the tone calibration data to the channels between the
+# measured tones. The complex crosspower is not interpolated directly (linear
+# interpolation of complex values shrinks its magnitude and bends its phase
+# between tones): the powers are interpolated in log scale, and the
+# crosspower as log magnitude and unwrapped phase. As the interpolations are
+# linear in the data, interpolating log|ab| and log(b2) separately is the
+# same as interpolating the magnitude ratio |a/b|. Before unwrapping, the
+# phase slope of the delay between inputs is removed, so that the phase is
+# unwrapped correctly even if it turns more than 180 degrees between tones
+# (coarse sweeps). The interpolation error is estimated with leave one out:
+# every tone is predicted from the rest of the tones, and the error of the
+# resulting constant is converted into an SRR estimate. The same estimate is
+# used to place the tones of adaptive sweeps where they are needed. The
+# calibration constants are computed from the (interpolated) data with
+# caldata2consts.
+
+# imports
+import json
+import numpy as np
+from scipy.interpolate import CubicSpline
+
+def interp_caldata(freqs, test_freqs, a2, b2, ab, method='spline', degree=5,
+    delay=None):
+    """
+    Interpolate the calibration data of a tone sweep.
+    :param freqs: frequencies where to interpolate (e.g. all the channels).
+    :param test_freqs: frequencies of the measured tones, sorted.
+    :param a2: power of input a at the tones.
+    :param b2: power of input b at the tones.
+    :param ab: crosspower of inputs a and b at the tones.
+    :param method: 'linear' for linear interpolation of the raw (complex)
+        data, 'spline' for cubic splines of magnitude and phase, 'poly' for
+        a delay plus polynomial fit of magnitude and phase (least squares,
+        it smooths the measurement noise).
+    :param degree: degree of the polynomials of the 'poly' method.
+    :param delay: delay between inputs used to unwrap the phase (in the
+        inverse units of the frequencies). If None, it is estimated from ab.
+    :return: interpolated a2, b2 and ab. Outside the range of the tones the
+        edge values are kept, as with np.interp.
+    """
+    if method == 'linear':
+        return [np.interp(freqs, test_freqs, data) for data in [a2, b2, ab]]
+
+    if delay is None:
+        delay = estimate_delay(test_freqs, ab)
+    test_freqs = np.asarray(test_freqs)
+    phase = np.unwrap(np.angle(ab * np.exp(-2j*np.pi*test_freqs*delay)))
+    log_data = [np.log(np.maximum(data, 1e-300)) for data in
+        [a2, b2, np.abs(ab)]]
+    freqs = np.asarray(freqs)
+    clip_freqs = np.clip(freqs, test_freqs[0], test_freqs[-1])
+    log_a2, log_b2, log_ab, phase = [interp_real(clip_freqs, test_freqs, data,
+        method, degree) for data in log_data + [phase]]
+    ab_interp = np.exp(log_ab + 1j*(phase + 2*np.pi*freqs*delay))
+
+    return np.exp(log_a2), np.exp(log_b2), ab_interp
+
+def interp_real(freqs, test_freqs, data, method, degree):
+    """
+    Interpolate real data.
+    :param freqs: frequencies where to interpolate.
+    :param test_freqs: frequencies of the data.
+    :param data: real data.
+    :param method: 'spline' or 'poly', see interp_caldata.
+    :param degree: degree of the polynomial of the 'poly' method.
+    :return: interpolated data.
+    """
+    if len(test_freqs) < 3:
+        return np.interp(freqs, test_freqs, data)
+    if method == 'spline':
+        return CubicSpline(test_freqs, data)(freqs)
+    if method == 'poly':
+        # normalize the frequencies for a well conditioned fit
+        center = np.mean(test_freqs); scale = np.ptp(test_freqs) / 2
+        poly = np.polyfit((test_freqs - center) / scale, data,
+            min(degree, len(test_freqs) - 1))
+        return np.polyval(poly, (freqs - center) / scale)
+    raise ValueError("Unknown interpolation method " + str(method) + ".")
+
+def estimate_delay(test_freqs, ab):
+    """
+    Estimate the delay between inputs from the phase slope of the
+    crosspower, as the delay that maximizes the coherent sum of the
+    crosspower phasors. The delay is searched within +-1/(2*tone spacing),
+    so that the remaining phase turns less than 180 degrees between tones.
+    :param test_freqs: frequencies of the tones.
+    :param ab: crosspower of inputs a and b at the tones.
+    :return: delay (in the inverse units of the frequencies, e.g. us for
+        MHz).
+    """
+    if len(test_freqs) < 3:
+        return 0.0
+    test_freqs = np.asarray(test_freqs)
+    max_delay = 0.5 / np.min(np.diff(test_freqs))
+    delays = np.linspace(-max_delay, max_delay, 8*len(test_freqs),
+        endpoint=False)
+    phasors = ab / np.maximum(np.abs(ab), 1e-300)
+    coherence = np.abs(np.exp(-2j*np.pi*np.outer(delays, test_freqs)).dot(
+        phasors))
+
+    return delays[np.argmax(coherence)]
+
+def estimate_interp_error(test_freqs, a2, b2, ab, tone_sideband,
+    method='spline', degree=5):
+    """
+    Estimate the interpolation error of the calibration constants with leave
+    one out: the constant at every tone is computed from the interpolation
+    of the rest of the tones and compared with the measured constant. As the
+    removed tone doubles the local tone spacing, the estimate is pessimistic.
+    The edge tones would be extrapolated, so they are not estimated.
+    :param test_freqs: frequencies of the tones, sorted.
+    :param a2: power of input a at the tones.
+    :param b2: power of input b at the tones.
+    :param ab: crosspower of inputs a and b at the tones.
+    :param tone_sideband: sideband of the tones ('usb' or 'lsb'). USB tones
+        give the LSB constants (b/a) and LSB tones the USB constants (a/b).
+    :param method: interpolation method, see interp_caldata.
+    :param degree: degree of the polynomials of the 'poly' method.
+    :return: relative error of the constant at every tone (NaN at the edge
+        tones).
+    """
+    def ratio(a2, b2, ab):
+        return np.conj(ab) / a2 if tone_sideband == 'usb' else ab / b2
+
+    test_freqs = np.asarray(test_freqs)
+    delay = estimate_delay(test_freqs, ab)
+    error = np.full(len(test_freqs), np.nan)
+    for i in range(1, len(test_freqs) - 1):
+        keep = np.arange(len(test_freqs)) != i
+        a2_i, b2_i, ab_i = interp_caldata(test_freqs[i:i+1], test_freqs[keep],
+            a2[keep], b2[keep], ab[keep], method, degree, delay)
+        error[i] = np.abs(ratio(a2_i, b2_i, ab_i)[0] /
+            ratio(a2[i], b2[i], ab[i]) - 1)
+
+    return error
+
+def refine_chnls(chnls, a2, b2, ab, tone_sideband, srr_target, min_step,
+    method='spline', degree=5):
+    """
+    Choose the tones of the next pass of an adaptive sweep. A tone whose
+    leave one out SRR estimate (see estimate_interp_error) is below the
+    target means that the data changes too fast around it (high curvature
+    or ripple), so a new tone is placed in the middle of the gaps at both
+    sides of it.
+    :param chnls: channels of the measured tones, sorted.
+    :param a2: power of input a at the tones.
+    :param b2: power of input b at the tones.
+    :param ab: crosspower of inputs a and b at the tones.
+    :param tone_sideband: sideband of the tones ('usb' or 'lsb').
+    :param srr_target: SRR target (dB).
+    :param min_step: minimum distance between tones (channels). Gaps
+        narrower than 2*min_step are not split.
+    :param method: interpolation method, see interp_caldata.
+    :param degree: degree of the polynomials of the 'poly' method.
+    :return: sorted list with the channels of the new tones (empty if the
+        sweep is resolved).
+    """
+    chnls = np.asarray(chnls)
+    srr = error2srr(estimate_interp_error(chnls, a2, b2, ab, tone_sideband,
+        method, degree))
+    new_chnls = set()
+    for i in np.where(srr < srr_target)[0]:
+        for j in [i-1, i]:
+            if chnls[j+1] - chnls[j] >= 2*min_step:
+                new_chnls.add(int((chnls[j] + chnls[j+1]) // 2))
+
+    return sorted(new_chnls)
+
+def caldata2consts(caldata):
+    """
+    Compute constants from the calibration data of a LO setting.
+    :param caldata: calibration data (a2, b2 and ab of the tones of each 
+        sideband, as saved in caldata.npz).
+    :return: calibration constants.
+    """
+    # get arrays
+    a2_toneusb = caldata['a2_toneusb']; a2_tonelsb = caldata['a2_tonelsb']
+    b2_toneusb = caldata['b2_toneusb']; b2_tonelsb = caldata['b2_tonelsb']
+    ab_toneusb = caldata['ab_toneusb']; ab_tonelsb = caldata['ab_tonelsb']
+
+    # consts usb are computed with tone in lsb, because you want to cancel out 
+    # lsb, the same for consts lsb
+    consts_usb =         -1 * ab_tonelsb  / b2_tonelsb #  ab*   / bb* = a/b
+    consts_lsb = -1 * np.conj(ab_toneusb) / a2_toneusb # (ab*)* / aa* = a*b / aa* = b/a
+
+    return consts_lsb, consts_usb
+
+def error2srr(error):
+    """
+    Convert the relative error of a calibration constant into the SRR that
+    it allows: the rejected sideband leaks with amplitude |error| relative to
+    a single input, while the wanted sideband adds both inputs (amplitude 2).
+    :param error: relative error of the constant.
+    :return: SRR (dB).
+    """
+    return 20*np.log10(2 / np.maximum(error, 1e-15))
+
+def save_interp_srr(filename, key, srr):
+    """
+    Record the summary of the interpolation SRR estimate of a sweep in the
+    test info file of the measurement.
+    :param filename: test info .json file.
+    :param key: name of the sweep (e.g. "usb").
+    :param srr: SRR estimate at every tone (dB, NaN if not estimated).
+    """
+    srr = np.asarray(srr)[np.isfinite(srr)]
+    with open(filename, "r") as f:
+        testinfo = json.load(f)
+    testinfo.setdefault("interp srr estimate db", {})[key] = \
+        {"min" : float(np.min(srr)), "median" : float(np.median(srr))} \
+        if len(srr) > 0 else None
+    with open(filename, "w") as f:
+        json.dump(testinfo, f, indent=4, sort_keys=True)
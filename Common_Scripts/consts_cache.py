@@ -0,0 +1,171 @@
+# Cache of calibration constants already converted into the fixed point data
+# that is written into the ROACH constant brams. Constants are identified by
+# the content of the calibration file, the directory of the constants within
+# it and the fixed point format, so that loading the same constants again
+# (e.g. when changing LO in a multi LO measurement) is just a copy from
+# memory (or disk) into the brams. The cache is kept in memory and in a disk
+# directory, and the least recently used constants are removed when the cache
+# is full.
+
+# imports
+import os, hashlib
+from collections import OrderedDict
+import numpy as np
+import calandigital as cd
+
+# content hash of already hashed files, identified by name, size and
+# modification time
+file_hashes = {}
+
+def file_hash(filename):
+    """
+    Compute the SHA1 hash of a file content. The hash is computed only once
+    per file version.
+    :param filename: file to hash.
+    :return: hex string with the hash.
+    """
+    stat = os.stat(filename)
+    file_id = (os.path.abspath(filename), stat.st_size, stat.st_mtime)
+    if file_id not in file_hashes:
+        sha1 = hashlib.sha1()
+        with open(filename, 'rb') as f:
+            for chunk in iter(lambda: f.read(2**20), b''):
+                sha1.update(chunk)
+        file_hashes[file_id] = sha1.hexdigest()
+
+    return file_hashes[file_id]
+
+def consts_key(calfile, caldir, nbits, binpt):
+    """
+    Get the cache key of a set of constants.
+    :param calfile: compressed file with the calibration data.
+    :param caldir: directory of the calibration data within calfile.
+    :param nbits: number of bits of the fixed point constants.
+    :param binpt: binary point of the fixed point constants.
+    :return: cache key.
+    """
+    key = "|".join([file_hash(calfile), caldir, str(nbits), str(binpt)])
+    return hashlib.sha1(key.encode()).hexdigest()
+
+def consts2blobs(consts, bram_re, bram_im, nbits, binpt):
+    """
+    Convert complex constants into the big endian fixed point data of every
+    bram, ready to be written into the ROACH. Real and imaginary parts are
+    interleaved in separated bram blocks.
+    :param consts: complex constants array.
+    :param bram_re: bram names for real part.
+    :param bram_im: bram names for imaginary part.
+    :param nbits: number of bits of the fixed point constants.
+    :param binpt: binary point of the fixed point constants.
+    :return: dictionary with the data of every bram as bytes.
+    """
+    blobs = OrderedDict()
+    for part, brams in [(np.real(consts), bram_re), (np.imag(consts), bram_im)]:
+        part_fixed = cd.float2fixed(part, nbits, binpt, warn=True)
+        part_fixed = np.asarray(part_fixed).astype('>i' + str(nbits//8))
+        for i, bram in enumerate(brams):
+            blobs[bram] = part_fixed[i::len(brams)].tobytes()
+
+    return blobs
+
+class ConstsCache(object):
+    """
+    Least recently used cache of fixed point constants, saved in memory and
+    in a disk directory (one .npz file per set of constants).
+    """
+    def __init__(self, cachedir, maxsize):
+        """
+        :param cachedir: directory where to save the cached constants. It is
+            created if it does not exist.
+        :param maxsize: maximum number of constant sets kept in the cache.
+        """
+        self.cachedir = cachedir
+        self.maxsize  = maxsize
+        self.memory   = OrderedDict()
+
+    def load(self, key, compute_blobs):
+        """
+        Get a set of constants from the cache, or compute it and add it to
+        the cache if it is not there.
+        :param key: cache key of the constants (see consts_key).
+        :param compute_blobs: function with no arguments that returns the
+            constants data, used when the constants are not in the cache.
+        :return: dictionary with the data of every bram as bytes.
+        """
+        blobs = self.get(key)
+        if blobs is None:
+            blobs = compute_blobs()
+            self.put(key, blobs)
+
+        return blobs
+
+    def get(self, key):
+        """
+        Get a set of constants from the cache.
+        :param key: cache key of the constants.
+        :return: dictionary with the data of every bram as bytes, or None if
+            the constants are not in the cache.
+        """
+        if key in self.memory:
+            blobs = self.memory.pop(key)
+            self.memory[key] = blobs
+            if os.path.exists(self.filename(key)):
+                os.utime(self.filename(key), None)
+            return blobs
+
+        filename = self.filename(key)
+        if not os.path.exists(filename):
+            return None
+        cachedata = np.load(filename)
+        blobs = OrderedDict()
+        for bram in cachedata['brams']:
+            blobs[str(bram)] = cachedata[str(bram)].tobytes()
+        os.utime(filename, None)
+        self.add_to_memory(key, blobs)
+
+        return blobs
+
+    def put(self, key, blobs):
+        """
+        Add a set of constants to the cache, removing the least recently used
+        constants if the cache is full.
+        :param key: cache key of the constants.
+        :param blobs: dictionary with the data of every bram as bytes.
+        """
+        if not os.path.exists(self.cachedir):
+            os.makedirs(self.cachedir)
+
+        # save in a temporal file first, so that an interrupted write is not
+        # used as a valid cache entry
+        cachedata = {bram : np.frombuffer(blob, dtype=np.uint8)
+            for bram, blob in blobs.items()}
+        tmpfile = self.filename(key) + ".tmp"
+        with open(tmpfile, 'wb') as f:
+            np.savez(f, brams=list(blobs.keys()), **cachedata)
+        os.rename(tmpfile, self.filename(key))
+        self.add_to_memory(key, blobs)
+
+        # remove least recently used files
+        cachefiles = [os.path.join(self.cachedir, cachefile) for cachefile
+            in os.listdir(self.cachedir) if cachefile.endswith(".npz")]
+        cachefiles.sort(key=os.path.getmtime)
+        for cachefile in cachefiles[:-self.maxsize]:
+            os.remove(cachefile)
+
+    def add_to_memory(self, key, blobs):
+        """
+        Add a set of constants to the memory cache, removing the least
+        recently used constants if the cache is full.
+        :param key: cache key of the constants.
+        :param blobs: dictionary with the data of every bram as bytes.
+        """
+        self.memory[key] = blobs
+        while len(self.memory) > self.maxsize:
+            self.memory.popitem(last=False)
+
+    def filename(self, key):
+        """
+        :param key: cache key of the constants.
+        :return: cache file of the constants.
+        """
+        return os.path.join(self.cachedir, key + ".npz")
@@ -0,0 +1,95 @@
+# Functions to save and read measurement data as .zip archives. Unlike
+# .tar.gz files, .zip files have an index of their members and every member is
+# compressed independently, so a single file (e.g. the caldata.npz of one LO
+# setting) can be read without decompressing the rest of the archive.
+# Old .tar.gz archives are converted to .zip the first time they are opened.
+
+# imports
+import os, io, shutil, tarfile, zipfile
+import numpy as np
+
+def compress_data(datadir):
+    """
+    Compress the data from the datadir directory into a .zip file and delete
+    the original directory.
+    :param datadir: directory to compress.
+    """
+    with zipfile.ZipFile(datadir + ".zip", "w", zipfile.ZIP_DEFLATED,
+        allowZip64=True) as zip_file:
+        for root, dirs, files in os.walk(datadir):
+            for datafile in sorted(files):
+                filepath = os.path.join(root, datafile)
+                zip_file.write(filepath, os.path.relpath(filepath, datadir))
+    shutil.rmtree(datadir)
+
+def convert_tar(datatar):
+    """
+    Convert a .tar.gz archive into a .zip archive with the same members. The
+    .tar.gz file is kept.
+    :param datatar: .tar.gz file to convert.
+    :return: name of the .zip file.
+    """
+    datazip = datatar[:-len(".tar.gz")] + ".zip"
+    tmpzip  = datazip + ".tmp"
+    with tarfile.open(datatar) as tar_file:
+        with zipfile.ZipFile(tmpzip, "w", zipfile.ZIP_DEFLATED,
+            allowZip64=True) as zip_file:
+            for member in tar_file:
+                if not member.isfile():
+                    continue
+                name = os.path.normpath(member.name).lstrip("/")
+                zip_file.writestr(name, tar_file.extractfile(member).read())
+    # rename at the end so that an interrupted conversion is not used
+    os.rename(tmpzip, datazip)
+
+    return datazip
+
+class DataArchive(object):
+    """
+    Read only access to a data archive created with compress_data.
+    """
+    def __init__(self, archive):
+        """
+        :param archive: .zip file to open. If a .tar.gz file is given, it is
+            converted to .zip first (only once, the .zip file is reused
+            later).
+        """
+        if archive.endswith(".tar.gz"):
+            datazip = archive[:-len(".tar.gz")] + ".zip"
+            if not os.path.exists(datazip):
+                print("Converting " + archive + " to .zip format...")
+                convert_tar(archive)
+                print("done")
+            archive = datazip
+        self.archive  = archive
+        self.zip_file = zipfile.ZipFile(archive, "r")
+
+    def names(self):
+        """
+        :return: list with the names of the archive members.
+        """
+        return self.zip_file.namelist()
+
+    def read(self, name):
+        """
+        Read a file from the archive.
+        :param name: name of the file within the archive.
+        :return: content of the file as bytes.
+        """
+        return self.zip_file.read(name)
+
+    def load_npz(self, name):
+        """
+        Load a .npz (or .npy) file from the archive. Only that member is read
+        and decompressed.
+        :param name: name of the file within the archive, e.g.
+            'lo1_5ghz_lo2_3ghz/caldata.npz'.
+        :return: loaded data, as with np.load.
+        """
+        return np.load(io.BytesIO(self.zip_file.read(name)))
+
+    def close(self):
+        """
+        Close the archive file.
+        """
+        self.zip_file.close()
@@ -0,0 +1,212 @@
+# Live plotting of measurement data without blocking the measurement. Plot
+# data is sent as frames (the new data of some of the lines of a figure).
+# Frames that can't be rendered on time are merged with the next ones, so
+# only the latest data of every line is rendered and the stale data is
+# dropped. Data can also be appended to the lines, so that a sweep only sends
+# the points of its new tones. LivePlot renders the figure in a separate
+# process, FrameQueue can be used alone to pass frames between threads (e.g.
+# from an acquisition thread to a GUI thread).
+
+# imports
+import time, threading, multiprocessing
+import numpy as np
+try:
+    from queue import Full, Empty # python 3
+except ImportError:
+    from Queue import Full, Empty # python 2
+
+class FrameQueue(object):
+    """
+    Thread safe queue that holds only the latest frame. A frame is a
+    dictionary with the new data of some plot elements (e.g. {line index :
+    (x data, y data)}). When a frame is put before the previous one is
+    taken, both are merged, keeping the newest data of every element, or
+    concatenating the data of the elements that are appended.
+    """
+    def __init__(self):
+        self.frame     = {}
+        self.closed    = False
+        self.condition = threading.Condition()
+
+    def put(self, frame, append=False):
+        """
+        Add a frame to the queue, merging it with the pending frame.
+        :param frame: frame dictionary.
+        :param append: if True, the data of the frame is appended to the
+            current data of the elements instead of replacing it.
+        """
+        with self.condition:
+            for key, data in frame.items():
+                if append and key in self.frame:
+                    pending_data, pending_append = self.frame[key]
+                    data = tuple(np.concatenate((pending, new)) 
+                        for pending, new in zip(pending_data, data))
+                    self.frame[key] = (data, pending_append)
+                else:
+                    self.frame[key] = (data, append)
+            self.condition.notify()
+
+    def get(self, block=False, timeout=None):
+        """
+        Take the pending frame from the queue.
+        :param block: if True, wait until there is a pending frame or the
+            queue is closed.
+        :param timeout: maximum time to wait if block is True (s). None is
+            wait forever.
+        :return: pending frame, with {key : (data, append)} elements. Empty
+            if there is no pending frame, or None if the queue is closed and 
+            empty.
+        """
+        with self.condition:
+            if block and not self.frame and not self.closed:
+                self.condition.wait(timeout)
+            if not self.frame and self.closed:
+                return None
+            frame, self.frame = self.frame, {}
+
+        return frame
+
+    def close(self):
+        """
+        Close the queue. Pending frames can still be taken.
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+
+class LivePlot(object):
+    """
+    Figure rendered in a separate process. The figure is created in the
+    render process with a user function that returns the figure and the
+    list of its lines. Frames are sent to the render process in the
+    background, so update() never waits for the rendering. Frames are
+    dictionaries with {line index : (x data, y data)} elements, and an
+    optional 'title' element for the window title. The data of a frame
+    replaces the data of the lines (update()) or it is appended to it 
+    (append()). The render process is forked from the calling process, so
+    the figure must be created before opening connections (ROACH, 
+    instruments) or starting other threads.
+    """
+    def __init__(self, create_figure, enabled=True, max_fps=10):
+        """
+        :param create_figure: function with no arguments that creates the
+            figure and returns (fig, lines). It is called in the render
+            process, so it must be a module level function.
+        :param enabled: if False, no figure is created and updates are
+            ignored.
+        :param max_fps: maximum number of frames rendered per second.
+        """
+        self.enabled = enabled
+        if not enabled:
+            return
+        self.frames  = FrameQueue()
+        self.queue   = multiprocessing.Queue(maxsize=1)
+        self.process = multiprocessing.Process(target=render_frames,
+            args=(create_figure, self.queue, max_fps))
+        self.process.daemon = True
+        self.process.start()
+        self.sender  = None # started with the first frame
+
+    def update(self, frame):
+        """
+        Send a frame to be rendered. If the render process is busy, the
+        frame is merged with the next ones.
+        :param frame: frame dictionary.
+        """
+        if self.enabled:
+            self.start_sender()
+            self.frames.put(frame)
+
+    def append(self, frame):
+        """
+        Send a frame with data to be appended to the lines. If the render
+        process is busy, the data is concatenated with the next frames.
+        :param frame: frame dictionary.
+        """
+        if self.enabled:
+            self.start_sender()
+            self.frames.put(frame, append=True)
+
+    def set_title(self, title):
+        """
+        Set the window title of the figure.
+        :param title: window title.
+        """
+        self.update({'title' : title})
+
+    def start_sender(self):
+        """
+        Start the sender thread if it is not running. It is started with the
+        first frame, so that no thread is running when the other processes
+        of the script (e.g. ReportPool) are forked.
+        """
+        if self.sender is None:
+            self.sender = threading.Thread(target=self.send_frames)
+            self.sender.daemon = True
+            self.sender.start()
+
+    def send_frames(self):
+        """
+        Send the frames to the render process, one at a time. Runs in the
+        sender thread.
+        """
+        while True:
+            frame = self.frames.get(block=True)
+            if frame is None:
+                break
+            if not frame:
+                continue
+            while self.process.is_alive():
+                try:
+                    self.queue.put(frame, timeout=0.5)
+                    break
+                except Full:
+                    pass
+
+    def close(self):
+        """
+        Render the pending frames and close the figure.
+        """
+        if not self.enabled:
+            return
+        self.frames.close()
+        if self.sender is not None:
+            self.sender.join()
+        if self.process.is_alive():
+            self.queue.put(None)
+        self.process.join()
+
+def render_frames(create_figure, queue, max_fps):
+    """
+    Render loop of the render process. It stops when None is received.
+    :param create_figure: function that creates the figure and returns
+        (fig, lines).
+    :param queue: multiprocessing queue from where to get the frames.
+    :param max_fps: maximum number of frames rendered per second.
+    """
+    fig, lines = create_figure()
+    while True:
+        try:
+            frame = queue.get(timeout=1.0/max_fps)
+        except Empty:
+            # keep the window responsive
+            fig.canvas.flush_events()
+            continue
+        if frame is None:
+            break
+
+        draw_time = time.time()
+        for key, (data, append) in frame.items():
+            if key == 'title':
+                fig.canvas.manager.set_window_title(data)
+            elif append:
+                line = lines[key]
+                line.set_data(np.concatenate((line.get_xdata(), data[0])),
+                              np.concatenate((line.get_ydata(), data[1])))
+            else:
+                lines[key].set_data(*data)
+        fig.canvas.draw()
+        fig.canvas.flush_events()
+
+        # limit frame rate, frames received meanwhile are merged
+        time.sleep(max(0, 1.0/max_fps - (time.time() - draw_time)))
@@ -0,0 +1,118 @@
+# Preallocated store for the raw spectra of a tone sweep. Every quantity
+# (a2, b2, ab_re, etc.) is saved in a single memory mapped .npy file with one
+# row per tone and one column per channel, instead of one .npz file per tone.
+# Rows are filled in place as the sweep advances, and a single tone can be
+# later read without loading the rest of the data. A store can be reopened to
+# continue an interrupted sweep.
+
+# imports
+import os
+import numpy as np
+
+class RawDataStore(object):
+    """
+    Raw spectra of a sweep saved as a set of .npy files in a directory:
+    chnls.npy with the tone channel of every row (-1 for rows not yet
+    written), and a (ntones, nchannels) array for every quantity.
+    """
+    def __init__(self, datadir, ntones, nchannels, data_types, resume=False):
+        """
+        :param datadir: directory where to save the .npy files. It must exist.
+        :param ntones: number of tones (rows) of the store.
+        :param nchannels: number of channels of the spectra.
+        :param data_types: dictionary with the numpy data type of each
+            quantity, e.g. {'a2' : '>u8', 'b2' : '>u8'}.
+        :param resume: if True and the store already exists in datadir, it is
+            reopened and the new rows are written after the existing ones. The
+            existing store must have the same shape.
+        """
+        if resume and os.path.exists(datadir + "/chnls.npy"):
+            self.chnls = np.lib.format.open_memmap(datadir + "/chnls.npy",
+                mode='r+')
+            if self.chnls.shape != (ntones,):
+                raise ValueError("Cannot resume the raw data store in " +
+                    datadir + ", it has " + str(len(self.chnls)) + 
+                    " tones instead of " + str(ntones) + ".")
+            self.data = {}
+            for key in data_types:
+                self.data[key] = np.lib.format.open_memmap(
+                    datadir + "/" + key + ".npy", mode='r+')
+                if self.data[key].shape != (ntones, nchannels):
+                    raise ValueError("Cannot resume the raw data store in " +
+                        datadir + ", " + key + ".npy has shape " + 
+                        str(self.data[key].shape) + " instead of " +
+                        str((ntones, nchannels)) + ".")
+            self.nrows = int(np.sum(self.chnls >= 0))
+            return
+
+        self.chnls = np.lib.format.open_memmap(datadir + "/chnls.npy",
+            mode='w+', dtype=int, shape=(ntones,))
+        self.chnls[:] = -1
+        self.data = {}
+        for key, data_type in data_types.items():
+            self.data[key] = np.lib.format.open_memmap(
+                datadir + "/" + key + ".npy", mode='w+', dtype=data_type,
+                shape=(ntones, nchannels))
+        self.nrows = 0
+
+    def append(self, chnl, **spectra):
+        """
+        Write the spectra of a tone in the next free row. If the tone was
+        already written (e.g. when a resumed sweep repeats the tone that was
+        interrupted), its row is overwritten.
+        :param chnl: channel where the tone is injected.
+        :param spectra: spectrum of every quantity of the store, given as
+            keyword arguments.
+        """
+        rows = np.where(self.chnls[:self.nrows] == chnl)[0]
+        row = rows[0] if len(rows) > 0 else self.nrows
+        if row >= len(self.chnls):
+            raise ValueError("Raw data store full, it has room for " +
+                str(len(self.chnls)) + " tones (channel " + str(chnl) + 
+                " not saved).")
+        for key, spec in spectra.items():
+            self.data[key][row] = spec
+        self.chnls[row] = chnl
+        if row == self.nrows:
+            self.nrows += 1
+
+    def close(self):
+        """
+        Flush the data to disk and close the files.
+        """
+        self.chnls.flush()
+        for array in self.data.values():
+            array.flush()
+        self.chnls = None
+        self.data = {}
+
+def load_rawdata(datadir, chnl=None):
+    """
+    Load the raw spectra of a sweep saved with RawDataStore. Data is memory
+    mapped so only the requested rows are read from disk.
+    :param datadir: directory of the store.
+    :param chnl: tone channel to load. If None, all the written tones are
+        loaded.
+    :return: dictionary with the spectrum of every quantity (1D arrays) when
+        chnl is given, or the array of channels ('chnls' key) and the spectra
+        of every quantity (2D arrays, one row per tone) otherwise.
+    """
+    chnls = np.load(datadir + "/chnls.npy")
+    if chnl is None:
+        rows = chnls >= 0
+    else:
+        rows = np.where(chnls == chnl)[0]
+        if len(rows) == 0:
+            raise ValueError("Channel " + str(chnl) + " not found in " +
+                datadir + ".")
+        rows = rows[0]
+
+    data = {} if chnl is not None else {'chnls' : chnls[rows]}
+    for filename in sorted(os.listdir(datadir)):
+        key, ext = os.path.splitext(filename)
+        if ext != ".npy" or key == "chnls":
+            continue
+        data[key] = np.array(np.load(datadir + "/" + filename,
+            mmap_mode='r')[rows])
+
+    return data
@@ -0,0 +1,665 @@
+# Software emulator of a DSS receiver (front end + ROACH model) and of the
+# signal generators of a DSS measurement, to run the tone sweep scripts
+# without hardware (e.g. to benchmark or regression test the sweep pipeline).
+# A broadband noise source injected into one sideband can also be emulated,
+# for the noise calibration.
+# The analog front end is modeled as in simulation/sw_sim/dss.py: each input
+# sees the injected tone with its own amplitude and phase, and the imbalance
+# between inputs depends on the IF frequency. The emulated ROACH computes the
+# a2, b2, ab and usb/lsb spectra of the tones plus noise, applying the
+# calibration constants written into its brams, so that the SRR of the
+# emulated receiver responds to the loaded constants. Accumulations are
+# emulated in time (optionally scaled), so that new accumulation detection
+# behaves as in the real model.
+
+# imports
+import threading, time
+import numpy as np
+
+class DssEmulator(object):
+    """
+    Emulated DSS receiver and instruments. It is used as a pyvisa resource
+    manager (open_resource(), close()), and its initialize_roach() replaces
+    cd.initialize_roach(). All the ROACH connections and instruments share
+    the emulator state.
+    """
+    def __init__(self, bram_groups, nchannels, bandwidth, adc_bits,
+        pow_data_type, crosspow_data_type, rf_generator_names, lo_freqs,
+        lo_generator_names=[], noise_source_name=None, noise_source_cmds={},
+        consts_nbits=32, consts_binpt=27,
+        cal_acc_len_reg='cal_acc_len', syn_acc_len_reg='syn_acc_len',
+        cnt_rst_reg='cnt_rst', acc_cnt_reg=None, acc_len=2**16,
+        tone_power=-10, noise_power=-70, noise_source_power=-30,
+        amp_imbalance=1.0,
+        phase_imbalance=10.0, imbalance_ripples=1.5, time_scale=1.0,
+        read_delay=0.0, seed=0):
+        """
+        :param bram_groups: dictionary with the bram name lists of the model:
+            'a2', 'b2', 'ab_re', 'ab_im', 'usb', 'lsb', 'consts_usb_re',
+            'consts_usb_im', 'consts_lsb_re' and 'consts_lsb_im'. Models
+            without sideband separation (e.g. the digital balance mixer)
+            only need the first four groups.
+        :param nchannels: number of spectral channels.
+        :param bandwidth: IF bandwidth (MHz).
+        :param adc_bits: ADC resolution (bits), used for the dBFS scale.
+        :param pow_data_type: numpy data type of the power brams.
+        :param crosspow_data_type: numpy data type of the crosspower brams.
+        :param rf_generator_names: resource names of the test tone
+            generators (several generators inject several tones at the same
+            time, as in multi-tone sweeps). A single name can be given as a
+            string.
+        :param lo_freqs: initial frequency of every LO stage (GHz). The first
+            LO decides the sideband of the tone (USB if the tone is above
+            it), and the next stages are removed from the IF frequency.
+        :param lo_generator_names: resource names of the generators of the
+            LO stages, in the same order as lo_freqs. LOs without generator
+            (e.g. fixed LOs) keep their initial frequency.
+        :param noise_source_name: resource name of the noise source. None if
+            there is no noise source.
+        :param noise_source_cmds: commands of the noise source that inject
+            the noise: {'usb' : command, 'lsb' : command, 'off' : command}.
+            The noise is injected into the sideband of the last command
+            received.
+        :param consts_nbits: number of bits of the fixed point constants.
+        :param consts_binpt: binary point of the fixed point constants.
+        :param cal_acc_len_reg: accumulation length register of a2, b2, ab.
+        :param syn_acc_len_reg: accumulation length register of usb, lsb.
+        :param cnt_rst_reg: counter reset register.
+        :param acc_cnt_reg: accumulation counter register. None if the model
+            has no counter.
+        :param acc_len: accumulation length used until the registers are
+            written.
+        :param tone_power: power of the tone in input a (dBFS).
+        :param noise_power: noise power of each input per channel (dBFS).
+        :param noise_source_power: power of the noise source in input a per
+            channel (dBFS).
+        :param amp_imbalance: mean magnitude imbalance between inputs (dB).
+        :param phase_imbalance: mean phase imbalance between inputs from the
+            ideal 90 degrees (degrees).
+        :param imbalance_ripples: number of ripple periods of the imbalance
+            across the IF band.
+        :param time_scale: emulated time per real time of the accumulations
+            (e.g. 0.01 makes accumulations 100 times faster than the real
+            model). 0 makes every read a new accumulation.
+        :param read_delay: time added to every bram read (s), to emulate the
+            katcp latency. 0 to read at full speed.
+        :param seed: random seed of the noise.
+        """
+        self.nchannels  = nchannels
+        self.bandwidth  = bandwidth
+        self.full_scale = 10**((6.02*adc_bits + 1.76 +
+            10*np.log10(nchannels))/10)
+        self.data_types = {'a2' : pow_data_type, 'b2' : pow_data_type,
+            'ab_re' : crosspow_data_type, 'ab_im' : crosspow_data_type,
+            'usb' : pow_data_type, 'lsb' : pow_data_type}
+        self.consts_dtype = '>i' + str(consts_nbits//8)
+        self.consts_binpt = consts_binpt
+        self.rf_generator_names = [rf_generator_names] if \
+            isinstance(rf_generator_names, str) else list(rf_generator_names)
+        self.lo_generator_names = list(lo_generator_names)
+        self.noise_source_name  = noise_source_name
+        self.noise_source_cmds  = dict((normalize_cmd(cmd), sideband)
+            for sideband, cmd in noise_source_cmds.items())
+        self.acc_len_regs = {'cal' : cal_acc_len_reg, 'syn' : syn_acc_len_reg}
+        self.cnt_rst_reg  = cnt_rst_reg
+        self.acc_cnt_reg  = acc_cnt_reg
+        self.tone_power   = tone_power
+        self.noise_power  = noise_power
+        self.noise_source_power = noise_source_power
+        self.amp_imbalance     = amp_imbalance
+        self.phase_imbalance   = phase_imbalance
+        self.imbalance_ripples = imbalance_ripples
+        self.time_scale = time_scale
+        self.read_delay = read_delay
+        self.seed       = seed
+        self.lock       = threading.RLock()
+
+        # map every bram name to its group and interleave index
+        self.bram_groups = bram_groups
+        self.bram_map = {}
+        for group, brams in bram_groups.items():
+            for i, bram in enumerate(brams):
+                self.bram_map[bram] = (group, i)
+
+        # constants brams start with zeros, as in a just programmed FPGA
+        self.memory = {}
+        for group, brams in bram_groups.items():
+            if group.startswith('consts'):
+                nbytes = nchannels // len(brams) * consts_nbits // 8
+                for bram in brams:
+                    self.memory[bram] = bytearray(nbytes)
+        self.consts_version = 0
+        self.consts = None
+
+        self.regs = {cal_acc_len_reg : acc_len, syn_acc_len_reg : acc_len}
+        self.acc_start = time.time()
+        self.acc_count = 0
+        # history of the input state: (change time, rf freqs, lo freqs, noise
+        # sideband), rf freqs are the frequencies of the rf generators with
+        # the output on, and noise sideband is None when no noise is injected
+        self.rf_freqs = {} # {generator name : freq} of the outputs on
+        self.lo_freqs = list(lo_freqs)
+        self.noise_sideband = None
+        self.history = [(0, (), tuple(self.lo_freqs), None)]
+        self.spectra_cache = {}
+        self.generators = {}
+
+        # usage statistics, e.g. for benchmarks
+        self.ntones     = 0 # rf tone changes with the output on
+        self.nreads     = 0 # bram reads
+        self.bytes_read = 0
+
+    def initialize_roach(self, roach_ip=None, boffile=None, upload=False,
+        timeout=10.0):
+        """
+        Open a new connection to the emulated ROACH, with the same arguments
+        as cd.initialize_roach (they are ignored).
+        :return: EmulatedRoach object.
+        """
+        return EmulatedRoach(self)
+
+    def open_resource(self, name):
+        """
+        Open an emulated instrument, as pyvisa ResourceManager.open_resource.
+        :param name: resource name.
+        :return: EmulatedGenerator (or EmulatedNoiseSource) object.
+        """
+        with self.lock:
+            if name not in self.generators:
+                if name == self.noise_source_name:
+                    self.generators[name] = EmulatedNoiseSource(self, name)
+                else:
+                    self.generators[name] = EmulatedGenerator(self, name)
+            return self.generators[name]
+
+    def close(self):
+        """
+        Close the emulated resource manager (nothing to do).
+        """
+        pass
+
+    def stats(self):
+        """
+        :return: dictionary with the usage statistics of the emulator.
+        """
+        with self.lock:
+            return {"tones" : self.ntones, "bram reads" : self.nreads,
+                "bytes read" : self.bytes_read}
+
+    def set_generator(self, name, freq, output):
+        """
+        Update the input state after a change in a generator.
+        :param name: resource name of the generator.
+        :param freq: frequency of the generator (GHz).
+        :param output: True if the generator output is on.
+        """
+        with self.lock:
+            if name in self.rf_generator_names:
+                if output and self.rf_freqs.get(name) != freq:
+                    self.ntones += 1
+                if output:
+                    self.rf_freqs[name] = freq
+                else:
+                    self.rf_freqs.pop(name, None)
+            if name in self.lo_generator_names:
+                self.lo_freqs[self.lo_generator_names.index(name)] = freq
+            self.update_history()
+
+    def set_noise_source(self, command):
+        """
+        Update the input state after a command to the noise source.
+        :param command: command received by the noise source.
+        """
+        with self.lock:
+            sideband = self.noise_source_cmds.get(normalize_cmd(command))
+            if sideband is None:
+                return
+            self.noise_sideband = None if sideband == 'off' else sideband
+            self.update_history()
+
+    def update_history(self):
+        """
+        Add the current input state to the history if it changed.
+        """
+        state = (tuple(sorted(self.rf_freqs.values())), tuple(self.lo_freqs),
+            self.noise_sideband)
+        if state != self.history[-1][1:]:
+            self.history.append((time.time(),) + state)
+            del self.history[:-64]
+
+    def write_reg(self, reg, value):
+        """
+        Write a register. Writing an accumulation length restarts the
+        accumulations, as does releasing the counter reset.
+        :param reg: register name.
+        :param value: register value.
+        """
+        with self.lock:
+            old_value = self.regs.get(reg)
+            self.regs[reg] = value
+            if reg in self.acc_len_regs.values() or \
+               (reg == self.cnt_rst_reg and old_value and not value):
+                self.acc_start = time.time()
+                self.acc_count = 0
+
+    def read_reg(self, reg):
+        """
+        Read a register. The accumulation counter register returns the number
+        of finished accumulations.
+        :param reg: register name.
+        :return: register value.
+        """
+        if reg == self.acc_cnt_reg:
+            return self.last_acc() % 2**32
+        with self.lock:
+            return self.regs.get(reg, 0)
+
+    def acc_period(self):
+        """
+        :return: real time of an accumulation (s). The accumulations of all
+            the outputs share the period of the longest accumulation length.
+        """
+        acc_len = max(self.regs[reg] for reg in self.acc_len_regs.values())
+        return self.time_scale * acc_len * 2*self.nchannels / \
+            (self.bandwidth*1e6)
+
+    def last_acc(self):
+        """
+        :return: index of the last finished accumulation.
+        """
+        with self.lock:
+            period = self.acc_period()
+            if period == 0:
+                self.acc_count += 1
+                return self.acc_count
+            return int((time.time() - self.acc_start) / period)
+
+    def acc_state(self, acc):
+        """
+        Get the input state of an accumulation, that is, the state when the
+        accumulation started (the emulated accumulation doesn't mix states).
+        :param acc: accumulation index.
+        :return: rf frequencies of the tones, lo frequencies and noise
+            sideband (None if there is no noise).
+        """
+        with self.lock:
+            period = self.acc_period()
+            start = self.acc_start + acc*period if period > 0 else time.time()
+            for change_time, rf_freqs, lo_freqs, noise_sideband in \
+                reversed(self.history):
+                if change_time <= start:
+                    break
+            return rf_freqs, lo_freqs, noise_sideband
+
+    def tone_chnl(self, rf_freq, lo_freqs):
+        """
+        Get the IF channel and sideband of a tone.
+        :param rf_freq: tone frequency (GHz).
+        :param lo_freqs: lo frequencies (GHz).
+        :return: channel and sideband ('usb' or 'lsb') of the tone, or
+            (None, None) if the tone is outside the IF band.
+        """
+        if_freq = 1e3 * (abs(rf_freq - lo_freqs[0]) - sum(lo_freqs[1:])) # MHz
+        chnl = int(round(if_freq / self.bandwidth * self.nchannels))
+        if chnl < 0 or chnl >= self.nchannels:
+            return None, None
+        sideband = 'usb' if rf_freq > lo_freqs[0] else 'lsb'
+        return chnl, sideband
+
+    def imbalance(self, chnl, sideband):
+        """
+        Analog model of the inputs for a tone: input b with respect to input
+        a. It is ideally +90 degrees for USB tones and -90 degrees for LSB
+        tones (so the ideal constant is -1j), with a magnitude and phase
+        imbalance that ripples with IF.
+        :param chnl: IF channel of the tone (or array of channels).
+        :param sideband: sideband of the tone.
+        :return: complex ratio b/a.
+        """
+        ripple = 1 + 0.5*np.sin(2*np.pi*self.imbalance_ripples*chnl /
+            self.nchannels)
+        mag   = 10**(self.amp_imbalance*ripple/20)
+        phase = np.deg2rad(90 + self.phase_imbalance*ripple)
+        if sideband == 'usb':
+            return mag * np.exp(1j*phase)
+        return mag * np.exp(-1j*phase)
+
+    def read_consts(self):
+        """
+        Decode the constants written in the constants brams.
+        :return: usb and lsb complex constants arrays.
+        """
+        with self.lock:
+            if self.consts is None:
+                consts = {}
+                for group, brams in self.bram_groups.items():
+                    if group.startswith('consts'):
+                        data = np.zeros(self.nchannels)
+                        for i, bram in enumerate(brams):
+                            data[i::len(brams)] = np.frombuffer(
+                                bytes(self.memory[bram]), self.consts_dtype)
+                        consts[group] = data / 2.0**self.consts_binpt
+                self.consts = (
+                    consts['consts_usb_re'] + 1j*consts['consts_usb_im'],
+                    consts['consts_lsb_re'] + 1j*consts['consts_lsb_im'])
+            return self.consts
+
+    def write_memory(self, bram, data, offset):
+        """
+        Write data into a bram.
+        :param bram: bram name.
+        :param data: data bytes.
+        :param offset: start address (bytes).
+        """
+        with self.lock:
+            memory = self.memory.setdefault(bram, bytearray())
+            if len(memory) < offset + len(data):
+                memory.extend(bytearray(offset + len(data) - len(memory)))
+            memory[offset:offset+len(data)] = data
+            if self.bram_map.get(bram, ('',))[0].startswith('consts'):
+                self.consts = None
+                self.consts_version += 1
+
+    def spectra(self, kind):
+        """
+        Compute the spectra of the last finished accumulation. The spectra
+        are kept until the next accumulation, so all the connections read
+        the same data.
+        :param kind: 'cal' for a2, b2, ab_re and ab_im, 'syn' for usb and
+            lsb.
+        :return: dictionary with the spectra data of the outputs.
+        """
+        acc = self.last_acc()
+        with self.lock:
+            rf_freqs, lo_freqs, noise_sideband = self.acc_state(acc)
+            acc_len = self.regs[self.acc_len_regs[kind]]
+            key = (acc, rf_freqs, lo_freqs, noise_sideband, acc_len,
+                self.consts_version)
+            cached = self.spectra_cache.get(kind)
+            if cached is not None and cached[0] == key:
+                return cached[1]
+            consts_usb, consts_lsb = self.read_consts() if kind == 'syn' \
+                else (None, None)
+
+        # input voltages of the tones
+        a = np.zeros(self.nchannels, dtype=complex)
+        b = np.zeros(self.nchannels, dtype=complex)
+        for rf_freq in rf_freqs:
+            chnl, sideband = self.tone_chnl(rf_freq, lo_freqs)
+            if chnl is not None:
+                a_tone = np.sqrt(self.full_scale * 10**(self.tone_power/10))
+                a[chnl] += a_tone
+                b[chnl] += a_tone * self.imbalance(chnl, sideband)
+        noise = self.full_scale * 10**(self.noise_power/10)
+
+        # noise source powers (a2, b2) and crosspower (ab) of every channel,
+        # the noise source is correlated between inputs as the tones
+        src_a2 = np.zeros(self.nchannels)
+        src_ab = np.zeros(self.nchannels, dtype=complex)
+        if noise_sideband is not None:
+            src_a2[:] = self.full_scale * 10**(self.noise_source_power/10)
+            src_ab = src_a2 * np.conj(self.imbalance(
+                np.arange(self.nchannels), noise_sideband))
+        src_b2 = np.abs(src_ab)**2 / np.maximum(src_a2, 1e-300)
+
+        # accumulated data, the noise of the accumulation is approximated as
+        # gaussian (acc_len >> 1)
+        rand = np.random.RandomState((self.seed + acc) % 2**32)
+        def acc_power(x, noise):
+            std = np.sqrt(noise * (noise + 2*np.abs(x)**2) / acc_len)
+            power = np.abs(x)**2 + noise + std*rand.randn(self.nchannels)
+            return acc_len * np.clip(power, 0, None)
+
+        if kind == 'cal':
+            noise_a = noise + src_a2; noise_b = noise + src_b2
+            ab_std = np.sqrt((noise_a*noise_b + noise_a*np.abs(b)**2 +
+                noise_b*np.abs(a)**2) / (2*acc_len))
+            ab = a*np.conj(b) + src_ab + ab_std*(rand.randn(self.nchannels) +
+                1j*rand.randn(self.nchannels))
+            spectra = {'a2' : acc_power(a, noise_a),
+                'b2' : acc_power(b, noise_b),
+                'ab_re' : acc_len*ab.real, 'ab_im' : acc_len*ab.imag}
+        else:
+            usb = a + consts_usb*b
+            lsb = b + consts_lsb*a
+            # output power of the noise source, |a + c*b|^2 averaged
+            src_usb = src_a2 + np.abs(consts_usb)**2*src_b2 + \
+                2*np.real(np.conj(consts_usb)*src_ab)
+            src_lsb = src_b2 + np.abs(consts_lsb)**2*src_a2 + \
+                2*np.real(consts_lsb*src_ab)
+            spectra = {
+                'usb' : acc_power(usb, noise*(1 + np.abs(consts_usb)**2) +
+                    src_usb),
+                'lsb' : acc_power(lsb, noise*(1 + np.abs(consts_lsb)**2) +
+                    src_lsb)}
+        for output, data in spectra.items():
+            spectra[output] = np.round(data).astype(self.data_types[output])
+
+        with self.lock:
+            self.spectra_cache[kind] = (key, spectra)
+        return spectra
+
+    def read_memory(self, bram, nbytes, offset):
+        """
+        Read data from a bram. Output brams return the data of the last
+        finished accumulation.
+        :param bram: bram name.
+        :param nbytes: number of bytes to read.
+        :param offset: start address (bytes).
+        :return: data bytes.
+        """
+        if self.read_delay > 0:
+            time.sleep(self.read_delay)
+        with self.lock:
+            self.nreads     += 1
+            self.bytes_read += nbytes
+        group, i = self.bram_map.get(bram, (None, None))
+        if group in ['a2', 'b2', 'ab_re', 'ab_im', 'usb', 'lsb']:
+            kind = 'syn' if group in ['usb', 'lsb'] else 'cal'
+            data = self.spectra(kind)[group]
+            data = data[i::len(self.bram_groups[group])].tobytes()
+        else:
+            with self.lock:
+                if bram not in self.memory:
+                    raise RuntimeError("Emulated ROACH has no bram " + bram +
+                        ".")
+                data = bytes(self.memory[bram])
+
+        return data[offset:offset+nbytes]
+
+class EmulatedRoach(object):
+    """
+    Connection to the emulated ROACH, with the FpgaClient methods used by the
+    DSS scripts.
+    """
+    def __init__(self, emulator):
+        """
+        :param emulator: DssEmulator object.
+        """
+        self.emulator = emulator
+
+    def read(self, device_name, size, offset=0):
+        return self.emulator.read_memory(device_name, size, offset)
+
+    def write(self, device_name, data, offset=0):
+        self.emulator.write_memory(device_name, data, offset)
+
+    def read_int(self, device_name):
+        return self.emulator.read_reg(device_name)
+
+    def read_uint(self, device_name):
+        return self.emulator.read_reg(device_name)
+
+    def write_int(self, device_name, integer, blindwrite=False, offset=0):
+        self.emulator.write_reg(device_name, integer)
+
+    def stop(self):
+        pass
+
+class EmulatedGenerator(object):
+    """
+    Emulated SCPI signal generator, with the commands used by the DSS
+    scripts: frequency, power, output, multiplier, list sweeps with bus
+    triggers, *opc? and the error queue. Commands can be chained with ";".
+    Unknown commands are added to the error queue, as a real instrument.
+    As in a real instrument, *opc? during a list sweep waits for the end of
+    the sweep, which never comes without triggers: it times out.
+    """
+    def __init__(self, emulator, name):
+        """
+        :param emulator: DssEmulator object.
+        :param name: resource name of the generator.
+        """
+        self.emulator = emulator
+        self.name     = name
+        self.timeout  = 2000
+        self.freq     = 0.0 # GHz
+        self.power    = 0.0
+        self.mult     = 1
+        self.output   = False
+        self.mode     = 'cw'
+        self.list_freqs = []
+        self.list_index = 0
+        self.sweeping = False # list sweep initiated and not finished
+        self.errors   = []
+
+    def write(self, message):
+        self.execute(message)
+
+    def query(self, message):
+        return self.execute(message)
+
+    ask = query
+
+    def close(self):
+        pass
+
+    def execute(self, message):
+        """
+        Execute a chain of commands.
+        :param message: commands separated by ";".
+        :return: response of the last query of the chain ("" if none).
+        """
+        response = ""
+        for command in message.split(";"):
+            command = command.strip().lower()
+            if command:
+                response = self.execute_command(command)
+        self.emulator.set_generator(self.name, self.current_freq(),
+            self.output)
+
+        return response
+
+    def execute_command(self, command):
+        """
+        Execute a single command.
+        :param command: command in lower case.
+        :return: response of queries, "" for settings.
+        """
+        words = command.split()
+        header = words[0]; args = words[1:]
+        try:
+            if header == "*opc?":
+                if self.sweeping:
+                    raise IOError("Timeout expired before operation " +
+                        "completed (*opc? during a list sweep).")
+                return "1"
+            elif header == "*idn?":
+                return "Emulated generator," + self.name
+            elif header == "syst:err?":
+                return self.errors.pop(0) if self.errors else '+0,"No error"'
+            elif header == "*cls":
+                self.errors = []
+            elif header in ["freq", "freq:cw"]:
+                self.freq = parse_freq(args)
+            elif header in ["freq?", "freq:cw?"]:
+                return repr(self.current_freq()*1e9)
+            elif header in ["power", "pow", "list:pow"]:
+                self.power = float(args[0])
+            elif header in ["power?", "pow?"]:
+                return repr(self.power)
+            elif header in ["outp", "output"]:
+                self.output = args[0] in ["on", "1"]
+            elif header in ["outp?", "output?"]:
+                return "1" if self.output else "0"
+            elif header == "freq:mult":
+                self.mult = int(args[0])
+            elif header == "freq:mode":
+                if args[0] not in ["cw", "list"]:
+                    raise ValueError(args[0])
+                self.mode = args[0]
+                self.sweeping = False
+            elif header == "list:freq":
+                self.list_freqs = [float(freq)/1e9 for freq in
+                    "".join(args).split(",")]
+            elif header == "init":
+                self.list_index = 0
+                self.sweeping = self.mode == 'list' and \
+                    len(self.list_freqs) > 1
+            elif header == "*trg":
+                if self.mode == 'list' and self.list_freqs:
+                    self.list_index = min(self.list_index + 1,
+                        len(self.list_freqs) - 1)
+                    self.sweeping = self.sweeping and \
+                        self.list_index < len(self.list_freqs) - 1
+            elif header not in ["list:type", "list:trig:sour", "trig:sour"]:
+                raise ValueError(header)
+        except (ValueError, IndexError):
+            self.errors.append('-113,"Undefined header"')
+        return ""
+
+    def current_freq(self):
+        """
+        :return: output frequency of the generator (GHz).
+        """
+        if self.mode == 'list' and self.list_freqs:
+            return self.list_freqs[self.list_index]
+        return self.freq
+
+class EmulatedNoiseSource(object):
+    """
+    Emulated noise source. The commands that inject the noise into each
+    sideband (e.g. the commands of a switch or a filter bank) are given to
+    the emulator, other commands are accepted and ignored.
+    """
+    def __init__(self, emulator, name):
+        """
+        :param emulator: DssEmulator object.
+        :param name: resource name of the noise source.
+        """
+        self.emulator = emulator
+        self.name     = name
+        self.timeout  = 2000
+
+    def write(self, message):
+        self.emulator.set_noise_source(message)
+
+    def query(self, message):
+        self.emulator.set_noise_source(message)
+        return "1" if "?" in message else ""
+
+    ask = query
+
+    def close(self):
+        pass
+
+def normalize_cmd(command):
+    """
+    Normalize a command for comparison (lower case, single spaces).
+    :param command: command string.
+    :return: normalized command.
+    """
+    return " ".join(command.lower().split())
+
+def parse_freq(args):
+    """
+    Parse the argument of a frequency command (e.g. ["405", "ghz"]).
+    :param args: frequency value and optional units (Hz by default).
+    :return: frequency (GHz).
+    """
+    units = {'hz' : 1e-9, 'khz' : 1e-6, 'mhz' : 1e-3, 'ghz' : 1.0}
+    value = "".join(args)
+    for unit in sorted(units, key=len, reverse=True):
+        if value.endswith(unit):
+            return float(value[:-len(unit)]) * units[unit]
+    return float(value) * units['hz']
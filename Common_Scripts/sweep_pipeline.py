@@ -0,0 +1,105 @@
+# Pipeline to run the non critical work of a tone sweep step (ratio
+# computation, plotting and disk writes) while the next tone is being tuned
+# and settled, so that the critical path of the sweep is only retune, settle
+# and read.
+
+# imports
+import time
+from multiprocessing.pool import ThreadPool
+
+class SweepPipeline(object):
+    """
+    Work of a sweep step that does not need to be finished before the next
+    retune. Thread safe work (disk writes) is run by background worker
+    threads with submit(). Work that must run in the main thread (plotting
+    and ratio computation for the plots) is queued with defer() and run in
+    the settle time of the next tone with settle().
+    """
+    def __init__(self, nworkers=1):
+        """
+        :param nworkers: number of background worker threads. With one
+            worker the submitted work is executed in order.
+        """
+        self.workers  = ThreadPool(nworkers)
+        self.results  = []
+        self.deferred = []
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Run a function in a background worker.
+        :param func: function to run.
+        :return: AsyncResult of the function.
+        """
+        self.check_errors()
+        result = self.workers.apply_async(func, args, kwargs)
+        self.results.append(result)
+        return result
+
+    def defer(self, func, *args, **kwargs):
+        """
+        Queue a function to be run in the main thread in the next settle time.
+        :param func: function to run.
+        """
+        self.deferred.append((func, args, kwargs))
+
+    def settle(self, settle_time, ready=None, poll_time=0.01):
+        """
+        Wait for the current tone to settle, running the deferred work while
+        waiting. If the deferred work takes longer than the settle time no
+        extra wait is made.
+        :param settle_time: time to wait since the call of the function (s).
+            If ready is given it is the maximum time to wait.
+        :param ready: function that returns True when the data is settled
+            (e.g. AccPoller.ready). It is polled after the deferred work is
+            done. If None, the full settle time is waited.
+        :param poll_time: time between calls of ready (s).
+        """
+        start_time = time.time()
+        self.run_deferred()
+        self.check_errors()
+        if ready is None:
+            time.sleep(max(0, settle_time - (time.time() - start_time)))
+            return
+        while time.time() - start_time < settle_time:
+            if ready():
+                return
+            time.sleep(poll_time)
+
+    def run_deferred(self):
+        """
+        Run all the deferred work in the main thread.
+        """
+        deferred, self.deferred = self.deferred, []
+        for func, args, kwargs in deferred:
+            func(*args, **kwargs)
+
+    def check_errors(self):
+        """
+        Raise the exception of any failed background work and forget the
+        finished work.
+        """
+        pending = []
+        for result in self.results:
+            if result.ready():
+                result.get()
+            else:
+                pending.append(result)
+        self.results = pending
+
+    def join(self):
+        """
+        Run the remaining deferred work and wait for all the background work
+        to finish.
+        """
+        self.run_deferred()
+        for result in self.results:
+            result.get()
+        self.results = []
+
+    def close(self):
+        """
+        Finish all the pending work and stop the worker threads.
+        """
+        self.join()
+        self.workers.close()
+        self.workers.join()
@@ -0,0 +1,122 @@
+# Tone sweeps of the RF generator. In list mode the frequencies of a sweep are
+# uploaded once to the list sweep memory of the generator, and every tone is
+# set with a bus trigger (*TRG), so a tone change costs a short write instead
+# of a full "freq X ghz; *opc?" round trip. The generator changes the tone in
+# much less than an accumulation, and the sweeps wait for new accumulations
+# (or pause_time) after each tone anyway. If the generator doesn't support
+# list sweeps, the tones are set one by one (step mode).
+
+class ToneSweeper(object):
+    """
+    Set the tones of a sweep in the RF generator, in list or step mode.
+    Usage: start() with the sweep frequencies, next() to set each tone, and
+    stop() at the end of the sweep.
+    """
+    def __init__(self, generator, power, list_mode=True, list_size=1601):
+        """
+        :param generator: pyvisa resource or calandigital instrument of the
+            RF generator.
+        :param power: power of the tones (dBm), used in list mode.
+        :param list_mode: if True, use the list sweep mode of the generator.
+            Step mode is used if the list upload fails.
+        :param list_size: maximum number of points of the generator list.
+            Longer sweeps are uploaded in chunks.
+        """
+        self.generator = generator
+        # pyvisa resources query with query(), calandigital instruments with
+        # ask()
+        self.query     = generator.query if hasattr(generator, "query") \
+            else generator.ask
+        self.power     = power
+        self.list_mode = list_mode
+        self.list_size = list_size
+        self.freqs     = []
+        self.index     = 0
+        self.first_set = False
+
+    def start(self, freqs, first_set=False):
+        """
+        Start a tone sweep. The generator is not changed until the first
+        next().
+        :param freqs: frequencies of the tones in sweep order (GHz).
+        :param first_set: if True, the first tone is already set in the
+            generator (e.g. together with the LO retune), and in step mode
+            the first next() doesn't set it again.
+        """
+        self.freqs     = list(freqs)
+        self.index     = 0
+        self.first_set = first_set
+
+    def next(self):
+        """
+        Set the next tone of the sweep.
+        :return: frequency of the tone (GHz).
+        """
+        freq = self.freqs[self.index]
+        if self.list_mode and self.index % self.list_size == 0:
+            # upload the list chunk, its first tone is set when the list
+            # sweep starts
+            chunk = self.freqs[self.index:self.index+self.list_size]
+            if not self.upload_list(chunk):
+                print("RF generator list sweep failed, using step mode")
+                self.list_mode = False
+                self.generator.write("freq:mode cw")
+        if not self.list_mode:
+            if self.index > 0 or not self.first_set:
+                self.query("freq " + str(freq) + " ghz; *opc?")
+        elif self.index % self.list_size != 0:
+            self.generator.write("*trg")
+        self.index += 1
+
+        return freq
+
+    def upload_list(self, freqs):
+        """
+        Upload a list of frequencies to the generator and start the list
+        sweep, with the first frequency set and one tone per bus trigger.
+        :param freqs: list of frequencies (GHz).
+        :return: True if the generator accepted the list.
+        """
+        freqs_hz = ",".join("%.3f" % (freq*1e9) for freq in freqs)
+        try:
+            self.generator.write("*cls")
+            self.generator.write("freq:mode cw")
+            self.generator.write("list:type list")
+            self.generator.write("list:freq " + freqs_hz)
+            self.generator.write("list:pow " + str(self.power))
+            self.generator.write("list:trig:sour bus")
+            self.generator.write("trig:sour imm")
+            self.generator.write("freq:mode list")
+            # check the list before starting the sweep. *opc? is not used
+            # after init, as it waits for the end of the sweep (all the
+            # triggers)
+            self.query("*opc?")
+            if not self.check_errors():
+                return False
+            self.generator.write("init")
+            return self.check_errors()
+        except Exception as e:
+            print("RF generator list upload error: " + repr(e))
+            return False
+
+    def check_errors(self):
+        """
+        Check the error queue of the generator.
+        :return: True if there are no errors (the generator returns
+            +0,"No error").
+        """
+        error = self.query("syst:err?")
+        if int(error.split(",")[0]) != 0:
+            print("RF generator list sweep error: " + error.strip())
+            return False
+        return True
+
+    def stop(self):
+        """
+        Stop the tone sweep, returning the generator to CW mode (the tone
+        stays at the last frequency of the sweep).
+        """
+        if self.list_mode and self.index > 0:
+            self.generator.write("freq:mode cw")
+            self.query("freq " + str(self.freqs[self.index-1]) +
+                " ghz; *opc?")
@@ -0,0 +1,110 @@
+# Interpolation of the calibration constants across the LO grid, so that only
+# a sparse subset of the LO settings needs to be calibrated. The constants of
+# every IF channel are interpolated linearly in (lo1, lo2), as log magnitude
+# and phase. The phase of each calibrated LO setting is unwrapped relative to
+# the phase of the nearest calibrated setting, so that the interpolation
+# doesn't jump 360 degrees between settings. Outside the calibrated LO range
+# the constants of the nearest calibrated setting are used.
+
+# imports
+import re
+import numpy as np
+from scipy.interpolate import LinearNDInterpolator, NearestNDInterpolator
+
+def parse_measname(measname):
+    """
+    Get the LO frequencies of a LO setting from its measurement name.
+    :param measname: measurement name, e.g. 'lo1_405ghz_lo2_4ghz'.
+    :return: lo1 and lo2 frequencies (GHz), or None if the name is not of a
+        LO setting.
+    """
+    match = re.match(r"lo1_(.*)ghz_lo2_(.*)ghz$", measname)
+    if match is None:
+        return None
+    return float(match.group(1)), float(match.group(2))
+
+def get_calibrated_los(calarch):
+    """
+    Get the LO settings of a calibration archive.
+    :param calarch: calibration DataArchive.
+    :return: dictionary with the measurement name of every calibrated LO
+        setting: {(lo1 freq, lo2 freq) : measname}.
+    """
+    calibrated_los = {}
+    for name in calarch.names():
+        match = re.match(r"(.*)/caldata\.npz$", name)
+        if match is not None and parse_measname(match.group(1)) is not None:
+            calibrated_los[parse_measname(match.group(1))] = match.group(1)
+
+    return calibrated_los
+
+def interp_lo_consts(lo_freqs, calibrated_consts):
+    """
+    Interpolate the constants of a LO setting from the constants of the
+    calibrated LO settings.
+    :param lo_freqs: lo1 and lo2 frequencies of the setting (GHz).
+    :param calibrated_consts: dictionary with the constants of every
+        calibrated LO setting: {(lo1 freq, lo2 freq) : consts}, where consts
+        is a complex array with the constant of every channel.
+    :return: interpolated constants.
+    """
+    points = sorted(calibrated_consts)
+    consts = np.array([calibrated_consts[point] for point in points])
+    if len(points) == 1:
+        return consts[0]
+
+    # unwrap the phases relative to the nearest calibrated setting
+    distances = [np.hypot(point[0] - lo_freqs[0], point[1] - lo_freqs[1])
+        for point in points]
+    ref_phase = np.angle(consts[np.argmin(distances)])
+    phases = ref_phase + np.angle(consts * np.exp(-1j*ref_phase))
+    log_mags = np.log(np.maximum(np.abs(consts), 1e-300))
+    values = np.hstack([log_mags, phases])
+
+    log_mag, phase = np.split(interp_lo_values(lo_freqs, points, values), 2)
+
+    return np.exp(log_mag + 1j*phase)
+
+def interp_lo_values(lo_freqs, points, values):
+    """
+    Linear interpolation of real values (one row per calibrated LO setting)
+    in the (lo1, lo2) plane. If the settings are in a line (e.g. all with the
+    same lo1, or a partial calibration), the interpolation is made along the
+    line, at the projection of the LO frequencies on it.
+    :param lo_freqs: lo1 and lo2 frequencies where to interpolate (GHz).
+    :param points: (lo1, lo2) frequencies of the calibrated settings.
+    :param values: values of the calibrated settings, one row per setting.
+    :return: interpolated row.
+    """
+    points = np.array(points, dtype=float)
+    offsets = points - points[0]
+    if np.linalg.matrix_rank(offsets, tol=1e-9*max(np.max(np.abs(offsets)), 
+        1)) < 2:
+        # settings in a line, interpolate along it
+        direction = offsets[np.argmax(np.hypot(offsets[:, 0], 
+            offsets[:, 1]))]
+        if not np.any(direction):
+            return values[0]
+        direction = direction / np.hypot(direction[0], direction[1])
+        line_pos = offsets.dot(direction)
+        order = np.argsort(line_pos)
+        line_pos = line_pos[order]
+        lo_pos = np.clip((np.array(lo_freqs, dtype=float) - 
+            points[0]).dot(direction), line_pos[0], line_pos[-1])
+        i = min(np.searchsorted(line_pos, lo_pos, side='right'),
+            len(line_pos) - 1)
+        weight = (lo_pos - line_pos[i-1]) / (line_pos[i] - line_pos[i-1])
+        return (1-weight)*values[order[i-1]] + weight*values[order[i]]
+
+    try:
+        interp_values = LinearNDInterpolator(points, values)(lo_freqs[0],
+            lo_freqs[1])
+    except RuntimeError:
+        # degenerate triangulation (QhullError), e.g. repeated settings
+        interp_values = np.full(values.shape[1], np.nan)
+    if np.any(np.isnan(interp_values)):
+        # outside the calibrated LO range
+        interp_values = NearestNDInterpolator(points, values)(lo_freqs[0],
+            lo_freqs[1])
+
+    return interp_values
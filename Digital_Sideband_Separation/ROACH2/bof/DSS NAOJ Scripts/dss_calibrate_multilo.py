@@ -3,21 +3,58 @@
 # multiple LO values and multiple LO stages.
 
 # imports
-import os, time, tarfile, shutil, json
+import os, sys, time, json, argparse
 import numpy as np
 import matplotlib.pyplot as plt
 import calandigital as cd
+# shared modules (bram_io, live_plot, etc.)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    "..", "..", "..", "..", "Common_Scripts"))
+from bram_io import RoachPool, AccPoller
+from sweep_pipeline import SweepPipeline
+from live_plot import LivePlot
+from report_pool import ReportPool
+from rawdata_store import RawDataStore
+from cal_interp import interp_caldata, estimate_interp_error, error2srr, \
+    save_interp_srr
+from sweep_journal import SweepJournal, find_last_datadir, \
+    check_resume_testinfo
+from instrument_group import InstrumentGroup
+from lo_scheduler import make_schedule, save_schedule, sweep_name, tone_order
+from tone_sweeper import ToneSweeper
+from phase_timer import PhaseTimer
+from data_archive import compress_data
 from dss_multilo_parameters import *
 
 def main():
     start_time = time.time()
 
+    parse_args()
     make_pre_measurements_actions()
     make_dss_multilo_measurements()
     make_post_measurements_actions()
 
     print("Finished. Total time: " + str(int(time.time() - start_time)) + "[s]")
 
+def parse_args():
+    """
+    Parse the command line arguments. With --resume an interrupted calibration
+    is continued in its data directory, skipping the LO settings and tones
+    already measured.
+    """
+    global cal_datadir, resume
+    parser = argparse.ArgumentParser(description=
+        "Tone calibration of a DSS receiver with multiple LOs.")
+    parser.add_argument("--resume", nargs="?", const="", metavar="DATADIR",
+        help="resume an interrupted calibration saved in DATADIR (default: "
+        "the last uncompressed calibration directory)")
+    args = parser.parse_args()
+
+    resume = args.resume is not None
+    if resume:
+        cal_datadir = args.resume or find_last_datadir("dss_cal ")
+        print("Resuming " + cal_datadir + "...")
+
 def make_pre_measurements_actions():
     """
     Makes all the actions in preparation for the measurements:
@@ -26,17 +63,31 @@ def make_pre_measurements_actions():
     - setting initial registers in FPGA
     - turning on generator power
     """
-    global roach, rf_generator, lo1_generator, lo2_generator, fig, lines
+    global roach, roach_pool, rf_generator, lo1_generator, lo2_generator, live_plot
+    global report_pool, journal, instruments, tone_sweeper, phase_timer
 
-    roach = cd.initialize_roach(roach_ip)
+    # start the plot and report processes before opening connections or
+    # starting threads
+    live_plot = LivePlot(create_figure, show_plots)
+    report_pool = ReportPool(report_nprocs if print_reports else 0)
+
+    roach = initialize_roach(roach_ip)
+    roach_pool = RoachPool(roach, roach_ip, nconnections,
+        initialize_roach=initialize_roach)
     lo1_generator = rm.open_resource(lo1_generator_name)
     lo2_generator = rm.open_resource(lo2_generator_name)
     rf_generator  = rm.open_resource(rf_generator_name)
+    instruments   = InstrumentGroup({'lo1' : lo1_generator, 
+        'lo2' : lo2_generator, 'rf' : rf_generator}, instr_timeouts)
+    tone_sweeper  = ToneSweeper(rf_generator, rf_power, rf_list_sweep, 
+        rf_list_size)
 
     print("Setting up plotting and data saving elements...")
-    if show_plots:
-        fig, lines = create_figure()
     make_data_directory()
+    journal = SweepJournal(cal_datadir + "/journal.jsonl")
+    phase_timer = PhaseTimer(cal_datadir + "/phase_trace.csv" if phase_trace 
+        else None)
+    roach_pool.timer = phase_timer
     print("done")
 
     print("Setting accumulation register to " + str(acc_len) + "...")
@@ -48,49 +99,88 @@ def make_pre_measurements_actions():
     print("done")
     
     print("Setting instruments power and outputs...")
-    lo1_generator.write("power " + str(lo1_power))
-    lo1_generator.write("freq:mult " + str(lo1_mult))
-    lo2_generator.write("power " + str(lo2_power))
-    rf_generator.write("power " + str(rf_power))
-    rf_generator.write("freq:mult " + str(rf_mult))
-    lo1_generator.write("outp on")
-    lo2_generator.write("outp on")
-    rf_generator.write("outp on")
+    instruments.write({
+        'lo1' : ["power " + str(lo1_power), "freq:mult " + str(lo1_mult),
+                 "outp on"],
+        'lo2' : ["power " + str(lo2_power), "outp on"],
+        'rf'  : ["power " + str(rf_power), "freq:mult " + str(rf_mult), 
+                 "outp on"]})
     print("done")
 
 def make_dss_multilo_measurements():
     """
     Makes the measurements for dss calibration with multiple LOs.
-    :param datair: directory where to save the data.
     """
-    for lo1_freq in lo1_freqs:
-        # set lo1 frequency
-        lo1_generator.ask("freq " + str(lo1_freq) + " ghz; *opc?")
+    multilo_caldata = []
+    schedule = []
+    lo_schedule, sweeps_schedule, lo_time = make_schedule(cal_lo1_freqs, 
+        cal_lo2_freqs, if_test_freqs/1e3, lo1_cost, lo2_cost, 
+        schedule_retunes)
+    print("Estimated LO retune time: " + str(int(lo_time)) + "[s]")
+    lo1_current = None; lo2_current = None
+    for (lo1_freq, lo2_freq), sweeps in zip(lo_schedule, sweeps_schedule):
+        # print setting
+        print("Current LOs: LO1:" + str(lo1_freq) + "GHz," +
+                          " LO2:" + str(lo2_freq) + "GHz")
+        step = {"lo1 ghz" : float(lo1_freq), "lo2 ghz" : float(lo2_freq)}
         
-        for lo2_freq in lo2_freqs:
-            # set lo2 frequency
-            lo2_generator.ask("freq " + str(lo2_freq) + "ghz; *opc?")
-
-            # print setting
-            print("Current LOs: LO1:" + str(lo1_freq) + "GHz," +
-                              " LO2:" + str(lo2_freq) + "GHz")
-            
-            # make measurement subdirectory
-            measname = "lo1_" + str(lo1_freq) + "ghz_lo2_" + \
-                                str(lo2_freq) + "ghz"
-            measdir = cal_datadir + "/" + measname
-            os.mkdir(measdir)
-            os.mkdir(measdir + "/rawdata_tone_usb")
-            os.mkdir(measdir + "/rawdata_tone_lsb")
-            
-            # compute rf frequencies
-            rf_freqs_usb = lo1_freq + lo2_freq + (if_freqs/1e3) # GHz
-            rf_freqs_lsb = lo1_freq - lo2_freq - (if_freqs/1e3) # GHz
-
-            # make measurement
-            make_dss_measurements(measdir, rf_freqs_usb, rf_freqs_lsb)
-
-    print_multilo_data()
+        # make measurement subdirectory
+        measname = "lo1_" + str(lo1_freq) + "ghz_lo2_" + \
+                            str(lo2_freq) + "ghz"
+        measdir = cal_datadir + "/" + measname
+        if journal.is_done(measname):
+            print("Already measured, skipping")
+            caldata = dict(np.load(measdir + "/caldata.npz"))
+            multilo_caldata.append((lo1_freq, lo2_freq, caldata))
+            if print_reports:
+                report_pool.submit(print_singlelo_data, measdir, caldata)
+            step["measured before resume"] = True
+            schedule.append(step)
+            continue
+        for subdir in ["", "/rawdata_tone_usb", "/rawdata_tone_lsb"]:
+            if not os.path.exists(measdir + subdir):
+                os.mkdir(measdir + subdir)
+        phase_timer.set_group(measname)
+
+        # compute rf frequencies
+        rf_freqs_usb = lo1_freq + lo2_freq + (if_freqs/1e3) # GHz
+        rf_freqs_lsb = lo1_freq - lo2_freq - (if_freqs/1e3) # GHz
+
+        # set in parallel the lo frequencies that change and the first tone
+        # to measure (tones measured before a resume are skipped)
+        tone_sideband, ascending = sweeps[0]
+        rf_freqs = rf_freqs_usb if tone_sideband=='usb' else rf_freqs_lsb
+        sweep_order = tone_order(len(test_channels), ascending, 
+            journal.get_tones(measname, tone_sideband))
+        commands = {}
+        if len(sweep_order) > 0:
+            chnl = test_channels[sweep_order[0]]
+            commands['rf'] = "freq " + str(rf_freqs[chnl]) + " ghz"
+        if lo1_freq != lo1_current:
+            commands['lo1'] = "freq " + str(lo1_freq) + " ghz"
+        if lo2_freq != lo2_current:
+            commands['lo2'] = "freq " + str(lo2_freq) + " ghz"
+        retune_time = time.time()
+        with phase_timer.time("lo retune"):
+            instruments.set_and_wait(commands)
+        lo1_current = lo1_freq; lo2_current = lo2_freq
+        step["lo retune time s"] = time.time() - retune_time
+        step["sweeps"] = [sweep_name(sweep) for sweep in sweeps]
+
+        # make measurement
+        caldata = make_dss_measurements(measdir, rf_freqs_usb, rf_freqs_lsb, 
+            sweeps, 'rf' in commands)
+        multilo_caldata.append((lo1_freq, lo2_freq, caldata))
+        journal.add_done(measname)
+
+        # record the achieved schedule
+        schedule.append(step)
+        save_schedule(cal_datadir + "/testinfo.json", schedule, lo_time)
+        phase_timer.save(cal_datadir + "/testinfo.json")
+
+    if print_reports:
+        multilo_caldata.sort(key=lambda lo_data: (lo_data[0], lo_data[1]))
+        report_pool.submit(print_multilo_data, cal_datadir, multilo_caldata)
 
 def make_post_measurements_actions():
     """
@@ -102,10 +192,18 @@ def make_post_measurements_actions():
     print("Turning off instruments...")
     #lo1_generator.write("freq:mult 1")
     #rf_generator.write("freq:mult 1")
-    lo1_generator.write("outp off")
-    lo2_generator.write("outp off")
-    rf_generator.write("outp off")
+    instruments.write({'lo1' : "outp off", 'lo2' : "outp off", 
+        'rf' : "outp off"})
+    instruments.close()
     rm.close()
+    roach_pool.close()
+    live_plot.close()
+    print("done")
+
+    print("Waiting for reports...")
+    report_pool.close()
+    journal.close()
+    phase_timer.close()
     print("done")
 
     print("Compressing data...")
@@ -114,7 +212,7 @@ def make_post_measurements_actions():
 
     # Write file to save last calibration directory
     f = open("last_caltar.txt", "w")
-    f.write(cal_datadir+".tar.gz")
+    f.write(cal_datadir+".zip")
     f.close()
 
 def create_figure():
@@ -161,8 +259,6 @@ def make_data_directory():
     """
     Make directory where to save all the calibration data.
     """
-    os.mkdir(cal_datadir)
-
     # make .json file with test info
     testinfo = {}
     testinfo["roach ip"]           = roach_ip
@@ -172,125 +268,251 @@ def make_data_directory():
     testinfo["nchannels"]          = nchannels
     testinfo["acc len"]            = acc_len
     testinfo["chnl step"]          = chnl_step
+    testinfo["rawdata step"]       = rawdata_step
+    testinfo["wait accs"]          = wait_accs
+    testinfo["interp method"]      = interp_method
+    testinfo["interp degree"]      = interp_degree
+    testinfo["consts nbits"]       = consts_nbits
+    testinfo["consts binpt"]       = consts_binpt
+    testinfo["rf list sweep"]      = rf_list_sweep
+    testinfo["schedule retunes"]   = schedule_retunes
     testinfo["lo1 generator name"] = lo1_generator_name
     testinfo["lo2 generator name"] = lo2_generator_name
     testinfo["lo1 freqs ghz"]      = str(lo1_freqs)
     testinfo["lo2 freqs ghz"]      = str(lo2_freqs)
+    testinfo["cal lo1 freqs ghz"]  = str(cal_lo1_freqs)
+    testinfo["cal lo2 freqs ghz"]  = str(cal_lo2_freqs)
     testinfo["lo1 power dbm"]      = lo1_power
     testinfo["lo2 power dbm"]      = lo2_power
     testinfo["rf generator name"]  = rf_generator_name
     testinfo["rf power dbm"]       = rf_power
 
+    # when resuming keep the original test info, only add the resume time,
+    # after checking that the parameters of the data are the same
+    if resume:
+        with open(cal_datadir + "/testinfo.json", "r") as f:
+            saved_testinfo = json.load(f)
+        check_resume_testinfo(saved_testinfo, testinfo, ["boffile", 
+            "bandwidth mhz", "nchannels", "acc len", "chnl step", 
+            "rawdata step", "lo1 freqs ghz", "lo2 freqs ghz", "lo1 power dbm",
+            "lo2 power dbm", "rf power dbm", "interp method", 
+            "cal lo1 freqs ghz", "cal lo2 freqs ghz"])
+        saved_testinfo.setdefault("resume date times", []).append(date_time)
+        with open(cal_datadir + "/testinfo.json", "w") as f:
+            json.dump(saved_testinfo, f, indent=4, sort_keys=True)
+        return
+
+    os.mkdir(cal_datadir)
     with open(cal_datadir + "/testinfo.json", "w") as f:
         json.dump(testinfo, f, indent=4, sort_keys=True)
 
-def make_dss_measurements(measdir, rf_freqs_usb, rf_freqs_lsb):
+def make_dss_measurements(measdir, rf_freqs_usb, rf_freqs_lsb, sweeps, 
+    first_set=False):
     """
     Makes the measurements for dss calibration for a single set of LOs.
     :param measdir: directory where to save the data of this measurement
         (sub directory of main cal_datadir).
     :param rf_freqs_usb: rf frequencies to measure in usb (GHz).
     :param rf_freqs_lsb: rf frequencies to measure in lsb (GHz).
+    :param sweeps: order of the tone sweeps, as (sideband, ascending) tuples
+        (see lo_scheduler.schedule_sweeps).
+    :param first_set: if True, the first tone of the first sweep is already
+        set in the RF generator.
+    :return: calibration data of the measurement (dictionary with the arrays
+        saved in caldata.npz).
     """
-    print("Starting tone sweep in upper sideband...")
-    sweep_time = time.time()
-    a2_toneusb, b2_toneusb, ab_toneusb = get_caldata(measdir, rf_freqs_usb, "usb")
-    print("done (" +str(int(time.time() - sweep_time)) + "[s])")
-        
-    print("Starting tone sweep in lower sideband...")
-    sweep_time = time.time()
-    a2_tonelsb, b2_tonelsb, ab_tonelsb = get_caldata(measdir, rf_freqs_lsb, "lsb")
-    print("done (" +str(int(time.time() - sweep_time)) + "[s])")
+    caldata = {}
+    for j, (tone_sideband, ascending) in enumerate(sweeps):
+        print("Starting tone sweep in " + sweep_name((tone_sideband, 
+            ascending)) + " order...")
+        sweep_time = time.time()
+        rf_freqs = rf_freqs_usb if tone_sideband=='usb' else rf_freqs_lsb
+        a2_tone, b2_tone, ab_tone = get_caldata(measdir, rf_freqs, 
+            tone_sideband, ascending, first_set and j == 0)
+        caldata['a2_tone' + tone_sideband] = a2_tone
+        caldata['b2_tone' + tone_sideband] = b2_tone
+        caldata['ab_tone' + tone_sideband] = ab_tone
+        print("done (" +str(int(time.time() - sweep_time)) + "[s])")
 
     print("Saving data...")
-    np.savez(measdir+"/caldata", 
-        a2_toneusb=a2_toneusb, b2_toneusb=b2_toneusb, ab_toneusb=ab_toneusb,
-        a2_tonelsb=a2_tonelsb, b2_tonelsb=b2_tonelsb, ab_tonelsb=ab_tonelsb)
+    with phase_timer.time("data save"):
+        np.savez(measdir+"/caldata", **caldata)
     print("done")
 
-    print("Printing data...")
-    print_singlelo_data(measdir)
-    print("done")
+    # print data in the report processes
+    if print_reports:
+        report_pool.submit(print_singlelo_data, measdir, caldata)
+
+    return caldata
 
-def get_caldata(measdir, rf_freqs, tone_sideband):
+def get_caldata(measdir, rf_freqs, tone_sideband, ascending=True, 
+    first_set=False):
     """
     Sweep a tone through a sideband and get the calibration data.
     The calibration data is the power of each tone in both inputs (a and b)
     and the cross-correlation of both inputs as a complex number (ab*).
-    The full sprecta measured for each tone is saved to data for debugging
-    purposes.
+    The full sprecta measured every rawdata_step tones is saved to data for 
+    debugging purposes. For the rest of the tones only the tone channel is 
+    read.
     :param measdir: directory where to save the raw data.
     :param rf_freqs: frequencies of the tones to perform the sweep (GHz).
     :param tone_sideband: sideband of the injected test tone. Either USB or LSB
+    :param ascending: if True, the tones are swept from the lowest to the
+        highest IF, else from the highest to the lowest IF.
+    :param first_set: if True, the first tone to measure is already set in
+        the RF generator.
     :return: calibration data: a2, b2, and ab.
     """
-    a2_arr = []; b2_arr = []; ab_arr = []
-    for i, chnl in enumerate(test_channels):
-        # set test tone
-        freq = rf_freqs[chnl]
-        rf_generator.ask("freq " + str(freq) + " ghz; *opc?")
-        time.sleep(pause_time)
-
-        # read data
-        a2    = cd.read_interleave_data(roach, bram_a2,    bram_addr_width, 
-                                        bram_word_width,   pow_data_type)
-        b2    = cd.read_interleave_data(roach, bram_b2,    bram_addr_width, 
-                                        bram_word_width,   pow_data_type)
-        ab_re = cd.read_interleave_data(roach, bram_ab_re, bram_addr_width, 
-                                        bram_word_width,   crosspow_data_type)
-        ab_im = cd.read_interleave_data(roach, bram_ab_im, bram_addr_width, 
-                                        bram_word_width,   crosspow_data_type)
-
-        # append data to arrays
-        a2_arr.append(a2[chnl])
-        b2_arr.append(b2[chnl])
-        ab_arr.append(ab_re[chnl] + 1j*ab_im[chnl])
-
-        # scale and dBFS data for plotting
-        a2_plot = cd.scale_and_dBFS_specdata(a2, acc_len, dBFS)
-        b2_plot = cd.scale_and_dBFS_specdata(b2, acc_len, dBFS)
-
-        # compute input ratios for plotting
-        if tone_sideband=='usb':
-            ab_ratios = np.divide(np.conj(ab_arr), a2_arr) # (ab*)* /aa* = a*b / aa* = b/a
-        else: # tone_sideband=='lsb
-            ab_ratios = np.divide(ab_arr, b2_arr) # ab* / bb* = a/b
+    cal_brams  = [bram_a2, bram_b2, bram_ab_re, bram_ab_im]
+    cal_dtypes = [pow_data_type, pow_data_type, crosspow_data_type, crosspow_data_type]
+    pipeline = SweepPipeline()
+    acc_poller = AccPoller(roach, bram_a2, bram_addr_width, bram_word_width, 
+        pow_data_type, acc_cnt_reg)
+    rawdata = RawDataStore(measdir + "/rawdata_tone_" + tone_sideband, 
+        nsnapshots, nchannels, {'a2' : pow_data_type, 'b2' : pow_data_type,
+        'ab_re' : crosspow_data_type, 'ab_im' : crosspow_data_type}, resume)
+    a2_arr = np.zeros(len(test_channels))
+    b2_arr = np.zeros(len(test_channels))
+    ab_arr = np.zeros(len(test_channels), dtype=complex)
+    ab_ratios = np.zeros(len(test_channels), dtype=complex)
+
+    # get the tones measured before an interruption
+    measname = os.path.basename(measdir)
+    journal_tones = journal.get_tones(measname, tone_sideband)
+    for i, values in journal_tones.items():
+        a2_arr[i] = values['a2']
+        b2_arr[i] = values['b2']
+        ab_arr[i] = values['ab_re'] + 1j*values['ab_im']
+
+    # clear the plot lines of the previous sweep
+    live_plot.update({2 : ([], []), 3 : ([], [])})
+    sweep_order = tone_order(len(test_channels), ascending, journal_tones)
+    tone_sweeper.start([rf_freqs[test_channels[i]] for i in sweep_order], 
+        first_set)
+    for i in sweep_order:
+        chnl = test_channels[i]
 
-        # plot data
+        # set test tone
+        with phase_timer.time("tone retune"):
+            tone_sweeper.next()
+
+        # wait for the tone to settle while plotting previous tone (the 
+        # settle phase includes the deferred work, also timed by itself)
+        with phase_timer.time("settle"):
+            if wait_accs:
+                acc_poller.mark(chnl)
+                pipeline.settle(pause_time, acc_poller.ready)
+            else:
+                pipeline.settle(pause_time)
+
+        # read data, full spectra only for debug snapshots
+        snapshot = rawdata_step > 0 and i % rawdata_step == 0
+        with phase_timer.time("read"):
+            if snapshot:
+                a2, b2, ab_re, ab_im = roach_pool.read_interleave_groups(cal_brams,
+                    bram_addr_width, bram_word_width, cal_dtypes)
+                a2_chnl, b2_chnl = a2[chnl], b2[chnl]
+                ab_re_chnl, ab_im_chnl = ab_re[chnl], ab_im[chnl]
+            else:
+                a2_chnl, b2_chnl, ab_re_chnl, ab_im_chnl = \
+                    roach_pool.read_chnl_groups(cal_brams, bram_addr_width, 
+                    bram_word_width, cal_dtypes, chnl)
+
+        # save data in arrays
+        a2_arr[i] = a2_chnl
+        b2_arr[i] = b2_chnl
+        ab_arr[i] = ab_re_chnl + 1j*ab_im_chnl
+
+        # plot data in the next settle time
         if show_plots:
-            lines[0].set_data(if_freqs, a2_plot)
-            lines[1].set_data(if_freqs, b2_plot)
-            lines[2].set_data(if_test_freqs[:i+1], np.abs(ab_ratios))
-            lines[3].set_data(if_test_freqs[:i+1], np.angle(ab_ratios, deg=True))
-            fig.canvas.draw()
-            fig.canvas.flush_events()
+            spectra = [a2, b2] if snapshot else None
+            pipeline.defer(plot_caldata, tone_sideband, i, a2_arr, b2_arr, 
+                ab_arr, ab_ratios, spectra)
         
-        # save data
-        rawdata_dir = measdir+"/rawdata_tone_" + tone_sideband
-        np.savez(rawdata_dir + "/chnl_" + str(chnl), 
-            a2=a2, b2=b2, ab_re=ab_re, ab_im=ab_im)
-
-        # print raw spectral data
-        print_spec_data(rawdata_dir, chnl)
-
-    # compute interpolations
-    a2_arr = np.interp(if_freqs, if_test_freqs, a2_arr)
-    b2_arr = np.interp(if_freqs, if_test_freqs, b2_arr)
-    ab_arr = np.interp(if_freqs, if_test_freqs, ab_arr)
+        # save raw data in background and print it in the report processes
+        if snapshot:
+            rawdata_dir = measdir+"/rawdata_tone_" + tone_sideband
+            pipeline.submit(phase_timer.wrap("rawdata write", rawdata.append), 
+                chnl, 
+                a2=a2, b2=b2, ab_re=ab_re, ab_im=ab_im)
+            if print_reports:
+                pipeline.defer(report_pool.submit, print_spec_data, 
+                    rawdata_dir, chnl, a2, b2)
+
+        # checkpoint tone in the journal, after its raw data
+        pipeline.submit(phase_timer.wrap("journal write", journal.add_tone), 
+            measname, tone_sideband, i, 
+            {'a2' : float(a2_chnl), 'b2' : float(b2_chnl), 
+            'ab_re' : float(ab_re_chnl), 'ab_im' : float(ab_im_chnl)})
+    tone_sweeper.stop()
+    pipeline.close()
+    rawdata.close()
+
+    # estimate the interpolation error, and compute interpolations
+    interp_srr = error2srr(estimate_interp_error(if_test_freqs, a2_arr, 
+        b2_arr, ab_arr, tone_sideband, interp_method, interp_degree))
+    save_interp_srr(cal_datadir + "/testinfo.json", measname + " " + tone_sideband, interp_srr)
+    print_interp_srr(interp_srr)
+    a2_arr, b2_arr, ab_arr = interp_caldata(if_freqs, if_test_freqs, a2_arr,
+        b2_arr, ab_arr, interp_method, interp_degree)
 
     return a2_arr, b2_arr, ab_arr
 
-def print_spec_data(rawdata_dir, chnl):
+def print_interp_srr(interp_srr):
     """
-    Print the saved data to .pdf images for an easy check.
-    :param rawdata_dir: directory where to read the data and print the plot.
+    Print the SRR allowed by the interpolation of the calibration data of a
+    sweep, and warn if it is lower than interp_srr_target.
+    :param interp_srr: SRR estimate at every tone (dB, NaN if not estimated).
+    """
+    interp_srr = interp_srr[np.isfinite(interp_srr)]
+    if len(interp_srr) == 0:
+        return
+    print("Interpolation SRR estimate: min " + "%.1f" % np.min(interp_srr) +
+        "[dB], median " + "%.1f" % np.median(interp_srr) + "[dB]")
+    if np.min(interp_srr) < interp_srr_target:
+        print("Warning: interpolation SRR estimate below the " + 
+            str(interp_srr_target) + "[dB] target, use a smaller chnl_step.")
+
+def plot_caldata(tone_sideband, i, a2_arr, b2_arr, ab_arr, ab_ratios, 
+    spectra=None):
+    """
+    Plot the calibration data of the last tone measured in a sweep. Only the
+    new tone is computed and sent to the plot.
+    :param tone_sideband: sideband of the injected test tone. Either USB or LSB
+    :param i: index of the tone in the sweep.
+    :param a2_arr: power of input a of the sweep tones.
+    :param b2_arr: power of input b of the sweep tones.
+    :param ab_arr: crosspower of inputs a and b of the sweep tones.
+    :param ab_ratios: input ratios of the sweep tones, updated with the new
+        tone.
+    :param spectra: full a2 and b2 spectra of the last tone. If None, the
+        spectra plots are not updated.
+    """
+    # compute input ratio of the new tone
+    with phase_timer.time("ratio"):
+        if tone_sideband=='usb':
+            ab_ratios[i] = np.conj(ab_arr[i]) / a2_arr[i] # (ab*)* /aa* = a*b / aa* = b/a
+        else: # tone_sideband=='lsb
+            ab_ratios[i] = ab_arr[i] / b2_arr[i] # ab* / bb* = a/b
+
+    with phase_timer.time("plot"):
+        if spectra is not None:
+            # scale and dBFS data for plotting
+            a2_plot = cd.scale_and_dBFS_specdata(spectra[0], acc_len, dBFS)
+            b2_plot = cd.scale_and_dBFS_specdata(spectra[1], acc_len, dBFS)
+            live_plot.update({0 : (if_freqs, a2_plot), 1 : (if_freqs, b2_plot)})
+        live_plot.append({
+            2 : ([if_test_freqs[i]], [np.abs(ab_ratios[i])]),
+            3 : ([if_test_freqs[i]], [np.angle(ab_ratios[i], deg=True)])})
+
+def print_spec_data(rawdata_dir, chnl, a2, b2):
+    """
+    Print the spectral data of a tone to .pdf images for an easy check.
+    :param rawdata_dir: directory where to print the plot.
     :param chnl: channel where the tone is injected.
+    :param a2: full power spectrum of input a.
+    :param b2: full power spectrum of input b.
     """
-    # get data
-    specdata = np.load(rawdata_dir + "/chnl_" + str(chnl) + ".npz")
-    a2 = specdata['a2']
-    b2 = specdata['b2']
-
     # compute power levels
     pow_a2 = cd.scale_and_dBFS_specdata(a2, acc_len, dBFS)
     pow_b2 = cd.scale_and_dBFS_specdata(b2, acc_len, dBFS)
@@ -315,14 +537,16 @@ def print_spec_data(rawdata_dir, chnl):
     plt.savefig(rawdata_dir+'/chnl_' + str(chnl) + '_b2.pdf')
     plt.close()
 
-def print_singlelo_data(measdir):
+def print_singlelo_data(measdir, caldata):
     """
-    Print the saved data to .pdf images for an easy check.
-    :param measdir: directory where to read the data of single measurement
-    and save the image (sub directory of main cal_datadir).
+    Print the calibration data of a single LO setting to .pdf images for an 
+    easy check.
+    :param measdir: directory where to save the images (sub directory of main
+        cal_datadir).
+    :param caldata: calibration data of the measurement (dictionary with the
+        arrays of caldata.npz).
     """
     # get data
-    caldata = np.load(measdir + "/caldata.npz")
     a2_toneusb = caldata['a2_toneusb']; a2_tonelsb = caldata['a2_tonelsb']
     b2_toneusb = caldata['b2_toneusb']; b2_tonelsb = caldata['b2_tonelsb']
     ab_toneusb = caldata['ab_toneusb']; ab_tonelsb = caldata['ab_tonelsb']
@@ -396,9 +620,12 @@ def print_singlelo_data(measdir):
     plt.savefig(measdir+'/srr_analog.pdf')
     plt.close()
 
-def print_multilo_data():
+def print_multilo_data(datadir, multilo_caldata):
     """
-    Print the saved data from all LO settings to .pdf image.
+    Print the calibration data from all LO settings to .pdf images.
+    :param datadir: directory where to save the images (main cal_datadir).
+    :param multilo_caldata: list with the LO frequencies and the calibration
+        data of every measurement, as (lo1_freq, lo2_freq, caldata) tuples.
     """
     # create power level signal figure 
     fig1, ax1 = plt.subplots(1,1)
@@ -433,78 +660,69 @@ def print_multilo_data():
     # get colors for plotting
     colors = plt.rcParams['axes.prop_cycle'].by_key()['color']
 
-    for lo1_freq, color in zip(lo1_freqs, colors):
-        for lo2_freq in lo2_freqs:
-            # get measurement subdirectory
-            measname = "lo1_" + str(lo1_freq) + "ghz_lo2_" + \
-                                str(lo2_freq) + "ghz"
-            measdir = cal_datadir + "/" + measname
-            
-            # compute rf frequencies
-            rf_freqs_usb = lo1_freq + lo2_freq + (if_freqs/1e3) # GHz
-            rf_freqs_lsb = lo1_freq - lo2_freq - (if_freqs/1e3) # GHz
-
-            # get data
-            caldata = np.load(measdir + "/caldata.npz")
-            a2_toneusb = caldata['a2_toneusb']
-            a2_tonelsb = caldata['a2_tonelsb']
-            b2_toneusb = caldata['b2_toneusb']
-            b2_tonelsb = caldata['b2_tonelsb']
-            ab_toneusb = caldata['ab_toneusb']
-            ab_tonelsb = caldata['ab_tonelsb']
+    # use one color per lo1 frequency
+    lo1_list = []
+    for lo1_freq, lo2_freq, caldata in multilo_caldata:
+        if lo1_freq not in lo1_list:
+            lo1_list.append(lo1_freq)
+
+    for lo1_freq, lo2_freq, caldata in multilo_caldata:
+        color = colors[lo1_list.index(lo1_freq) % len(colors)]
         
-            # compute power levels
-            pow_a2_toneusb = cd.scale_and_dBFS_specdata(a2_toneusb, acc_len, dBFS)
-            pow_a2_tonelsb = cd.scale_and_dBFS_specdata(a2_tonelsb, acc_len, dBFS)
-            pow_b2_toneusb = cd.scale_and_dBFS_specdata(b2_toneusb, acc_len, dBFS)
-            pow_b2_tonelsb = cd.scale_and_dBFS_specdata(b2_tonelsb, acc_len, dBFS)
-
-            # plot power levels signal
-            ax1.plot(rf_freqs_usb, pow_a2_toneusb, color=color)
-            ax1.plot(rf_freqs_lsb, pow_b2_tonelsb, color=color)
-            
-            # plot power levels image
-            ax2.plot(rf_freqs_usb, pow_a2_tonelsb, color=color)
-            ax2.plot(rf_freqs_lsb, pow_b2_toneusb, color=color)
-
-            # compute ratios
-            ab_ratios_usb = np.conj(ab_toneusb) / a2_toneusb # (ab*)* /aa* = a*b / aa* = b/a
-            ab_ratios_lsb = ab_tonelsb / b2_tonelsb # ab* / bb* = a/b
-            
-            # plot magnitude ratios
-            ax3.plot(rf_freqs_usb, np.abs(ab_ratios_usb), color=color)
-            ax3.plot(rf_freqs_lsb, np.abs(ab_ratios_lsb), color=color)
-            
-            # plot angle difference
-            ax4.plot(rf_freqs_usb, np.angle(ab_ratios_usb, deg=True), color=color)
-            ax4.plot(rf_freqs_lsb, np.angle(ab_ratios_lsb, deg=True), color=color)
+        # compute rf frequencies
+        rf_freqs_usb = lo1_freq + lo2_freq + (if_freqs/1e3) # GHz
+        rf_freqs_lsb = lo1_freq - lo2_freq - (if_freqs/1e3) # GHz
+
+        # get data
+        a2_toneusb = caldata['a2_toneusb']
+        a2_tonelsb = caldata['a2_tonelsb']
+        b2_toneusb = caldata['b2_toneusb']
+        b2_tonelsb = caldata['b2_tonelsb']
+        ab_toneusb = caldata['ab_toneusb']
+        ab_tonelsb = caldata['ab_tonelsb']
     
-            # compute srr analog
-            srr_usb = a2_toneusb / b2_toneusb
-            srr_lsb = b2_tonelsb / a2_tonelsb
-            
-            # plot srr analog
-            plt.plot(rf_freqs_usb, 10*np.log10(srr_usb), color=color)
-            plt.plot(rf_freqs_lsb, 10*np.log10(srr_lsb), color=color)
+        # compute power levels
+        pow_a2_toneusb = cd.scale_and_dBFS_specdata(a2_toneusb, acc_len, dBFS)
+        pow_a2_tonelsb = cd.scale_and_dBFS_specdata(a2_tonelsb, acc_len, dBFS)
+        pow_b2_toneusb = cd.scale_and_dBFS_specdata(b2_toneusb, acc_len, dBFS)
+        pow_b2_tonelsb = cd.scale_and_dBFS_specdata(b2_tonelsb, acc_len, dBFS)
+
+        # plot power levels signal
+        ax1.plot(rf_freqs_usb, pow_a2_toneusb, color=color)
+        ax1.plot(rf_freqs_lsb, pow_b2_tonelsb, color=color)
+        
+        # plot power levels image
+        ax2.plot(rf_freqs_usb, pow_a2_tonelsb, color=color)
+        ax2.plot(rf_freqs_lsb, pow_b2_toneusb, color=color)
 
-    # print figures
-    fig1.savefig(cal_datadir+'/power_lev_sig.pdf')
-    fig2.savefig(cal_datadir+'/power_lev_img.pdf')
-    fig3.savefig(cal_datadir+'/mag_ratios.pdf')
-    fig4.savefig(cal_datadir+'/angle_diff.pdf')
-    fig5.savefig(cal_datadir+'/srr_analog.pdf')
+        # compute ratios
+        ab_ratios_usb = np.conj(ab_toneusb) / a2_toneusb # (ab*)* /aa* = a*b / aa* = b/a
+        ab_ratios_lsb = ab_tonelsb / b2_tonelsb # ab* / bb* = a/b
+        
+        # plot magnitude ratios
+        ax3.plot(rf_freqs_usb, np.abs(ab_ratios_usb), color=color)
+        ax3.plot(rf_freqs_lsb, np.abs(ab_ratios_lsb), color=color)
+        
+        # plot angle difference
+        ax4.plot(rf_freqs_usb, np.angle(ab_ratios_usb, deg=True), color=color)
+        ax4.plot(rf_freqs_lsb, np.angle(ab_ratios_lsb, deg=True), color=color)
+    
+        # compute srr analog
+        srr_usb = a2_toneusb / b2_toneusb
+        srr_lsb = b2_tonelsb / a2_tonelsb
+        
+        # plot srr analog
+        ax5.plot(rf_freqs_usb, 10*np.log10(srr_usb), color=color)
+        ax5.plot(rf_freqs_lsb, 10*np.log10(srr_lsb), color=color)
 
-def compress_data(datadir):
-    """
-    Compress the data from the datadir directory into a .tar.gz
-    file and delete the original directory.
-    :param datair: directory to compress.
-    """
-    tar = tarfile.open(datadir + ".tar.gz", "w:gz")
-    for datafile in os.listdir(datadir):
-        tar.add(datadir + '/' + datafile, datafile)
-    tar.close()
-    shutil.rmtree(datadir)
+    # print figures
+    fig1.savefig(datadir+'/power_lev_sig.pdf')
+    fig2.savefig(datadir+'/power_lev_img.pdf')
+    fig3.savefig(datadir+'/mag_ratios.pdf')
+    fig4.savefig(datadir+'/angle_diff.pdf')
+    fig5.savefig(datadir+'/srr_analog.pdf')
+    for fig in [fig1, fig2, fig3, fig4, fig5]:
+        plt.close(fig)
 
 if __name__ == '__main__':
     main()
@@ -3,47 +3,95 @@
 # multiple LO values and multiple LO stages.
 
 # imports
-import os, time, tarfile, shutil, json
+import os, sys, time, tarfile, shutil, json, argparse
 import numpy as np
 import matplotlib.pyplot as plt
 import calandigital as cd
+# shared modules (bram_io, live_plot, etc.)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    "..", "..", "..", "..", "Common_Scripts"))
+from bram_io import RoachPool, AccPoller
+from sweep_pipeline import SweepPipeline
+from live_plot import LivePlot
+from report_pool import ReportPool
+from rawdata_store import RawDataStore
+from sweep_journal import SweepJournal, find_last_datadir, \
+    check_resume_testinfo
+from instrument_group import InstrumentGroup
+from lo_scheduler import make_schedule, save_schedule, sweep_name, tone_order
+from tone_sweeper import ToneSweeper
+from phase_timer import PhaseTimer
+from data_archive import DataArchive
 from dss_load_constants import dss_load_constants
 from dss_multilo_parameters import *
 
 def main():
     start_time = time.time()
 
+    parse_args()
     make_pre_measurements_actions()
     make_dss_multilo_measurements()
     make_post_measurements_actions()
 
     print("Finished. Total time: " + str(int(time.time() - start_time)) + "[s]")
 
+def parse_args():
+    """
+    Parse the command line arguments. With --resume an interrupted srr
+    measurement is continued in its data directory, skipping the LO settings
+    and tones already measured.
+    """
+    global srr_datadir, resume
+    parser = argparse.ArgumentParser(description=
+        "SRR computation of a DSS receiver with multiple LOs.")
+    parser.add_argument("--resume", nargs="?", const="", metavar="DATADIR",
+        help="resume an interrupted srr measurement saved in DATADIR "
+        "(default: the last uncompressed srr measurement directory)")
+    args = parser.parse_args()
+
+    resume = args.resume is not None
+    if resume:
+        srr_datadir = args.resume or find_last_datadir("dss_srr ")
+        print("Resuming " + srr_datadir + "...")
+
 def make_pre_measurements_actions():
     """
     Makes all the actions in preparation for the measurements:
-    - Extract calibration data.
+    - Open calibration data.
     - initizalize ROACH and generator communications.
     - creating plotting and data saving elements
     - setting initial registers in FPGA
     - turning on generator power
     """
-    global roach, rf_generator, lo1_generator, lo2_generator, caldir, fig, lines
+    global roach, roach_pool, rf_generator, lo1_generator, lo2_generator, calarch, live_plot
+    global report_pool, journal, instruments, tone_sweeper, phase_timer
 
-    roach = cd.initialize_roach(roach_ip)
+    # start the plot and report processes before opening connections or
+    # starting threads
+    live_plot = LivePlot(create_figure, show_plots)
+    report_pool = ReportPool(report_nprocs if print_reports else 0)
+
+    roach = initialize_roach(roach_ip)
+    roach_pool = RoachPool(roach, roach_ip, nconnections,
+        initialize_roach=initialize_roach)
     lo1_generator = rm.open_resource(lo1_generator_name)
     lo2_generator = rm.open_resource(lo2_generator_name)
     rf_generator  = rm.open_resource(rf_generator_name)
+    instruments   = InstrumentGroup({'lo1' : lo1_generator, 
+        'lo2' : lo2_generator, 'rf' : rf_generator}, instr_timeouts)
+    tone_sweeper  = ToneSweeper(rf_generator, rf_power, rf_list_sweep, 
+        rf_list_size)
 
-    print("Extracting compressed calibration data...")
-    caldir = caltar[:-7]
-    tarfile.open(caltar).extractall(path=caldir)
+    print("Opening calibration data...")
+    calarch = DataArchive(caltar)
     print("done.")
 
     print("Setting up plotting and data saving elements...")
-    if show_plots:
-        fig, lines = create_figure()
     make_data_directory()
+    journal = SweepJournal(srr_datadir + "/journal.jsonl")
+    phase_timer = PhaseTimer(srr_datadir + "/phase_trace.csv" if phase_trace 
+        else None)
+    roach_pool.timer = phase_timer
     print("done")
 
     print("Setting accumulation register to " + str(acc_len) + "...")
@@ -55,78 +103,126 @@ def make_pre_measurements_actions():
     print("done")
 
     print("Setting instruments power and outputs...")
-    lo1_generator.write("power " + str(lo1_power))
-    lo1_generator.write("freq:mult " + str(lo1_mult))
-    lo2_generator.write("power " + str(lo2_power))
-    rf_generator.write("power " + str(rf_power))
-    rf_generator.write("freq:mult " + str(rf_mult))
-    lo1_generator.write("outp on")
-    lo2_generator.write("outp on")
-    rf_generator.write("outp on")
+    instruments.write({
+        'lo1' : ["power " + str(lo1_power), "freq:mult " + str(lo1_mult),
+                 "outp on"],
+        'lo2' : ["power " + str(lo2_power), "outp on"],
+        'rf'  : ["power " + str(rf_power), "freq:mult " + str(rf_mult), 
+                 "outp on"]})
     print("done")
 
 def make_dss_multilo_measurements():
     """
     Makes the measurements for srr computation with multiple LOs.
     """
-    for lo1_freq in lo1_freqs:
-        # set lo1 frequency
-        lo1_generator.ask("freq " + str(lo1_freq) + " ghz; *opc?")
+    multilo_srrdata = []
+    schedule = []
+    lo_schedule, sweeps_schedule, lo_time = make_schedule(lo1_freqs, 
+        lo2_freqs, if_test_freqs/1e3, lo1_cost, lo2_cost, schedule_retunes)
+    print("Estimated LO retune time: " + str(int(lo_time)) + "[s]")
+    lo1_current = None; lo2_current = None
+    for (lo1_freq, lo2_freq), sweeps in zip(lo_schedule, sweeps_schedule):
+        # print setting
+        print("Current LOs: LO1:" + str(lo1_freq) + "GHz," +
+                          " LO2:" + str(lo2_freq) + "GHz")
+        step = {"lo1 ghz" : float(lo1_freq), "lo2 ghz" : float(lo2_freq)}
         
-        for lo2_freq in lo2_freqs:
-            # set lo2 frequency
-            lo2_generator.ask("freq " + str(lo2_freq) + " ghz; *opc?")
-
-            # print setting
-            print("Current LOs: LO1:" + str(lo1_freq) + "GHz," +
-                              " LO2:" + str(lo2_freq) + "GHz")
-            
-            # make measurement subdirectory
-            measname = "lo1_" + str(lo1_freq) + "ghz_lo2_" + \
-                                str(lo2_freq) + "ghz"
-            measdir = srr_datadir + "/" + measname
-            os.mkdir(measdir)
-            os.mkdir(measdir + "/rawdata_tone_usb")
-            os.mkdir(measdir + "/rawdata_tone_lsb")
-            
-            # compute rf frequencies
-            rf_freqs_usb = lo1_freq + lo2_freq + (if_freqs/1e3) # GHz
-            rf_freqs_lsb = lo1_freq - lo2_freq - (if_freqs/1e3) # GHz
-
-            # loading calibration constants
-            if load_consts:
-                print("Loading constants..."); load_time = time.time()
-                dss_load_constants(roach, caldir + "/" + measname)
-                print("done")
-
-            # make measurement
-            make_dss_measurements(measdir, rf_freqs_usb, rf_freqs_lsb)
-
-    print_multilo_data()
+        # make measurement subdirectory
+        measname = "lo1_" + str(lo1_freq) + "ghz_lo2_" + \
+                            str(lo2_freq) + "ghz"
+        measdir = srr_datadir + "/" + measname
+        if journal.is_done(measname):
+            print("Already measured, skipping")
+            srrdata = dict(np.load(measdir + "/srrdata.npz"))
+            multilo_srrdata.append((lo1_freq, lo2_freq, srrdata))
+            if print_reports:
+                report_pool.submit(print_singlelo_data, measdir, srrdata)
+            step["measured before resume"] = True
+            schedule.append(step)
+            continue
+        for subdir in ["", "/rawdata_tone_usb", "/rawdata_tone_lsb"]:
+            if not os.path.exists(measdir + subdir):
+                os.mkdir(measdir + subdir)
+        phase_timer.set_group(measname)
+
+        # compute rf frequencies
+        rf_freqs_usb = lo1_freq + lo2_freq + (if_freqs/1e3) # GHz
+        rf_freqs_lsb = lo1_freq - lo2_freq - (if_freqs/1e3) # GHz
+
+        # set in parallel the lo frequencies that change and the first tone
+        # to measure (tones measured before a resume are skipped)
+        tone_sideband, ascending = sweeps[0]
+        rf_freqs = rf_freqs_usb if tone_sideband=='usb' else rf_freqs_lsb
+        sweep_order = tone_order(len(test_channels), ascending, 
+            journal.get_tones(measname, tone_sideband))
+        commands = {}
+        if len(sweep_order) > 0:
+            chnl = test_channels[sweep_order[0]]
+            commands['rf'] = "freq " + str(rf_freqs[chnl]) + " ghz"
+        if lo1_freq != lo1_current:
+            commands['lo1'] = "freq " + str(lo1_freq) + " ghz"
+        if lo2_freq != lo2_current:
+            commands['lo2'] = "freq " + str(lo2_freq) + " ghz"
+        retune_time = time.time()
+        with phase_timer.time("lo retune"):
+            instruments.set_and_wait(commands)
+        lo1_current = lo1_freq; lo2_current = lo2_freq
+        step["lo retune time s"] = time.time() - retune_time
+        step["sweeps"] = [sweep_name(sweep) for sweep in sweeps]
+
+        # loading calibration constants
+        if load_consts:
+            print("Loading constants..."); load_time = time.time()
+            with phase_timer.time("load consts"):
+                dss_load_constants(roach, calarch, measname, roach_pool)
+            print("done")
+
+        # make measurement
+        srrdata = make_dss_measurements(measdir, rf_freqs_usb, rf_freqs_lsb, 
+            sweeps, 'rf' in commands)
+        multilo_srrdata.append((lo1_freq, lo2_freq, srrdata))
+        journal.add_done(measname)
+
+        # record the achieved schedule
+        schedule.append(step)
+        save_schedule(srr_datadir + "/testinfo.json", schedule, lo_time)
+        phase_timer.save(srr_datadir + "/testinfo.json")
+
+    if print_reports:
+        multilo_srrdata.sort(key=lambda lo_data: (lo_data[0], lo_data[1]))
+        report_pool.submit(print_multilo_data, srr_datadir, multilo_srrdata)
 
 def make_post_measurements_actions():
     """
     Makes all the actions required after measurements:
     - turn off sources
     - compress data
-    - remove calibration data
+    - close calibration data
     - write srr data name in file
     """
     print("Turning off instruments...")
     #lo1_generator.write("freq:mult 1")
     #rf_generator.write("freq:mult 1")
-    lo1_generator.write("outp off")
-    lo2_generator.write("outp off")
-    rf_generator.write("outp off")
+    instruments.write({'lo1' : "outp off", 'lo2' : "outp off", 
+        'rf' : "outp off"})
+    instruments.close()
     rm.close()
+    roach_pool.close()
+    live_plot.close()
+    print("done")
+
+    print("Waiting for reports...")
+    report_pool.close()
+    journal.close()
+    phase_timer.close()
     print("done")
 
     print("Compressing data...")
     compress_data(srr_datadir)
     print("done")
 
-    print("Removing calibration data...")
-    shutil.rmtree(caldir)
+    print("Closing calibration data...")
+    calarch.close()
     print("done")
 
     # Write file to save last srr directory
@@ -172,8 +268,6 @@ def make_data_directory():
     """
     Make directory where to save all the srr data.
     """
-    os.mkdir(srr_datadir)
-
     # make .json file with test info
     testinfo = {}
     testinfo["roach ip"]           = roach_ip
@@ -183,6 +277,10 @@ def make_data_directory():
     testinfo["nchannels"]          = nchannels
     testinfo["acc len"]            = acc_len
     testinfo["chnl step"]          = chnl_step
+    testinfo["rawdata step"]       = rawdata_step
+    testinfo["wait accs"]          = wait_accs
+    testinfo["rf list sweep"]      = rf_list_sweep
+    testinfo["schedule retunes"]   = schedule_retunes
     testinfo["lo1 generator name"] = lo1_generator_name
     testinfo["lo2 generator name"] = lo2_generator_name
     testinfo["lo1 freqs ghz"]      = str(lo1_freqs)
@@ -194,94 +292,157 @@ def make_data_directory():
     testinfo["load consts"]        = load_consts
     testinfo["caltar"]             = caltar
 
+    # when resuming keep the original test info, only add the resume time,
+    # after checking that the parameters of the data are the same
+    if resume:
+        with open(srr_datadir + "/testinfo.json", "r") as f:
+            saved_testinfo = json.load(f)
+        check_resume_testinfo(saved_testinfo, testinfo, ["boffile", 
+            "bandwidth mhz", "nchannels", "acc len", "chnl step", 
+            "rawdata step", "lo1 freqs ghz", "lo2 freqs ghz", "lo1 power dbm",
+            "lo2 power dbm", "rf power dbm", "load consts", "caltar"])
+        saved_testinfo.setdefault("resume date times", []).append(date_time)
+        with open(srr_datadir + "/testinfo.json", "w") as f:
+            json.dump(saved_testinfo, f, indent=4, sort_keys=True)
+        return
+
+    os.mkdir(srr_datadir)
     with open(srr_datadir + "/testinfo.json", "w") as f:
         json.dump(testinfo, f, indent=4, sort_keys=True)
 
-def make_dss_measurements(measdir, rf_freqs_usb, rf_freqs_lsb):
+def make_dss_measurements(measdir, rf_freqs_usb, rf_freqs_lsb, sweeps, 
+    first_set=False):
     """
     Makes the measurements for srr computation for a single set of LOs.
     :param measdir: directory where to save the data of this measurement
         (sub directory of main srr_datadir).
     :param rf_freqs_usb: rf frequencies to measure in usb (GHz).
     :param rf_freqs_lsb: rf frequencies to measure in lsb (GHz).
+    :param sweeps: order of the tone sweeps, as (sideband, ascending) tuples
+        (see lo_scheduler.schedule_sweeps).
+    :param first_set: if True, the first tone of the first sweep is already
+        set in the RF generator.
+    :return: srr data of the measurement (dictionary with the arrays saved in
+        srrdata.npz).
     """
-    print("Starting tone sweep in upper sideband...")
-    sweep_time = time.time()
-    usb_toneusb, lsb_toneusb = get_srrdata(measdir, rf_freqs_usb, "usb")
-    print("done (" +str(int(time.time() - sweep_time)) + "[s])")
-        
-    print("Starting tone sweep in lower sideband...")
-    sweep_time = time.time()
-    usb_tonelsb, lsb_tonelsb = get_srrdata(measdir, rf_freqs_lsb, "lsb")
-    print("done (" +str(int(time.time() - sweep_time)) + "[s])")
+    srrdata = {}
+    for j, (tone_sideband, ascending) in enumerate(sweeps):
+        print("Starting tone sweep in " + sweep_name((tone_sideband, 
+            ascending)) + " order...")
+        sweep_time = time.time()
+        rf_freqs = rf_freqs_usb if tone_sideband=='usb' else rf_freqs_lsb
+        usb_tone, lsb_tone = get_srrdata(measdir, rf_freqs, tone_sideband, 
+            ascending, first_set and j == 0)
+        srrdata['usb_tone' + tone_sideband] = usb_tone
+        srrdata['lsb_tone' + tone_sideband] = lsb_tone
+        print("done (" +str(int(time.time() - sweep_time)) + "[s])")
 
     print("Saving data...")
-    np.savez(measdir+"/srrdata",
-        usb_toneusb=usb_toneusb, lsb_toneusb=lsb_toneusb,
-        usb_tonelsb=usb_tonelsb, lsb_tonelsb=lsb_tonelsb)
+    with phase_timer.time("data save"):
+        np.savez(measdir+"/srrdata", **srrdata)
     print("done")
 
-    print("Printing data...")
-    print_singlelo_data(measdir)
-    print("done")
+    # print data in the report processes
+    if print_reports:
+        report_pool.submit(print_singlelo_data, measdir, srrdata)
+
+    return srrdata
 
-def get_srrdata(measdir, rf_freqs, tone_sideband):
+def get_srrdata(measdir, rf_freqs, tone_sideband, ascending=True, 
+    first_set=False):
     """
     Sweep a tone through a sideband and get the srr data.
     The srr data is the power of each tone after applying the calibration
     constants for each sideband (usb and lsb).
-    The full sprecta measured for each tone is saved to data for debugging
-    purposes.
+    The full sprecta measured every rawdata_step tones is saved to data for 
+    debugging purposes. For the rest of the tones only the tone channel is 
+    read.
     :param measdir: directory where to save the raw data.
     :param rf_freqs: frequencies of the tones to perform the sweep.
     :param tone_sideband: sideband of the injected test tone. Either USB or LSB
+    :param ascending: if True, the tones are swept from the lowest to the
+        highest IF, else from the highest to the lowest IF.
+    :param first_set: if True, the first tone to measure is already set in
+        the RF generator.
     :return: srr data: usb and lsb.
     """
-    usb_arr = []; lsb_arr = []
-    for i, chnl in enumerate(test_channels):
-        # set test tone
-        freq = rf_freqs[chnl]
-        rf_generator.ask("freq " + str(freq) + " ghz; *opc?") 
-        time.sleep(pause_time)
-
-        # read data
-        usb = cd.read_interleave_data(roach, bram_usb, bram_addr_width, 
-                                      bram_word_width, pow_data_type)
-        lsb = cd.read_interleave_data(roach, bram_lsb, bram_addr_width, 
-                                      bram_word_width, pow_data_type)
-
-        # append data to arrays
-        usb_arr.append(usb[chnl])
-        lsb_arr.append(lsb[chnl])
-
-        # scale and dBFS data for plotting
-        usb_plot = cd.scale_and_dBFS_specdata(usb, acc_len, dBFS)
-        lsb_plot = cd.scale_and_dBFS_specdata(lsb, acc_len, dBFS)
-
-        # compute srr for plotting
-        if tone_sideband=='usb':
-            srr = np.divide(usb_arr, lsb_arr)
-        else: # tone_sideband=='lsb
-            srr = np.divide(lsb_arr, usb_arr)
+    srr_brams  = [bram_usb, bram_lsb]
+    srr_dtypes = [pow_data_type, pow_data_type]
+    pipeline = SweepPipeline()
+    acc_poller = AccPoller(roach, bram_usb, bram_addr_width, bram_word_width, 
+        pow_data_type, acc_cnt_reg)
+    rawdata = RawDataStore(measdir + "/rawdata_tone_" + tone_sideband, 
+        nsnapshots, nchannels, {'usb' : pow_data_type, 'lsb' : pow_data_type}, 
+        resume)
+    usb_arr = np.zeros(len(test_channels))
+    lsb_arr = np.zeros(len(test_channels))
+    srr     = np.zeros(len(test_channels))
+
+    # get the tones measured before an interruption
+    measname = os.path.basename(measdir)
+    journal_tones = journal.get_tones(measname, tone_sideband)
+    for i, values in journal_tones.items():
+        usb_arr[i] = values['usb']
+        lsb_arr[i] = values['lsb']
+
+    # clear the plot lines of the previous sweep
+    live_plot.update({2 if tone_sideband=='usb' else 3 : ([], [])})
+    sweep_order = tone_order(len(test_channels), ascending, journal_tones)
+    tone_sweeper.start([rf_freqs[test_channels[i]] for i in sweep_order], 
+        first_set)
+    for i in sweep_order:
+        chnl = test_channels[i]
 
+        # set test tone
+        with phase_timer.time("tone retune"):
+            tone_sweeper.next()
+
+        # wait for the tone to settle while plotting previous tone (the 
+        # settle phase includes the deferred work, also timed by itself)
+        with phase_timer.time("settle"):
+            if wait_accs:
+                acc_poller.mark(chnl)
+                pipeline.settle(pause_time, acc_poller.ready)
+            else:
+                pipeline.settle(pause_time)
+
+        # read data, full spectra only for debug snapshots
+        snapshot = rawdata_step > 0 and i % rawdata_step == 0
+        with phase_timer.time("read"):
+            if snapshot:
+                usb, lsb = roach_pool.read_interleave_groups(srr_brams, 
+                    bram_addr_width, bram_word_width, srr_dtypes)
+                usb_chnl, lsb_chnl = usb[chnl], lsb[chnl]
+            else:
+                usb_chnl, lsb_chnl = roach_pool.read_chnl_groups(srr_brams, 
+                    bram_addr_width, bram_word_width, srr_dtypes, chnl)
+
+        # save data in arrays
+        usb_arr[i] = usb_chnl
+        lsb_arr[i] = lsb_chnl
+
+        # plot data in the next settle time
         if show_plots:
-            # define sb plot line
-            line_sb = lines[2] if tone_sideband=='usb' else lines[3]
-
-        # plot data
-            lines[0].set_data(if_freqs, usb_plot)
-            lines[1].set_data(if_freqs, lsb_plot)
-            line_sb.set_data(if_test_freqs[:i+1], 10*np.log10(srr))
-            fig.canvas.draw()
-            fig.canvas.flush_events()
+            spectra = [usb, lsb] if snapshot else None
+            pipeline.defer(plot_srrdata, tone_sideband, i, usb_arr, lsb_arr, srr,
+                spectra)
         
-        # save data
-        rawdata_dir = measdir+"/rawdata_tone_" + tone_sideband
-        np.savez(rawdata_dir + "/chnl_" + str(chnl), 
-            usb=usb, lsb=lsb)
-
-        # print raw spectral data
-        print_spec_data(rawdata_dir, chnl)
+        # save raw data in background and print it in the report processes
+        if snapshot:
+            rawdata_dir = measdir+"/rawdata_tone_" + tone_sideband
+            pipeline.submit(phase_timer.wrap("rawdata write", rawdata.append), 
+                chnl, usb=usb, lsb=lsb)
+            if print_reports:
+                pipeline.defer(report_pool.submit, print_spec_data, 
+                    rawdata_dir, chnl, usb, lsb)
+
+        # checkpoint tone in the journal, after its raw data
+        pipeline.submit(phase_timer.wrap("journal write", journal.add_tone), 
+            measname, tone_sideband, i, 
+            {'usb' : float(usb_chnl), 'lsb' : float(lsb_chnl)})
+    tone_sweeper.stop()
+    pipeline.close()
+    rawdata.close()
 
     # compute interpolations
     usb_arr = np.interp(if_freqs, if_test_freqs, usb_arr)
@@ -289,17 +450,46 @@ def get_srrdata(measdir, rf_freqs, tone_sideband):
 
     return usb_arr, lsb_arr
 
-def print_spec_data(rawdata_dir, chnl):
+def plot_srrdata(tone_sideband, i, usb_arr, lsb_arr, srr, spectra=None):
+    """
+    Plot the srr data of the last tone measured in a sweep. Only the new 
+    tone is computed and sent to the plot.
+    :param tone_sideband: sideband of the injected test tone. Either USB or LSB
+    :param i: index of the tone in the sweep.
+    :param usb_arr: usb power of the sweep tones.
+    :param lsb_arr: lsb power of the sweep tones.
+    :param srr: srr of the sweep tones, updated with the new tone.
+    :param spectra: full usb and lsb spectra of the last tone. If None, the
+        spectra plots are not updated.
+    """
+    # compute srr of the new tone
+    with phase_timer.time("ratio"):
+        if tone_sideband=='usb':
+            srr[i] = usb_arr[i] / lsb_arr[i]
+        else: # tone_sideband=='lsb
+            srr[i] = lsb_arr[i] / usb_arr[i]
+
+    # define sb plot line
+    line_sb = 2 if tone_sideband=='usb' else 3
+
+    with phase_timer.time("plot"):
+        if spectra is not None:
+            # scale and dBFS data for plotting
+            usb_plot = cd.scale_and_dBFS_specdata(spectra[0], acc_len, dBFS)
+            lsb_plot = cd.scale_and_dBFS_specdata(spectra[1], acc_len, dBFS)
+            live_plot.update({0 : (if_freqs, usb_plot), 
+                1 : (if_freqs, lsb_plot)})
+        live_plot.append({line_sb : ([if_test_freqs[i]], 
+            [10*np.log10(srr[i])])})
+
+def print_spec_data(rawdata_dir, chnl, usb, lsb):
     """
-    Print the saved data to .pdf images for an easy check.
-    :param rawdata_dir: directory where to read the data and print the plot.
+    Print the spectral data of a tone to .pdf images for an easy check.
+    :param rawdata_dir: directory where to print the plot.
     :param chnl: channel where the tone is injected.
+    :param usb: full usb power spectrum.
+    :param lsb: full lsb power spectrum.
     """
-    # get data
-    specdata = np.load(rawdata_dir + "/chnl_" + str(chnl) + ".npz")
-    usb = specdata['usb']
-    lsb = specdata['lsb']
-
     # compute power levels
     pow_usb = cd.scale_and_dBFS_specdata(usb, acc_len, dBFS)
     pow_lsb = cd.scale_and_dBFS_specdata(lsb, acc_len, dBFS)
@@ -324,14 +514,16 @@ def print_spec_data(rawdata_dir, chnl):
     plt.savefig(rawdata_dir+'/chnl_' + str(chnl) + '_lsb.pdf')
     plt.close()
 
-def print_singlelo_data(measdir):
+def print_singlelo_data(measdir, srrdata):
     """
-    Print the saved data to .pdf images for an easy check.
-    :param measdir: directory where to read the data of single measurement
-    and save the image (sub directory of main srr_datadir).
+    Print the srr data of a single LO setting to .pdf images for an easy 
+    check.
+    :param measdir: directory where to save the images (sub directory of main
+        srr_datadir).
+    :param srrdata: srr data of the measurement (dictionary with the arrays of
+        srrdata.npz).
     """
     # get data
-    srrdata = np.load(measdir + "/srrdata.npz")
     usb_toneusb = srrdata['usb_toneusb']; lsb_toneusb = srrdata['lsb_toneusb']
     usb_tonelsb = srrdata['usb_tonelsb']; lsb_tonelsb = srrdata['lsb_tonelsb']
 
@@ -378,9 +570,12 @@ def print_singlelo_data(measdir):
     plt.savefig(measdir+'/srr.pdf')
     plt.close()
     
-def print_multilo_data():
+def print_multilo_data(datadir, multilo_srrdata):
     """
-    Print the saved data from all LO settings to .pdf image.
+    Print the srr data from all LO settings to .pdf images.
+    :param datadir: directory where to save the images (main srr_datadir).
+    :param multilo_srrdata: list with the LO frequencies and the srr data of
+        every measurement, as (lo1_freq, lo2_freq, srrdata) tuples.
     """
     # create power level signal figure
     fig1, ax1 = plt.subplots(1,1)
@@ -403,50 +598,53 @@ def print_multilo_data():
     # get colors for plotting
     colors = plt.rcParams['axes.prop_cycle'].by_key()['color']
 
-    for lo1_freq, color in zip(lo1_freqs, colors):
-        for lo2_freq in lo2_freqs:
-            # get measurement subdirectory
-            measname = "lo1_" + str(lo1_freq) + "ghz_lo2_" + \
-                                str(lo2_freq) + "ghz"
-            measdir = srr_datadir + "/" + measname
-            
-            # compute rf frequencies
-            rf_freqs_usb = lo1_freq + lo2_freq + (if_freqs/1e3) # GHz
-            rf_freqs_lsb = lo1_freq - lo2_freq - (if_freqs/1e3) # GHz
-
-            # get data
-            srrdata = np.load(measdir + "/srrdata.npz")
-            usb_toneusb = srrdata['usb_toneusb']
-            lsb_toneusb = srrdata['lsb_toneusb']
-            usb_tonelsb = srrdata['usb_tonelsb']
-            lsb_tonelsb = srrdata['lsb_tonelsb']
+    # use one color per lo1 frequency
+    lo1_list = []
+    for lo1_freq, lo2_freq, srrdata in multilo_srrdata:
+        if lo1_freq not in lo1_list:
+            lo1_list.append(lo1_freq)
+
+    for lo1_freq, lo2_freq, srrdata in multilo_srrdata:
+        color = colors[lo1_list.index(lo1_freq) % len(colors)]
+
+        # compute rf frequencies
+        rf_freqs_usb = lo1_freq + lo2_freq + (if_freqs/1e3) # GHz
+        rf_freqs_lsb = lo1_freq - lo2_freq - (if_freqs/1e3) # GHz
+
+        # get data
+        usb_toneusb = srrdata['usb_toneusb']
+        lsb_toneusb = srrdata['lsb_toneusb']
+        usb_tonelsb = srrdata['usb_tonelsb']
+        lsb_tonelsb = srrdata['lsb_tonelsb']
     
-            # compute power levels
-            pow_usb_toneusb = cd.scale_and_dBFS_specdata(usb_toneusb, acc_len, dBFS)
-            pow_usb_tonelsb = cd.scale_and_dBFS_specdata(usb_tonelsb, acc_len, dBFS)
-            pow_lsb_toneusb = cd.scale_and_dBFS_specdata(lsb_toneusb, acc_len, dBFS)
-            pow_lsb_tonelsb = cd.scale_and_dBFS_specdata(lsb_tonelsb, acc_len, dBFS)
-
-            # compute SRR
-            srr_usb = usb_toneusb / lsb_toneusb
-            srr_lsb = lsb_tonelsb / usb_tonelsb
-
-            # plot power levels signal
-            ax1.plot(rf_freqs_usb, pow_usb_toneusb, color=color)
-            ax1.plot(rf_freqs_lsb, pow_lsb_tonelsb, color=color)
-
-            # plot power levels image
-            ax2.plot(rf_freqs_usb, pow_usb_tonelsb, color=color)
-            ax2.plot(rf_freqs_lsb, pow_lsb_toneusb, color=color)
-
-            # plot SRR
-            ax3.plot(rf_freqs_usb, 10*np.log10(srr_usb), color=color)
-            ax3.plot(rf_freqs_lsb, 10*np.log10(srr_lsb), color=color)
-            
+        # compute power levels
+        pow_usb_toneusb = cd.scale_and_dBFS_specdata(usb_toneusb, acc_len, dBFS)
+        pow_usb_tonelsb = cd.scale_and_dBFS_specdata(usb_tonelsb, acc_len, dBFS)
+        pow_lsb_toneusb = cd.scale_and_dBFS_specdata(lsb_toneusb, acc_len, dBFS)
+        pow_lsb_tonelsb = cd.scale_and_dBFS_specdata(lsb_tonelsb, acc_len, dBFS)
+
+        # compute SRR
+        srr_usb = usb_toneusb / lsb_toneusb
+        srr_lsb = lsb_tonelsb / usb_tonelsb
+
+        # plot power levels signal
+        ax1.plot(rf_freqs_usb, pow_usb_toneusb, color=color)
+        ax1.plot(rf_freqs_lsb, pow_lsb_tonelsb, color=color)
+
+        # plot power levels image
+        ax2.plot(rf_freqs_usb, pow_usb_tonelsb, color=color)
+        ax2.plot(rf_freqs_lsb, pow_lsb_toneusb, color=color)
+
+        # plot SRR
+        ax3.plot(rf_freqs_usb, 10*np.log10(srr_usb), color=color)
+        ax3.plot(rf_freqs_lsb, 10*np.log10(srr_lsb), color=color)
+        
     # print figures
-    fig1.savefig(srr_datadir+'/power_lev_sig.pdf')
-    fig2.savefig(srr_datadir+'/power_lev_img.pdf')
-    fig3.savefig(srr_datadir+'/srr_digital.pdf')
+    fig1.savefig(datadir+'/power_lev_sig.pdf')
+    fig2.savefig(datadir+'/power_lev_img.pdf')
+    fig3.savefig(datadir+'/srr_digital.pdf')
+    for fig in [fig1, fig2, fig3]:
+        plt.close(fig)
 
 def compress_data(datadir):
     """
@@ -9,6 +9,8 @@ import os, time, tarfile, shutil, json
 import numpy as np
 import matplotlib.pyplot as plt
 import calandigital as cd
+from instrument_group import InstrumentGroup
+from lo_scheduler import make_schedule, save_schedule
 from dss_multilo_parameters import *
 
 def main():
@@ -28,12 +30,15 @@ def make_pre_measurements_actions():
     - setting initial registers in FPGA
     - turning on generator power
     """
-    global roach, lo1_generator, lo2_generator, chopper, fig, lines
+    global roach, lo1_generator, lo2_generator, chopper, instruments
+    global fig, lines
 
-    roach = cd.initialize_roach(roach_ip)
+    roach = initialize_roach(roach_ip)
     lo1_generator = rm.open_resource(lo1_generator_name)
     lo2_generator = rm.open_resource(lo2_generator_name)
     chopper       = rm.open_resource(chopper_name)
+    instruments   = InstrumentGroup({'lo1' : lo1_generator, 
+        'lo2' : lo2_generator}, instr_timeouts)
 
     print("Setting up plotting and data saving elements...")
     if show_plots:
@@ -50,11 +55,10 @@ def make_pre_measurements_actions():
     print("done")
     
     print("Setting instruments power and outputs...")
-    lo1_generator.write("power " + str(lo1_power))
-    lo1_generator.write("freq mult " + str(lo1_mult))
-    lo2_generator.write("power " + str(lo2_power))
-    lo1_generator.write("outp on")
-    lo2_generator.write("outp on")
+    instruments.write({
+        'lo1' : ["power " + str(lo1_power), "freq:mult " + str(lo1_mult),
+                 "outp on"],
+        'lo2' : ["power " + str(lo2_power), "outp on"]})
     print("done")
     
     print("Initialize chopper...")
@@ -65,26 +69,40 @@ def make_dss_multilo_measurements():
     """
     Makes the hot cold measurements for dss with multiple LOs.
     """
-    for lo1_freq in lo1_freqs:
-        # set lo1 frequency
-        lo1_generator.ask("freq " + str(lo1_freq) + " ghz; *opc?")
+    schedule = []
+    lo_schedule, _, lo_time = make_schedule(lo1_freqs, lo2_freqs, 
+        if_freqs/1e3, lo1_cost, lo2_cost, schedule_retunes)
+    print("Estimated LO retune time: " + str(int(lo_time)) + "[s]")
+    lo1_current = None; lo2_current = None
+    for lo1_freq, lo2_freq in lo_schedule:
+        # set in parallel the lo frequencies that change
+        commands = {}
+        if lo1_freq != lo1_current:
+            commands['lo1'] = "freq " + str(lo1_freq) + " ghz"
+        if lo2_freq != lo2_current:
+            commands['lo2'] = "freq " + str(lo2_freq) + " ghz"
+        retune_time = time.time()
+        instruments.set_and_wait(commands)
+        lo1_current = lo1_freq; lo2_current = lo2_freq
+        retune_time = time.time() - retune_time
+
+        # print setting
+        print("Current LOs: LO1:" + str(lo1_freq) + "GHz," +
+                          " LO2:" + str(lo2_freq) + "GHz")
         
-        for lo2_freq in lo2_freqs:
-            # set lo2 frequency
-            lo2_generator.ask("freq " + str(lo2_freq) + "ghz; *opc?")
+        # make measurement subdirectory
+        measname = "lo1_" + str(lo1_freq) + "ghz_lo2_" + \
+                            str(lo2_freq) + "ghz"
+        measdir = hotcold_datadir + "/" + measname
+        os.mkdir(measdir)
+        
+        # make measurement
+        make_dss_measurements(measdir)
 
-            # print setting
-            print("Current LOs: LO1:" + str(lo1_freq) + "GHz," +
-                              " LO2:" + str(lo2_freq) + "GHz")
-            
-            # make measurement subdirectory
-            measname = "lo1_" + str(lo1_freq) + "ghz_lo2_" + \
-                                str(lo2_freq) + "ghz"
-            measdir = hotcold_datadir + "/" + measname
-            os.mkdir(measdir)
-            
-            # make measurement
-            make_dss_measurements(measdir)
+        # record the achieved schedule
+        schedule.append({"lo1 ghz" : float(lo1_freq), 
+            "lo2 ghz" : float(lo2_freq), "lo retune time s" : retune_time})
+        save_schedule(hotcold_datadir + "/testinfo.json", schedule, lo_time)
 
     print_multilo_data()
 
@@ -95,8 +113,8 @@ def make_post_measurements_actions():
     - compress data
     """
     print("Turning off instruments...")
-    lo1_generator.write("outp off")
-    lo2_generator.write("outp off")
+    instruments.write({'lo1' : "outp off", 'lo2' : "outp off"})
+    instruments.close()
     print("done")
 
     print("Compressing data...")
@@ -144,6 +162,7 @@ def make_data_directory():
     testinfo["bandwidth mhz"]      = bandwidth
     testinfo["nchannels"]          = nchannels
     testinfo["acc len"]            = acc_len
+    testinfo["schedule retunes"]   = schedule_retunes
     testinfo["lo1 generator name"] = lo1_generator_name
     testinfo["lo2 generator name"] = lo2_generator_name
     testinfo["lo1 freqs ghz"]      = str(lo1_freqs)
@@ -1,9 +1,21 @@
 #!/usr/bin/python
-import argparse, tarfile, time
+import os, sys, argparse, time
 import numpy as np
 import calandigital as cd
+# shared modules (bram_io, live_plot, etc.)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    "..", "..", "..", "..", "Common_Scripts"))
+from consts_cache import ConstsCache, consts_key, consts2blobs
+from bram_io import BramWriter
+from cal_interp import caldata2consts
+from consts_interp import parse_measname, get_calibrated_los, interp_lo_consts
 from dss_multilo_parameters import *
 
+consts_cache = ConstsCache(consts_cache_dir, consts_cache_size)
+bram_writer  = BramWriter(consts_nbits)
+lo_consts    = {} # constants of the calibrated LO settings of an archive, 
+                  # used to interpolate the rest: {archive : {lo : consts}}
+
 if __name__ == '__main__':
     # if used as main script, read command line argmuments 
     # and starts roach communication
@@ -23,54 +35,82 @@ if __name__ == '__main__':
     roach = cd.initialize_roach(args.ip, boffile=args.boffile, upload=args.upload)
     bm_load_constants(roach, args.caltar, args.caldir)
 
-def dss_load_constants(roach, caldir):
+def dss_load_constants(roach, calarch, caldir, roach_pool=None):
     """
     Load load digital sideband separation constants.
     :param roach: FpgaClient object to communicate with roach.
-    :param caldir: directory with the calibration data.
+    :param calarch: DataArchive with the calibration data.
+    :param caldir: directory with the calibration data within the archive.
+        If the LO setting of the directory was not calibrated, and interp_los
+        is True, the constants are interpolated from the calibrated settings.
+    :param roach_pool: RoachPool used to write the constant brams 
+        concurrently. If None, roach is used.
     """
-    consts_lsb, consts_usb = compute_consts(caldir)
+    if not interp_los or caldir + "/caldata.npz" in calarch.names():
+        key = consts_key(calarch.archive, caldir, consts_nbits, consts_binpt)
+        blobs = consts_cache.load(key, 
+            lambda: get_consts_blobs(*compute_consts(calarch, caldir)))
+    else:
+        print("LO setting " + caldir + " not calibrated, using interpolated "
+            "constants.")
+        key = consts_key(calarch.archive, caldir + " interp", consts_nbits, 
+            consts_binpt)
+        blobs = consts_cache.load(key, 
+            lambda: get_consts_blobs(*compute_interp_consts(calarch, caldir)))
 
-    load_comp_constants(roach, consts_usb, bram_consts_usb_re, bram_consts_usb_im)
-    load_comp_constants(roach, consts_lsb, bram_consts_lsb_re, bram_consts_lsb_im)
+    bram_writer.write(roach, blobs, roach_pool, consts_diff_upload)
 
-def compute_consts(caldir):
+def compute_consts(calarch, caldir):
     """
     Compute constants using tone calibration info.
-    :param caldir: calibration directory.
+    :param calarch: calibration DataArchive.
+    :param caldir: calibration directory within the archive.
     :return: calibration constants.
     """
-    caldata = np.load(caldir+'/caldata.npz')
-    
-    # get arrays
-    a2_toneusb = caldata['a2_toneusb']; a2_tonelsb = caldata['a2_tonelsb']
-    b2_toneusb = caldata['b2_toneusb']; b2_tonelsb = caldata['b2_tonelsb']
-    ab_toneusb = caldata['ab_toneusb']; ab_tonelsb = caldata['ab_tonelsb']
+    caldata = calarch.load_npz(caldir+'/caldata.npz')
 
-    # consts usb are computed with tone in lsb, because you want to cancel out 
-    # lsb, the same for consts lsb
-    consts_usb =         -1 * ab_tonelsb  / b2_tonelsb #  ab*   / bb* = a/b
-    consts_lsb = -1 * np.conj(ab_toneusb) / a2_toneusb # (ab*)* / aa* = a*b / aa* = b/a
+    return caldata2consts(caldata)
+
+def compute_interp_consts(calarch, caldir):
+    """
+    Compute the constants of a LO setting that was not calibrated, by 
+    interpolation of the constants of the calibrated LO settings.
+    :param calarch: calibration DataArchive.
+    :param caldir: calibration directory of the LO setting (it must be a 
+        measurement name, e.g. 'lo1_405ghz_lo2_4ghz').
+    :return: calibration constants.
+    """
+    lo_freqs = parse_measname(caldir)
+    if lo_freqs is None:
+        raise Exception("No calibration data for " + caldir + ".")
+    if calarch.archive not in lo_consts:
+        calibrated_los = get_calibrated_los(calarch)
+        if len(calibrated_los) == 0:
+            raise Exception("No calibrated LO settings in " + 
+                calarch.archive + ".")
+        lo_consts.clear()
+        lo_consts[calarch.archive] = dict((lo, compute_consts(calarch, 
+            measname)) for lo, measname in calibrated_los.items())
+    calibrated_consts = lo_consts[calarch.archive]
+
+    consts_lsb = interp_lo_consts(lo_freqs, dict((lo, consts[0]) 
+        for lo, consts in calibrated_consts.items()))
+    consts_usb = interp_lo_consts(lo_freqs, dict((lo, consts[1]) 
+        for lo, consts in calibrated_consts.items()))
 
     return consts_lsb, consts_usb
 
-def load_comp_constants(roach, consts, bram_re, bram_im):
+def get_consts_blobs(consts_lsb, consts_usb):
     """
-    Load complex constants into ROACH bram. Real and imaginary parts
-    are loaded in separated bram blocks.
-    :param roach: FpgaClient object to communicate with roach
-    :param consts: complex constants array.
-    :param bram_re: bram block name for real part.
-    :param bram_im: bram block name for imaginary part.
+    Convert the constants of both sidebands into the fixed point data of
+    the ROACH constant brams.
+    :param consts_lsb: constants where LSB is maximized.
+    :param consts_usb: constants where USB is maximized.
+    :return: dictionary with the data of every bram as bytes.
     """
-    # separate real and imaginary
-    consts_re = np.real(consts)
-    consts_im = np.imag(consts)
-
-    # convert data into fixed point representation
-    consts_re_fixed = cd.float2fixed(consts_re, consts_nbits, consts_binpt, warn=True)
-    consts_im_fixed = cd.float2fixed(consts_im, consts_nbits, consts_binpt, warn=True)
+    blobs = consts2blobs(consts_usb, bram_consts_usb_re, bram_consts_usb_im, 
+        consts_nbits, consts_binpt)
+    blobs.update(consts2blobs(consts_lsb, bram_consts_lsb_re, 
+        bram_consts_lsb_im, consts_nbits, consts_binpt))
 
-    # load data
-    cd.write_interleaved_data(roach, bram_re, consts_re_fixed)
-    cd.write_interleaved_data(roach, bram_im, consts_im_fixed)
+    return blobs
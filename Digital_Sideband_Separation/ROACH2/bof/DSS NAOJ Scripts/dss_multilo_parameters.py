@@ -1,8 +1,12 @@
 # File with all the basic parameters for multi LO scripts
 
 # imports
-import datetime, pyvisa
+import os, sys, datetime, pyvisa
+import calandigital as cd
 import numpy as np
+# shared modules (bram_io, live_plot, etc.)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    "..", "..", "..", "..", "Common_Scripts"))
 
 # communication parameters
 roach_ip           = '133.40.220.2'
@@ -13,7 +17,9 @@ lo2_generator_name = "GPIB0::5::INSTR"
 rf_generator_name  = "GPIB0::11::INSTR"
 chopper_name       = "GPIB0::1::INSTR"
 rm = pyvisa.ResourceManager('@py')
-#rm = pyvisa.ResourceManager('@sim')
+#rm = pyvisa.ResourceManager('dss_instruments_sim.yaml@sim')
+instr_timeouts     = {'lo1' : 10000, 'lo2' : 10000, 'rf' : 10000} # ms, 
+                     # response timeout of each instrument (*opc? included)
 
 # model parameters
 adc_bits           = 8
@@ -21,12 +27,20 @@ bandwidth          = 1080 # MHz
 cal_acc_len_reg    = 'cal_acc_len'
 syn_acc_len_reg    = 'syn_acc_len'
 cnt_rst_reg        = 'cnt_rst'
+acc_cnt_reg        = None # accumulation counter register (None to detect new
+                          # accumulations from the spectra data)
 bram_addr_width    = 8  # bits
 bram_word_width    = 64 # bits
 pow_data_type      = '>u8'
 crosspow_data_type = '>i8'
 consts_nbits       = 32
 consts_binpt       = 27
+consts_cache_dir   = 'consts_cache' # fixed point constants cache directory
+consts_cache_size  = 64 # number of constant sets kept in the cache
+consts_diff_upload = True # only write the constant words that changed since
+                          # the last load
+nconnections       = 4 # katcp connections used to read bram groups 
+                       # concurrently (1 for serial reads)
 delay_regs         = ['adc0_delay', 'adc1_delay']
 bram_a2    = ['dout_a2_0', 'dout_a2_1', 'dout_a2_2', 'dout_a2_3', 
               'dout_a2_4', 'dout_a2_5', 'dout_a2_6', 'dout_a2_7']
@@ -72,6 +86,9 @@ lo1_mult        = 18
 
 #lo2_freqs       = np.arange(4, 20, 1) # GHz
 lo2_freqs       = [4] # GHz
+cal_lo_steps    = (1, 1) # calibrate every n-th lo1 and lo2 frequency (the 
+                         # last ones are always calibrated), the constants of
+                         # the rest are interpolated
 lo1_power       = 18 # dBm
 lo2_power       = 16 # dBm
 rf_mult         = 18
@@ -86,20 +103,96 @@ hotcold_datadir = "dss_hotcold " + date_time
 pause_time      = 0.5 # should be > (1/bandwidth * FFT_size * acc_len * 2) in 
                       # order  for the spectra to be fully computed after a 
                       # tone change
+rawdata_step    = 16 # full spectra are read and saved every rawdata_step 
+                     # tones for debugging (0 to only read the tone channels)
+wait_accs       = True # poll the ROACH for new accumulations after a tone 
+                       # change instead of always waiting pause_time (used as
+                       # timeout)
+interp_method     = 'spline' # interpolation of the calibration data between
+                             # tones: 'linear' (raw complex data), 'spline'
+                             # (cubic splines of magnitude and unwrapped
+                             # phase) or 'poly' (delay plus polynomial fit)
+interp_degree     = 5 # polynomial degree of the 'poly' interpolation
+interp_srr_target = 40 # dB, warn if the SRR allowed by the interpolation is
+                       # estimated lower (then use a smaller chnl_step)
 load_consts     = True
+interp_los      = True # interpolate the constants of the LO settings that 
+                       # are not in the calibration archive
 #caltar          = 'dss_cal 2020-03-24 14:09:21.tar.gz'
 caltar          = open('last_caltar.txt', 'r').read().rstrip()
 show_plots      = True
+print_reports   = True # print .pdf reports of the data (False to print them
+                       # later on demand with dss_print_reports.py)
+report_nprocs   = 4 # processes used to print the .pdf reports in parallel 
+                    # with the measurement (0 to print them in the main 
+                    # process)
+schedule_retunes = True # order the LO settings and tone sweeps to reduce the
+                        # synthesizers retune time (False for nested LO loops
+                        # and ascending usb then lsb sweeps)
+lo1_settle_time = 1.0 # s, lo1 settle time after a frequency change
+lo2_settle_time = 0.2 # s, lo2 settle time after a frequency change
+lo1_relock_time = 5.0 # s, extra lo1 time when changing synthesizer band
+lo2_relock_time = 1.0 # s, extra lo2 time when changing synthesizer band
+lo1_band_edges  = [] # GHz, lo1 frequencies where the synthesizer changes band
+lo2_band_edges  = [] # GHz, lo2 frequencies where the synthesizer changes band
+rf_list_sweep   = False # upload the tones of each sweep to the rf generator
+                        # list memory and step them with triggers (step mode
+                        # is used if the generator doesn't support it). Not
+                        # yet verified with the lab generator
+rf_list_size    = 1601 # maximum number of points of the rf generator list
+phase_trace     = False # write the time of every measurement phase to 
+                        # phase_trace.csv in the data directory (the phase
+                        # statistics are always saved in testinfo.json)
+
+# emulation parameters
+emulate             = False # emulate the ROACH and the generators to run the
+                            # scripts without hardware (roach_emulator.py)
+emulator_time_scale = 1.0 # emulated accumulation time per real time (0 for
+                          # a new accumulation on every read)
+emulator_imbalance  = (1.0, 10.0) # (dB, degrees), analog front end mean
+                                  # magnitude and phase imbalance
+emulator_read_delay = 0.0 # s, emulated katcp latency of every bram read
 
 # derivative parameters
 nchannels     = 2**bram_addr_width * len(bram_a2)
 if_freqs      = np.linspace(0, bandwidth, nchannels, endpoint=False) # MHz
 test_channels = range(1, nchannels, chnl_step)
+nsnapshots    = len(test_channels[::rawdata_step]) if rawdata_step > 0 else 0
 sync_channels = range(1, nchannels, chnl_step_sync)
 if_test_freqs = if_freqs[test_channels] # MHz
 if_sync_freqs = if_freqs[sync_channels] # MHz
 dBFS          = 6.02*adc_bits + 1.76 + 10*np.log10(nchannels)
+cal_lo1_freqs = list(lo1_freqs[::cal_lo_steps[0]]) + ([lo1_freqs[-1]] if 
+                (len(lo1_freqs)-1) % cal_lo_steps[0] else []) # GHz
+cal_lo2_freqs = list(lo2_freqs[::cal_lo_steps[1]]) + ([lo2_freqs[-1]] if 
+                (len(lo2_freqs)-1) % cal_lo_steps[1] else []) # GHz
+lo1_cost      = (lo1_settle_time, lo1_relock_time, lo1_band_edges)
+lo2_cost      = (lo2_settle_time, lo2_relock_time, lo2_band_edges)
 
 # stability parameters
 stab_chnl    = 1537
 stab_datadir = "dss_stab " + date_time
+
+# emulated ROACH and instruments
+if emulate:
+    from roach_emulator import DssEmulator
+    emulator = DssEmulator({'a2' : bram_a2, 'b2' : bram_b2, 
+        'ab_re' : bram_ab_re, 'ab_im' : bram_ab_im, 
+        'usb' : bram_usb, 'lsb' : bram_lsb,
+        'consts_usb_re' : bram_consts_usb_re, 
+        'consts_usb_im' : bram_consts_usb_im,
+        'consts_lsb_re' : bram_consts_lsb_re, 
+        'consts_lsb_im' : bram_consts_lsb_im},
+        nchannels, bandwidth, adc_bits, pow_data_type, crosspow_data_type,
+        rf_generator_name, [lo1_freqs[0], lo2_freqs[0]], 
+        [lo1_generator_name, lo2_generator_name], consts_nbits=consts_nbits,
+        consts_binpt=consts_binpt,
+        cal_acc_len_reg=cal_acc_len_reg, syn_acc_len_reg=syn_acc_len_reg,
+        cnt_rst_reg=cnt_rst_reg, acc_cnt_reg=acc_cnt_reg, acc_len=acc_len,
+        amp_imbalance=emulator_imbalance[0], 
+        phase_imbalance=emulator_imbalance[1],
+        time_scale=emulator_time_scale, read_delay=emulator_read_delay)
+    rm = emulator
+    initialize_roach = emulator.initialize_roach
+else:
+    initialize_roach = cd.initialize_roach
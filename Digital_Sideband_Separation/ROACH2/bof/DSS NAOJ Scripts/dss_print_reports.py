@@ -0,0 +1,97 @@
+#!/usr/bin/python
+# Script to print on demand the .pdf reports of a saved multi LO calibration
+# or srr measurement (e.g. when it was made with print_reports = False). The
+# reports are printed in parallel from the data in the archive, into a
+# directory with the same layout as the original data directory.
+# Usage: ./dss_print_reports.py [archive] (default: last calibration archive)
+
+# imports
+import os, sys, re, time, json
+from report_pool import ReportPool
+# shared modules (bram_io, live_plot, etc.)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    "..", "..", "..", "..", "Common_Scripts"))
+from data_archive import DataArchive
+import dss_calibrate_multilo
+import dss_compute_srr_multilo
+from dss_multilo_parameters import *
+
+def main():
+    start_time = time.time()
+
+    archive = sys.argv[1] if len(sys.argv) > 1 else caltar
+    print("Opening " + archive + "...")
+    datarch = DataArchive(archive)
+    print("done")
+
+    # get measurement type and the data used in the reports
+    names = datarch.names()
+    if any(name.endswith("/caldata.npz") for name in names):
+        script = dss_calibrate_multilo
+        dataname = "caldata.npz"
+        spec_keys = ['a2', 'b2']
+    else:
+        script = dss_compute_srr_multilo
+        dataname = "srrdata.npz"
+        spec_keys = ['usb', 'lsb']
+
+    # use the accumulation length of the measurement
+    if "testinfo.json" in names:
+        testinfo = json.loads(datarch.read("testinfo.json").decode())
+        script.acc_len = testinfo["acc len"]
+
+    datadir = os.path.splitext(datarch.archive)[0] + " reports"
+    report_pool = ReportPool(report_nprocs)
+
+    print("Printing reports to " + datadir + "...")
+    multilo_data = []
+    for name in sorted(names):
+        # get measurements (one per LO setting)
+        match = re.match(r"(lo1_(.*)ghz_lo2_(.*)ghz)/" + dataname + "$", name)
+        if match is None:
+            continue
+        measname = match.group(1)
+        lo1_freq = float(match.group(2)); lo2_freq = float(match.group(3))
+        measdir  = datadir + "/" + measname
+        data     = dict(datarch.load_npz(name))
+        multilo_data.append((lo1_freq, lo2_freq, data))
+
+        # print single LO data
+        for tone_sideband in ['usb', 'lsb']:
+            mkdir(measdir + "/rawdata_tone_" + tone_sideband)
+        report_pool.submit(script.print_singlelo_data, measdir, data)
+
+        # print saved spectra
+        for tone_sideband in ['usb', 'lsb']:
+            rawdata_name = measname + "/rawdata_tone_" + tone_sideband
+            if rawdata_name + "/chnls.npy" not in names:
+                continue
+            chnls = datarch.load_npz(rawdata_name + "/chnls.npy")
+            spectra = [datarch.load_npz(rawdata_name + "/" + key + ".npy")
+                for key in spec_keys]
+            for row, chnl in enumerate(chnls):
+                if chnl < 0:
+                    continue
+                report_pool.submit(script.print_spec_data,
+                    datadir + "/" + rawdata_name, chnl,
+                    spectra[0][row], spectra[1][row])
+
+    # print multi LO data
+    multilo_data.sort(key=lambda lo_data: (lo_data[0], lo_data[1]))
+    report_pool.submit(script.print_multilo_data, datadir, multilo_data)
+    report_pool.close()
+    datarch.close()
+    print("done")
+
+    print("Finished. Total time: " + str(int(time.time() - start_time)) + "[s]")
+
+def mkdir(dirname):
+    """
+    Make a directory and its parents if they do not exist.
+    :param dirname: directory to make.
+    """
+    if not os.path.exists(dirname):
+        os.makedirs(dirname)
+
+if __name__ == '__main__':
+    main()
@@ -3,11 +3,15 @@
 # multiple LO values and multiple LO stages.
 
 # imports
-import os, time, tarfile, shutil, json
+import os, sys, time, tarfile, shutil, json
 import numpy as np
 import matplotlib.pyplot as plt
 import calandigital as cd
 from dss_load_constants import dss_load_constants
+# shared modules (bram_io, live_plot, etc.)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    "..", "..", "..", "..", "Common_Scripts"))
+from data_archive import DataArchive
 from dss_multilo_parameters import *
 
 def main():
@@ -26,7 +30,7 @@ def make_pre_measurements_actions():
     """
     global roach, rf_generator, lo1_generator, lo2_generator, fig, lines, axes
 
-    roach = cd.initialize_roach(roach_ip)
+    roach = initialize_roach(roach_ip)
     lo1_generator = rm.open_resource(lo1_generator_name)
     lo2_generator = rm.open_resource(lo2_generator_name)
     rf_generator  = rm.open_resource(rf_generator_name)
@@ -73,12 +77,9 @@ def make_dss_stability_measurements():
     # load constants
     measname = "lo1_" + str(lo1_freq) + "ghz_lo2_" + \
                         str(lo2_freq) + "ghz"
-    print("Extracting compressed calibration data...")
-    caldir = caltar[:-7]
-    tarfile.open(caltar).extractall(path=caldir)
-    print("done.")
-    dss_load_constants(roach, caldir + "/" + measname)
-    shutil.rmtree(caldir)
+    calarch = DataArchive(caltar)
+    dss_load_constants(roach, calarch, measname)
+    calarch.close()
 
     # plot stability data
     plot_stability_data()
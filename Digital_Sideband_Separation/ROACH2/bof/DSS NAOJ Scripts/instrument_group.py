@@ -0,0 +1,115 @@
+# Group of pyvisa instruments commanded in parallel. Commands to different
+# instruments are independent, so they are sent from one thread per
+# instrument and the *opc? completions are awaited in parallel. E.g. when
+# changing the LOs, both LO synthesizers and the RF generator settle at the
+# same time instead of one after the other. Commands to the same instrument
+# are always sent in order.
+
+# imports
+from multiprocessing.pool import ThreadPool
+
+class InstrumentGroup(object):
+    """
+    Named pyvisa instruments (e.g. {'lo1' : lo1_generator, ...}) with a
+    worker thread each. The methods take a dictionary with the commands of
+    every instrument ({name : command} or {name : [command, ...]}), and
+    return when all the instruments are done.
+    """
+    def __init__(self, instruments, timeouts=None):
+        """
+        :param instruments: dictionary with the pyvisa resources of the
+            instruments.
+        :param timeouts: dictionary with the response timeout of each
+            instrument (ms). Instruments not in the dictionary keep the pyvisa
+            default timeout, and timeouts of other instruments are ignored.
+        """
+        self.instruments = instruments
+        for name, timeout in (timeouts or {}).items():
+            if name in instruments:
+                instruments[name].timeout = timeout
+        self.pool = ThreadPool(len(instruments))
+
+    def write(self, commands):
+        """
+        Write commands to the instruments in parallel.
+        :param commands: dictionary with the commands of every instrument.
+        """
+        self.run(write_commands, commands)
+
+    def query(self, commands):
+        """
+        Query the instruments in parallel.
+        :param commands: dictionary with the commands of every instrument.
+        :return: dictionary with the responses of every instrument (the
+            response of the last command if there are many).
+        """
+        return self.run(query_commands, commands)
+
+    def set_and_wait(self, commands):
+        """
+        Send setting commands (e.g. "freq 405 ghz") to the instruments in
+        parallel, and wait until all the instruments complete their
+        operations (*opc?).
+        :param commands: dictionary with the commands of every instrument.
+        """
+        opc_commands = {}
+        for name, command_list in commands.items():
+            if isinstance(command_list, str):
+                command_list = [command_list]
+            opc_commands[name] = [command + "; *opc?" for command in
+                command_list]
+        self.query(opc_commands)
+
+    def run(self, func, commands):
+        """
+        Run a command function of every instrument in its worker thread.
+        :param func: function with (instrument, command list) arguments.
+        :param commands: dictionary with the commands of every instrument.
+        :return: dictionary with the return value of every instrument.
+        """
+        results = {}
+        for name, command_list in commands.items():
+            if isinstance(command_list, str):
+                command_list = [command_list]
+            results[name] = self.pool.apply_async(func,
+                (self.instruments[name], command_list))
+
+        # get every result, so that all the instruments finish before an
+        # error is raised
+        responses = {}; errors = []
+        for name, result in results.items():
+            try:
+                responses[name] = result.get()
+            except Exception as e:
+                errors.append(name + ": " + repr(e))
+        if errors:
+            raise Exception("Instrument error. " + ", ".join(errors))
+
+        return responses
+
+    def close(self):
+        """
+        Stop the worker threads. The instruments are not closed.
+        """
+        self.pool.close()
+        self.pool.join()
+
+def write_commands(instrument, command_list):
+    """
+    Write a list of commands to an instrument.
+    :param instrument: pyvisa resource.
+    :param command_list: list of commands.
+    """
+    for command in command_list:
+        instrument.write(command)
+
+def query_commands(instrument, command_list):
+    """
+    Query a list of commands to an instrument.
+    :param instrument: pyvisa resource.
+    :param command_list: list of commands.
+    :return: response of the last command.
+    """
+    for command in command_list:
+        response = instrument.query(command)
+    return response
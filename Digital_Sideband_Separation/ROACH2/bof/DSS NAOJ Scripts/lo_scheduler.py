@@ -0,0 +1,196 @@
+# Scheduler of the frequency settings of a multi LO measurement. Retuning a
+# synthesizer takes a settle time, plus a relock time when the new frequency
+# is in a different band of the synthesizer (e.g. a different multiplier or
+# YIG band). The scheduler orders the LO settings to reduce the total retune
+# time, and chooses the order of the sideband tone sweeps of every LO setting
+# so that the RF generator makes the smallest possible jumps.
+
+# imports
+import bisect, json
+
+def make_schedule(lo1_freqs, lo2_freqs, if_test_freqs, lo1_cost, lo2_cost,
+    enabled=True):
+    """
+    Make the schedule of a multi LO measurement.
+    :param lo1_freqs: lo1 frequencies (GHz).
+    :param lo2_freqs: lo2 frequencies (GHz).
+    :param if_test_freqs: IF frequencies of the test tones (GHz).
+    :param lo1_cost: (settle time, relock time, band edges) of lo1, see
+        retune_time.
+    :param lo2_cost: (settle time, relock time, band edges) of lo2.
+    :param enabled: if False, the LO settings are in nested loop order (lo1
+        outer), and the sweeps are usb then lsb in ascending IF order.
+    :return: LO schedule (list of (lo1 freq, lo2 freq) tuples), sweeps
+        schedule (see schedule_sweeps), and estimated total retune time of the
+        LOs (s).
+    """
+    if enabled:
+        lo_schedule, lo_time = schedule_los(lo1_freqs, lo2_freqs, lo1_cost,
+            lo2_cost)
+        sweeps_schedule = schedule_sweeps(lo_schedule, if_test_freqs)
+    else:
+        lo_schedule = [(lo1_freq, lo2_freq) for lo1_freq in lo1_freqs
+            for lo2_freq in lo2_freqs]
+        lo_time = schedule_time(lo_schedule, lo1_cost, lo2_cost)
+        sweeps_schedule = [[('usb', True), ('lsb', True)]] * len(lo_schedule)
+
+    return lo_schedule, sweeps_schedule, lo_time
+
+def retune_time(freq0, freq1, settle_time, relock_time, band_edges):
+    """
+    Estimate the time needed to retune a synthesizer.
+    :param freq0: current frequency. None if the synthesizer is not tuned yet.
+    :param freq1: new frequency.
+    :param settle_time: time to settle after a frequency change (s).
+    :param relock_time: extra time when the synthesizer changes band (s).
+    :param band_edges: sorted list of the frequencies where the synthesizer
+        changes band.
+    :return: retune time (s).
+    """
+    if freq0 is None:
+        return settle_time + relock_time
+    if freq0 == freq1:
+        return 0
+    if bisect.bisect_right(band_edges, freq0) != \
+       bisect.bisect_right(band_edges, freq1):
+        return settle_time + relock_time
+    return settle_time
+
+def serpentine(outer_freqs, inner_freqs):
+    """
+    Order a grid of frequencies in serpentine order: the outer frequencies
+    are swept in ascending order, and the inner frequencies alternate
+    between ascending and descending order, so that the inner synthesizer
+    never jumps back to the start of its range.
+    :param outer_freqs: frequencies of the outer (less retuned) synthesizer.
+    :param inner_freqs: frequencies of the inner synthesizer.
+    :return: list of (outer freq, inner freq) tuples.
+    """
+    grid = []
+    inner_freqs = sorted(inner_freqs)
+    for i, outer_freq in enumerate(sorted(outer_freqs)):
+        inner_order = inner_freqs if i % 2 == 0 else inner_freqs[::-1]
+        grid += [(outer_freq, inner_freq) for inner_freq in inner_order]
+
+    return grid
+
+def schedule_los(lo1_freqs, lo2_freqs, lo1_cost, lo2_cost):
+    """
+    Order the LO settings of a multi LO measurement in serpentine order. The
+    LO with the highest estimated total retune time is used as the outer
+    (less retuned) synthesizer.
+    :param lo1_freqs: lo1 frequencies.
+    :param lo2_freqs: lo2 frequencies.
+    :param lo1_cost: (settle time, relock time, band edges) of lo1, see
+        retune_time.
+    :param lo2_cost: (settle time, relock time, band edges) of lo2.
+    :return: list of (lo1 freq, lo2 freq) tuples, and estimated total retune
+        time of the LOs (s).
+    """
+    # lo1 as outer synthesizer
+    lo1_outer = serpentine(lo1_freqs, lo2_freqs)
+    # lo2 as outer synthesizer
+    lo2_outer = [(lo1_freq, lo2_freq) for lo2_freq, lo1_freq in
+        serpentine(lo2_freqs, lo1_freqs)]
+
+    schedules = [(schedule_time(schedule, lo1_cost, lo2_cost), schedule)
+        for schedule in [lo1_outer, lo2_outer]]
+    total_time, schedule = min(schedules, key=lambda s: s[0])
+
+    return schedule, total_time
+
+def schedule_time(lo_schedule, lo1_cost, lo2_cost):
+    """
+    Estimate the total retune time of a LO schedule.
+    :param lo_schedule: list of (lo1 freq, lo2 freq) tuples.
+    :param lo1_cost: (settle time, relock time, band edges) of lo1.
+    :param lo2_cost: (settle time, relock time, band edges) of lo2.
+    :return: total retune time (s).
+    """
+    total_time = 0
+    lo1_prev = None; lo2_prev = None
+    for lo1_freq, lo2_freq in lo_schedule:
+        total_time += retune_time(lo1_prev, lo1_freq, *lo1_cost)
+        total_time += retune_time(lo2_prev, lo2_freq, *lo2_cost)
+        lo1_prev = lo1_freq; lo2_prev = lo2_freq
+
+    return total_time
+
+def schedule_sweeps(lo_schedule, if_test_freqs):
+    """
+    Choose the order of the sideband tone sweeps of every LO setting. For
+    every LO setting, the sideband that is swept first and the direction of
+    each sweep (ascending or descending IF) are chosen to minimize the RF
+    jumps from the end of the previous sweep. The USB tones are at
+    lo1+lo2+if, and the LSB tones at lo1-lo2-if.
+    :param lo_schedule: list of (lo1 freq, lo2 freq) tuples (GHz).
+    :param if_test_freqs: IF frequencies of the test tones (GHz).
+    :return: list of the sweeps of every LO setting. The sweeps of a LO
+        setting are a list of (sideband, ascending) tuples, where ascending
+        is True if the sweep goes from the lowest to the highest IF.
+    """
+    if_min = min(if_test_freqs); if_max = max(if_test_freqs)
+    rf_prev = None
+    sweeps_schedule = []
+    for lo1_freq, lo2_freq in lo_schedule:
+        # rf frequencies at the ends of each sweep (lowest IF, highest IF)
+        rf_ends = {'usb' : (lo1_freq + lo2_freq + if_min,
+                            lo1_freq + lo2_freq + if_max),
+                   'lsb' : (lo1_freq - lo2_freq - if_min,
+                            lo1_freq - lo2_freq - if_max)}
+
+        best = None
+        for sidebands in [['usb', 'lsb'], ['lsb', 'usb']]:
+            sweeps = []; jumps = 0; rf = rf_prev
+            for sideband in sidebands:
+                low_if_rf, high_if_rf = rf_ends[sideband]
+                # start from the sweep end closest to the current rf
+                ascending = rf is None or \
+                    abs(rf - low_if_rf) <= abs(rf - high_if_rf)
+                start_rf, end_rf = (low_if_rf, high_if_rf) if ascending \
+                    else (high_if_rf, low_if_rf)
+                if rf is not None:
+                    jumps += abs(rf - start_rf)
+                sweeps.append((sideband, ascending))
+                rf = end_rf
+            if best is None or jumps < best[0]:
+                best = (jumps, sweeps, rf)
+
+        sweeps_schedule.append(best[1])
+        rf_prev = best[2]
+
+    return sweeps_schedule
+
+def tone_order(ntones, ascending, skip=()):
+    """
+    :param ntones: number of tones of the sweep.
+    :param ascending: True for ascending IF order.
+    :param skip: indices of the tones to leave out (e.g. the tones measured
+        before a resume).
+    :return: list with the indices of the tones in sweep order.
+    """
+    order = [i for i in range(ntones) if i not in skip]
+    return order if ascending else order[::-1]
+
+def save_schedule(filename, schedule, lo_time):
+    """
+    Record the achieved schedule of a measurement in its test info file.
+    :param filename: test info .json file.
+    :param schedule: list with a dictionary per LO setting, in measurement 
+        order, with the LO frequencies, the sweeps and the retune time.
+    :param lo_time: estimated total retune time of the LOs (s).
+    """
+    with open(filename, "r") as f:
+        testinfo = json.load(f)
+    testinfo["schedule"] = schedule
+    testinfo["estimated lo retune time s"] = lo_time
+    with open(filename, "w") as f:
+        json.dump(testinfo, f, indent=4, sort_keys=True)
+
+def sweep_name(sweep):
+    """
+    :param sweep: (sideband, ascending) tuple.
+    :return: description of the sweep, e.g. "usb ascending".
+    """
+    sideband, ascending = sweep
+    return sideband + (" ascending" if ascending else " descending")
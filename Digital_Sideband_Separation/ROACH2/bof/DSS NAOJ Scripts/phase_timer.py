@@ -0,0 +1,128 @@
+# Timing of the phases of a measurement (generator retune, settle wait, bram
+# reads, ratio computation, plotting, disk writes, etc.), to find what
+# dominates the time of long sweeps. Phase times are grouped (e.g. one group
+# per LO setting), and summarized with percentiles. Every phase time can also
+# be written to a .csv trace file as it is measured.
+
+# imports
+import os, time, json, threading
+from contextlib import contextmanager
+import numpy as np
+
+class PhaseTimer(object):
+    """
+    Record of the times of the measurement phases. Phases can be timed from
+    any thread.
+    """
+    def __init__(self, trace_filename=None):
+        """
+        :param trace_filename: .csv file where to write every phase time. If
+            None no trace is written. If the file exists the times are
+            appended.
+        """
+        self.group  = ""
+        self.times  = {}
+        self.lock   = threading.Lock()
+        self.trace  = None
+        if trace_filename is not None:
+            new_file = not os.path.exists(trace_filename)
+            self.trace = open(trace_filename, "a")
+            if new_file:
+                self.trace.write("group,phase,start time,duration s\n")
+
+    def set_group(self, group):
+        """
+        Set the group of the next phase times.
+        :param group: group name (e.g. the LO setting measurement name).
+        """
+        with self.lock:
+            self.group = group
+
+    def add(self, phase, start_time, duration):
+        """
+        Record the time of a phase in the current group.
+        :param phase: phase name.
+        :param start_time: start time of the phase (time.time() value).
+        :param duration: duration of the phase (s).
+        """
+        with self.lock:
+            self.times.setdefault(self.group, {}).setdefault(phase,
+                []).append(duration)
+            if self.trace is not None:
+                self.trace.write(self.group + "," + phase + "," +
+                    repr(start_time) + "," + repr(duration) + "\n")
+
+    @contextmanager
+    def time(self, phase):
+        """
+        Time the code of a with block as a phase.
+        :param phase: phase name.
+        """
+        start_time = time.time()
+        try:
+            yield
+        finally:
+            self.add(phase, start_time, time.time() - start_time)
+
+    def wrap(self, phase, func):
+        """
+        Make a version of a function that is timed as a phase every time it
+        is called (e.g. to time work submitted to other threads).
+        :param phase: phase name.
+        :param func: function to time.
+        :return: timed function.
+        """
+        def timed_func(*args, **kwargs):
+            with self.time(phase):
+                return func(*args, **kwargs)
+        return timed_func
+
+    def summary(self):
+        """
+        :return: dictionary with the statistics of every phase of every
+            group: {group : {phase : {statistic : value}}}.
+        """
+        with self.lock:
+            times = dict((group, dict((phase, list(durations))
+                for phase, durations in phases.items()))
+                for group, phases in self.times.items())
+
+        summary = {}
+        for group, phases in times.items():
+            summary[group] = {}
+            for phase, durations in phases.items():
+                durations = 1e3 * np.array(durations) # ms
+                p50, p90, p99 = np.percentile(durations, [50, 90, 99])
+                summary[group][phase] = {
+                    "count"   : len(durations),
+                    "total s" : float(np.sum(durations)) / 1e3,
+                    "mean ms" : float(np.mean(durations)),
+                    "p50 ms"  : float(p50),
+                    "p90 ms"  : float(p90),
+                    "p99 ms"  : float(p99),
+                    "max ms"  : float(np.max(durations))}
+
+        return summary
+
+    def save(self, filename):
+        """
+        Save the phase statistics in the test info file of the measurement,
+        keeping the statistics of the groups saved before (e.g. of the
+        measurement before a resume).
+        :param filename: test info .json file.
+        """
+        with open(filename, "r") as f:
+            testinfo = json.load(f)
+        testinfo.setdefault("phase times", {}).update(self.summary())
+        with open(filename, "w") as f:
+            json.dump(testinfo, f, indent=4, sort_keys=True)
+        if self.trace is not None:
+            with self.lock:
+                self.trace.flush()
+
+    def close(self):
+        """
+        Close the trace file.
+        """
+        if self.trace is not None:
+            self.trace.close()
@@ -0,0 +1,76 @@
+# Pool of processes to print the .pdf reports of a measurement (spectra,
+# ratios, srr, etc.) while the measurement goes on, so that rendering the
+# images is out of the critical path of the sweeps. The workers render with
+# the non interactive Agg backend. Reports are given the data to plot as
+# arguments, so they can be printed from the in-memory arrays of a running
+# measurement or from the data of a saved archive.
+
+# imports
+import multiprocessing
+import matplotlib.pyplot as plt
+
+class ReportPool(object):
+    """
+    Report functions run in background worker processes. Every report must
+    be a module level function (so that it can be sent to the workers), and
+    its arguments must be picklable (e.g. numpy arrays and strings).
+    """
+    def __init__(self, nprocs):
+        """
+        :param nprocs: number of worker processes. If 0, the reports are
+            printed in the calling process when submitted. The pool should be
+            created before starting other threads.
+        """
+        if nprocs > 0:
+            self.pool = multiprocessing.Pool(nprocs, use_agg_backend)
+        else:
+            self.pool = None
+        self.results = []
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Print a report in a worker process.
+        :param func: report function.
+        """
+        if self.pool is None:
+            func(*args, **kwargs)
+            return
+        self.check_errors()
+        self.results.append(self.pool.apply_async(func, args, kwargs))
+
+    def check_errors(self):
+        """
+        Raise the exception of any failed report and forget the finished
+        reports.
+        """
+        pending = []
+        for result in self.results:
+            if result.ready():
+                result.get()
+            else:
+                pending.append(result)
+        self.results = pending
+
+    def join(self):
+        """
+        Wait for all the submitted reports to be printed.
+        """
+        for result in self.results:
+            result.get()
+        self.results = []
+
+    def close(self):
+        """
+        Wait for all the submitted reports and stop the worker processes.
+        """
+        self.join()
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+
+def use_agg_backend():
+    """
+    Initialization of the worker processes. Use the Agg backend so that no
+    windows are created when printing.
+    """
+    plt.switch_backend('Agg')
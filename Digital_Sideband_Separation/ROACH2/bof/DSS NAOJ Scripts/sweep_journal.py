@@ -0,0 +1,135 @@
+# Checkpoint journal of a multi LO measurement, used to resume a measurement
+# that was interrupted (crash, instrument timeout, etc.). The journal is a
+# text file in the data directory with one JSON entry per line: one entry per
+# measured tone, with the values read in the tone channel, and one entry per
+# finished LO setting. Entries are appended and flushed as the measurement
+# goes on, so an interruption loses at most the tones being measured.
+
+# imports
+import os, glob, json
+
+class SweepJournal(object):
+    """
+    Journal of the measured tones and finished LO settings of a measurement.
+    If the journal file already exists its entries are loaded, so that the
+    measurement can skip what is already done.
+    """
+    def __init__(self, filename):
+        """
+        :param filename: journal file.
+        """
+        self.tones = {}
+        self.done  = set()
+        if os.path.exists(filename):
+            self.load(filename)
+        self.file = open(filename, "a")
+        # terminate a line cut by an interruption
+        if self.file.tell() > 0:
+            with open(filename, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    self.file.write("\n")
+
+    def load(self, filename):
+        """
+        Load the entries of an existing journal file. Incomplete entries
+        (cut by an interruption) are ignored.
+        :param filename: journal file.
+        """
+        with open(filename, "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if "tone" in entry:
+                    key = (entry["meas"], entry["sideband"])
+                    self.tones.setdefault(key, {})[entry["tone"]] = \
+                        entry["values"]
+                elif "done" in entry:
+                    self.done.add(entry["done"])
+
+    def add_tone(self, measname, sideband, i, values):
+        """
+        Record a measured tone.
+        :param measname: name of the LO setting measurement.
+        :param sideband: sideband of the tone sweep.
+        :param i: index of the tone in the sweep.
+        :param values: dictionary with the values read in the tone channel.
+        """
+        self.tones.setdefault((measname, sideband), {})[i] = values
+        self.write({"meas" : measname, "sideband" : sideband, "tone" : i,
+            "values" : values})
+
+    def get_tones(self, measname, sideband):
+        """
+        :param measname: name of the LO setting measurement.
+        :param sideband: sideband of the tone sweep.
+        :return: dictionary with the recorded values of every measured tone
+            of the sweep, indexed by tone index.
+        """
+        return self.tones.get((measname, sideband), {})
+
+    def add_done(self, measname):
+        """
+        Record a finished LO setting measurement (its data is saved).
+        :param measname: name of the LO setting measurement.
+        """
+        self.done.add(measname)
+        self.write({"done" : measname})
+
+    def is_done(self, measname):
+        """
+        :param measname: name of the LO setting measurement.
+        :return: True if the measurement is finished.
+        """
+        return measname in self.done
+
+    def write(self, entry):
+        """
+        Append an entry to the journal file.
+        :param entry: dictionary with the entry data.
+        """
+        self.file.write(json.dumps(entry) + "\n")
+        self.file.flush()
+
+    def close(self):
+        """
+        Close the journal file.
+        """
+        self.file.close()
+
+def find_last_datadir(prefix):
+    """
+    Find the most recent data directory of a kind of measurement (the data
+    directories of finished measurements are compressed, so they are not
+    found).
+    :param prefix: prefix of the data directory name, e.g. "dss_cal ".
+    :return: directory name.
+    """
+    datadirs = sorted(datadir for datadir in glob.glob(prefix + "*")
+        if os.path.isdir(datadir))
+    if len(datadirs) == 0:
+        raise Exception("No data directory to resume with prefix '" +
+            prefix + "'.")
+    return datadirs[-1]
+
+def check_resume_testinfo(saved, current, keys):
+    """
+    Check that the parameters of a resumed measurement are the same as the
+    parameters of the interrupted measurement, so that the tones measured
+    before and after the resume are compatible. Parameters missing in the
+    saved test info (older measurements) are not checked.
+    :param saved: test info of the interrupted measurement.
+    :param current: test info with the current parameters.
+    :param keys: test info keys of the parameters that must match.
+    """
+    # compare the values as saved in the .json file
+    current = json.loads(json.dumps(current))
+    mismatches = [key for key in keys if key in saved and 
+        saved[key] != current.get(key)]
+    if len(mismatches) > 0:
+        raise Exception("Cannot resume, the parameters changed: " +
+            "; ".join(key + " " + str(saved[key]) + " -> " + 
+            str(current.get(key)) for key in mismatches) + 
+            ". Restore them or start a new measurement.")
@@ -1,11 +1,15 @@
 #!/usr/bin/python
 # Script to synchronize the 2 ADC5G of ROACH2 for the specific
 # NAOJ experiment setup.
-import time
+import os, sys, time
 import numpy as np
 import matplotlib.pyplot as plt
 import scipy.stats
 import calandigital as cd
+# shared modules (bram_io, live_plot, etc.)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    "..", "..", "..", "..", "Common_Scripts"))
+from live_plot import LivePlot
 from dss_multilo_parameters import *
 
 def main():
@@ -25,17 +29,18 @@ def make_pre_measurements_actions():
     - setting initial registers in FPGA
     - turning on generator power
     """
-    global roach, rf_generator, lo1_generator, lo2_generator, fig, lines
+    global roach, rf_generator, lo1_generator, lo2_generator, live_plot
+
+    # start the plot process before opening connections
+    print("Setting up plotting elements...")
+    live_plot = LivePlot(create_figure)
+    print("done")
 
     roach = cd.initialize_roach(roach_ip)
     lo1_generator = rm.open_resource(lo1_generator_name)
     lo2_generator = rm.open_resource(lo2_generator_name)
     rf_generator  = rm.open_resource(rf_generator_name)
 
-    print("Setting up plotting elements...")
-    fig, lines = create_figure()
-    print("done")
-
     print("Setting accumulation register to " + str(acc_len) + "...")
     roach.write_int(cal_acc_len_reg, acc_len)
     print("done")
@@ -106,6 +111,7 @@ def make_post_measurements_actions():
     lo2_generator.write("outp off")
     rf_generator.write("outp off")
     rm.close()
+    live_plot.close()
     print("done")
 
 def create_figure():
@@ -156,7 +162,12 @@ def get_caldata(rf_freqs):
     :param rf_freqs: frequencies of the tones to perform the sweep (GHz).
     :return ab_ratios: complex ratios between a and b.
     """
-    a2_arr = []; b2_arr = []; ab_arr = []
+    a2_arr    = np.zeros(len(sync_channels))
+    ab_arr    = np.zeros(len(sync_channels), dtype=complex)
+    ab_ratios = np.zeros(len(sync_channels), dtype=complex)
+
+    # clear the plot lines of the previous sweep
+    live_plot.update({2 : ([], []), 3 : ([], [])})
     for i, chnl in enumerate(sync_channels):
         # set test tone
         freq = rf_freqs[chnl]
@@ -173,25 +184,22 @@ def get_caldata(rf_freqs):
         ab_im = cd.read_interleave_data(roach, bram_ab_im, bram_addr_width, 
                                         bram_word_width,   crosspow_data_type)
 
-        # append data to arrays
-        a2_arr.append(a2[chnl])
-        b2_arr.append(b2[chnl])
-        ab_arr.append(ab_re[chnl] + 1j*ab_im[chnl])
+        # save data in arrays
+        a2_arr[i] = a2[chnl]
+        ab_arr[i] = ab_re[chnl] + 1j*ab_im[chnl]
 
         # scale and dBFS data for plotting
         a2_plot = cd.scale_and_dBFS_specdata(a2, acc_len, dBFS)
         b2_plot = cd.scale_and_dBFS_specdata(b2, acc_len, dBFS)
 
-        # compute input ratios for plotting
-        ab_ratios = np.divide(np.conj(ab_arr), a2_arr) # (ab*)* /aa* = a*b / aa* = b/a
+        # compute input ratio of the new tone
+        ab_ratios[i] = np.conj(ab_arr[i]) / a2_arr[i] # (ab*)* /aa* = a*b / aa* = b/a
 
-        # plot data
-        lines[0].set_data(if_freqs, a2_plot)
-        lines[1].set_data(if_freqs, b2_plot)
-        lines[2].set_data(if_sync_freqs[:i+1], np.abs(ab_ratios))
-        lines[3].set_data(if_sync_freqs[:i+1], np.angle(ab_ratios, deg=True))
-        fig.canvas.draw()
-        fig.canvas.flush_events()
+        # plot data, only the new tone is added to the ratio plots
+        live_plot.update({0 : (if_freqs, a2_plot), 1 : (if_freqs, b2_plot)})
+        live_plot.append({
+            2 : ([if_sync_freqs[i]], [np.abs(ab_ratios[i])]),
+            3 : ([if_sync_freqs[i]], [np.angle(ab_ratios[i], deg=True)])})
         
     return ab_ratios
 
@@ -5,10 +5,18 @@
 # calibration constants with an lnr computation script.
 
 # imports
-import os, time, datetime, tarfile, shutil, json
+import os, sys, time, datetime, tarfile, shutil, json
 import numpy as np
 import matplotlib.pyplot as plt
 import calandigital as cd
+# shared modules (bram_io, live_plot, etc.)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    "..", "..", "..", "..", "Common_Scripts"))
+from bram_io import RoachPool, AccPoller
+from sweep_pipeline import SweepPipeline
+from live_plot import LivePlot
+from rawdata_store import RawDataStore
+from tone_sweeper import ToneSweeper
 
 # communication parameters
 roach_ip        = '192.168.1.12'
@@ -20,10 +28,14 @@ adc_bits           = 8
 bandwidth          = 1080 # MHz
 acc_len_reg        = 'cal_acc_len'
 cnt_rst_reg        = 'cnt_rst'
+acc_cnt_reg        = None # accumulation counter register (None to detect new
+                          # accumulations from the spectra data)
 bram_addr_width    = 8  # bits
 bram_word_width    = 64 # bits
 pow_data_type      = '>u8'
 crosspow_data_type = '>i8'
+nconnections       = 4 # katcp connections used to read bram groups 
+                       # concurrently (1 for serial reads)
 bram_a2    = ['dout_a2_0', 'dout_a2_1', 'dout_a2_2', 'dout_a2_3', 
               'dout_a2_4', 'dout_a2_5', 'dout_a2_6', 'dout_a2_7']
 bram_b2    = ['dout_b2_0', 'dout_b2_1', 'dout_b2_2', 'dout_b2_3', 
@@ -42,26 +54,69 @@ date_time  =  datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 datadir    = "dbm_cal_tone " + date_time
 pause_time = 0.5 # should be > (1/bandwidth * FFT_size * acc_len * 2) in order 
                  # for the spectra to be fully computed after a tone change
+rawdata_step = 16 # full spectra are read and saved every rawdata_step tones 
+                  # for debugging (0 to only read the tone channels)
+wait_accs = True # poll the ROACH for new accumulations after a tone change 
+                 # instead of always waiting pause_time (used as timeout)
+rf_list_sweep = False # upload the tones of each sweep to the rf generator list
+                      # memory and step them with triggers (step mode is 
+                      # used if the generator doesn't support it). Not yet
+                      # verified with the lab generator
+rf_list_size  = 1601 # maximum number of points of the rf generator list
+
+# emulation parameters
+emulate             = False # emulate the ROACH and the rf generator to run
+                            # the script without hardware (roach_emulator.py)
+emulator_time_scale = 1.0 # emulated accumulation time per real time (0 for
+                          # a new accumulation on every read)
+emulator_imbalance  = (1.0, 10.0) # (dB, degrees), analog front end mean
+                                  # magnitude and phase imbalance
+emulator_read_delay = 0.0 # s, emulated katcp latency of every bram read
 
 # derivative parameters
 nchannels     = 2**bram_addr_width * len(bram_a2)
 if_freqs      = np.linspace(0, bandwidth, nchannels, endpoint=False)
 test_channels = range(1, nchannels, chnl_step)
+nsnapshots    = len(test_channels[::rawdata_step]) if rawdata_step > 0 else 0
 if_test_freqs = if_freqs[test_channels]
 dBFS          = 6.02*adc_bits + 1.76 + 10*np.log10(nchannels)
 
+# emulated ROACH and instruments
+if emulate:
+    from roach_emulator import DssEmulator
+    emulator = DssEmulator({'a2' : bram_a2, 'b2' : bram_b2, 
+        'ab_re' : bram_ab_re, 'ab_im' : bram_ab_im},
+        nchannels, bandwidth, adc_bits, pow_data_type, crosspow_data_type,
+        rf_generator_ip, [lo_freq/1e3], cal_acc_len_reg=acc_len_reg, 
+        syn_acc_len_reg=acc_len_reg, cnt_rst_reg=cnt_rst_reg, 
+        acc_cnt_reg=acc_cnt_reg, acc_len=acc_len,
+        amp_imbalance=emulator_imbalance[0], 
+        phase_imbalance=emulator_imbalance[1],
+        time_scale=emulator_time_scale, read_delay=emulator_read_delay)
+    initialize_roach = emulator.initialize_roach
+    open_instrument  = emulator.open_resource
+else:
+    initialize_roach = cd.initialize_roach
+    open_instrument  = cd.Instrument
+
 ##########################
 # Experiment Starts Here #
 ##########################
 def main():
-    global roach, rf_generator, fig, line0, line1, line2, line3
+    global roach, roach_pool, rf_generator, tone_sweeper, live_plot
     start_time = time.time()
 
-    roach = cd.initialize_roach(roach_ip)
-    rf_generator = cd.Instrument(rf_generator_ip)
+    # start the plot process before opening connections or starting threads
+    live_plot = LivePlot(create_figure)
+
+    roach = initialize_roach(roach_ip)
+    roach_pool = RoachPool(roach, roach_ip, nconnections,
+        initialize_roach=initialize_roach)
+    rf_generator = open_instrument(rf_generator_ip)
+    tone_sweeper = ToneSweeper(rf_generator, rf_power, rf_list_sweep, 
+        rf_list_size)
 
     print("Setting up plotting and data saving elements...")
-    fig, line0, line1, line2, line3 = create_figure()
     make_data_directory()
     print("done")
 
@@ -95,6 +150,8 @@ def main():
 
     print("Turning off instruments...")
     rf_generator.write("outp off")
+    roach_pool.close()
+    live_plot.close()
     print("done")
 
     print("Saving data...")
@@ -150,7 +207,7 @@ def create_figure():
     ax3.set_xlabel('Frequency [MHz]')
     ax3.set_ylabel('Angle diff [degrees]')
 
-    return fig, line0, line1, line2, line3
+    return fig, [line0, line1, line2, line3]
 
 def make_data_directory():
     """
@@ -168,6 +225,8 @@ def make_data_directory():
     testinfo["nchannels"]    = nchannels
     testinfo["acc len"]      = acc_len
     testinfo["chnl step"]    = chnl_step
+    testinfo["rawdata step"] = rawdata_step
+    testinfo["wait accs"]    = wait_accs
     testinfo["rf generator"] = rf_generator_ip
     testinfo["rf power"]     = rf_power
 
@@ -183,54 +242,71 @@ def get_caldata(rf_freqs, sideband):
     Sweep a tone through a sideband and get the calibration data.
     The calibration data is the power of each tone in both inputs (a and b)
     and the cross-correlation of both inputs as a complex number (ab*).
-    The full sprecta measured for each tone is saved to data for debugging
-    purposes.
+    The full sprecta measured every rawdata_step tones is saved to data for 
+    debugging purposes. For the rest of the tones only the tone channel is 
+    read.
     :param rf_freqs: frequencies of the tones to perform the sweep.
     :param sideband: sideband of the mesurement. Either USB or LSB
     :return: calibration data: a2, b2, and ab.
     """
-    fig.canvas.set_window_title(sideband.upper() + " Sweep")
-
-    a2_arr = []; b2_arr = []; ab_arr = []
+    live_plot.set_title(sideband.upper() + " Sweep")
+
+    cal_brams  = [bram_a2, bram_b2, bram_ab_re, bram_ab_im]
+    cal_dtypes = [pow_data_type, pow_data_type, crosspow_data_type, crosspow_data_type]
+    pipeline = SweepPipeline()
+    acc_poller = AccPoller(roach, bram_a2, bram_addr_width, bram_word_width, 
+        pow_data_type, acc_cnt_reg)
+    rawdata = RawDataStore(datadir + "/rawdata_tone_" + sideband, 
+        nsnapshots, nchannels, {'a2' : pow_data_type, 'b2' : pow_data_type,
+        'ab_re' : crosspow_data_type, 'ab_im' : crosspow_data_type})
+    a2_arr = np.zeros(len(test_channels))
+    b2_arr = np.zeros(len(test_channels))
+    ab_arr = np.zeros(len(test_channels), dtype=complex)
+    ab_ratios = np.zeros(len(test_channels), dtype=complex)
+
+    # clear the plot lines of the previous sweep
+    live_plot.update({2 : ([], []), 3 : ([], [])})
+    tone_sweeper.start([rf_freqs[chnl]/1e3 for chnl in test_channels]) # GHz
     for i, chnl in enumerate(test_channels):
         # set test tone
-        freq = rf_freqs[chnl]
-        rf_generator.ask("freq " + str(freq*1e6) + ";*opc?") # freq must be in Hz
-        time.sleep(pause_time)
-
-        # read data
-        a2    = cd.read_interleave_data(roach, bram_a2,    bram_addr_width, 
-                                        bram_word_width,   pow_data_type)
-        b2    = cd.read_interleave_data(roach, bram_b2,    bram_addr_width, 
-                                        bram_word_width,   pow_data_type)
-        ab_re = cd.read_interleave_data(roach, bram_ab_re, bram_addr_width, 
-                                        bram_word_width,   crosspow_data_type)
-        ab_im = cd.read_interleave_data(roach, bram_ab_im, bram_addr_width, 
-                                        bram_word_width,   crosspow_data_type)
-
-        # append data to arrays
-        a2_arr.append(a2[chnl])
-        b2_arr.append(b2[chnl])
-        ab_arr.append(ab_re[chnl] + 1j*ab_im[chnl])
-
-        # scale and dBFS data for plotting
-        a2_plot = cd.scale_and_dBFS_specdata(a2, acc_len, dBFS)
-        b2_plot = cd.scale_and_dBFS_specdata(b2, acc_len, dBFS)
-
-        # compute input ratios for plotting
-        ab_ratios = np.divide(ab_arr, b2_arr)
-
-        # plot data
-        line0.set_data(if_freqs, a2_plot)
-        line1.set_data(if_freqs, b2_plot)
-        line2.set_data(if_test_freqs[:i+1], np.abs(ab_ratios))
-        line3.set_data(if_test_freqs[:i+1], np.angle(ab_ratios, deg=True))
-        fig.canvas.draw()
-        fig.canvas.flush_events()
+        tone_sweeper.next()
+
+        # wait for the tone to settle while plotting previous tone
+        if wait_accs:
+            acc_poller.mark(chnl)
+            pipeline.settle(pause_time, acc_poller.ready)
+        else:
+            pipeline.settle(pause_time)
+
+        # read data, full spectra only for debug snapshots
+        snapshot = rawdata_step > 0 and i % rawdata_step == 0
+        if snapshot:
+            a2, b2, ab_re, ab_im = roach_pool.read_interleave_groups(cal_brams,
+                bram_addr_width, bram_word_width, cal_dtypes)
+            a2_chnl, b2_chnl = a2[chnl], b2[chnl]
+            ab_re_chnl, ab_im_chnl = ab_re[chnl], ab_im[chnl]
+        else:
+            a2_chnl, b2_chnl, ab_re_chnl, ab_im_chnl = \
+                roach_pool.read_chnl_groups(cal_brams, bram_addr_width, 
+                bram_word_width, cal_dtypes, chnl)
+
+        # save data in arrays
+        a2_arr[i] = a2_chnl
+        b2_arr[i] = b2_chnl
+        ab_arr[i] = ab_re_chnl + 1j*ab_im_chnl
+
+        # plot data in the next settle time
+        spectra = [a2, b2] if snapshot else None
+        pipeline.defer(plot_caldata, i, a2_arr, b2_arr, ab_arr, ab_ratios, 
+            spectra)
         
-        # save data
-        np.savez(datadir+"/rawdata_tone_" + sideband + "/chnl_" + str(chnl), 
-            a2=a2, b2=b2, ab_re=ab_re, ab_im=ab_im)
+        # save raw data in background
+        if snapshot:
+            pipeline.submit(rawdata.append, chnl, 
+                a2=a2, b2=b2, ab_re=ab_re, ab_im=ab_im)
+    tone_sweeper.stop()
+    pipeline.close()
+    rawdata.close()
 
     # compute interpolations
     a2_arr = np.interp(if_freqs, if_test_freqs, a2_arr)
@@ -239,6 +315,31 @@ def get_caldata(rf_freqs, sideband):
 
     return a2_arr, b2_arr, ab_arr
 
+def plot_caldata(i, a2_arr, b2_arr, ab_arr, ab_ratios, spectra=None):
+    """
+    Plot the calibration data of the last tone measured in a sweep. Only the
+    new tone is computed and sent to the plot.
+    :param i: index of the tone in the sweep.
+    :param a2_arr: power of input a of the sweep tones.
+    :param b2_arr: power of input b of the sweep tones.
+    :param ab_arr: crosspower of inputs a and b of the sweep tones.
+    :param ab_ratios: input ratios of the sweep tones, updated with the new
+        tone.
+    :param spectra: full a2 and b2 spectra of the last tone. If None, the
+        spectra plots are not updated.
+    """
+    # compute input ratio of the new tone
+    ab_ratios[i] = ab_arr[i] / b2_arr[i]
+
+    if spectra is not None:
+        # scale and dBFS data for plotting
+        a2_plot = cd.scale_and_dBFS_specdata(spectra[0], acc_len, dBFS)
+        b2_plot = cd.scale_and_dBFS_specdata(spectra[1], acc_len, dBFS)
+        live_plot.update({0 : (if_freqs, a2_plot), 1 : (if_freqs, b2_plot)})
+    live_plot.append({
+        2 : ([if_test_freqs[i]], [np.abs(ab_ratios[i])]),
+        3 : ([if_test_freqs[i]], [np.angle(ab_ratios[i], deg=True)])})
+
 def print_data():
     """
     Print the saved data to .pdf images for an easy check.
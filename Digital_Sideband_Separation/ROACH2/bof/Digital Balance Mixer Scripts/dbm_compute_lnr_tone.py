@@ -4,10 +4,18 @@
 # It then saves the results into a compress folder.
 
 # imports
-import os, corr, time, datetime, tarfile, shutil, json
+import os, sys, corr, time, datetime, tarfile, shutil, json
 import numpy as np
 import matplotlib.pyplot as plt
 import calandigital as cd
+# shared modules (bram_io, live_plot, etc.)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    "..", "..", "..", "..", "Common_Scripts"))
+from bram_io import RoachPool, AccPoller
+from sweep_pipeline import SweepPipeline
+from live_plot import LivePlot
+from rawdata_store import RawDataStore
+from tone_sweeper import ToneSweeper
 from dbm_load_constants import dbm_load_constants
 
 # communication parameters
@@ -20,9 +28,13 @@ adc_bits        = 8
 bandwidth       = 1080 # MHz
 acc_len_reg     = 'syn_acc_len'
 cnt_rst_reg     = 'cnt_rst'
+acc_cnt_reg     = None # accumulation counter register (None to detect new
+                       # accumulations from the spectra data)
 bram_addr_width = 8  # bits
 bram_word_width = 64 # bits
 pow_data_type   = '>u8'
+nconnections    = 2 # katcp connections used to read bram groups 
+                    # concurrently (1 for serial reads)
 bram_rf = ['dout0_0', 'dout0_1', 'dout0_2', 'dout0_3', 
            'dout0_4', 'dout0_5', 'dout0_6', 'dout0_7']
 bram_lo = ['dout1_0', 'dout1_1', 'dout1_2', 'dout1_3', 
@@ -37,6 +49,15 @@ date_time   =  datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 datadir     = "dbm_lnr_tone " + date_time
 pause_time  = 0.5 # should be > (1/bandwidth * FFT_size * acc_len * 2) in order 
                   # for the spectra to be fully computed after a tone change
+rawdata_step = 16 # full spectra are read and saved every rawdata_step tones 
+                  # for debugging (0 to only read the tone channels)
+wait_accs = True # poll the ROACH for new accumulations after a tone change 
+                 # instead of always waiting pause_time (used as timeout)
+rf_list_sweep = False # upload the tones of each sweep to the rf generator list
+                      # memory and step them with triggers (step mode is 
+                      # used if the generator doesn't support it). Not yet
+                      # verified with the lab generator
+rf_list_size  = 1601 # maximum number of points of the rf generator list
 load_consts = True
 load_ideal  = False
 caldir      = 'dbm_cal_noise 2020-03-03 16:48:09.tar.gz'
@@ -45,6 +66,7 @@ caldir      = 'dbm_cal_noise 2020-03-03 16:48:09.tar.gz'
 nchannels     = 2**bram_addr_width * len(bram_rf)
 if_freqs      = np.linspace(0, bandwidth, nchannels, endpoint=False)
 test_channels = range(1, nchannels, chnl_step)
+nsnapshots    = len(test_channels[::rawdata_step]) if rawdata_step > 0 else 0
 if_test_freqs = if_freqs[test_channels]
 dBFS          = 6.02*adc_bits + 1.76 + 10*np.log10(nchannels)                
 
@@ -52,14 +74,19 @@ dBFS          = 6.02*adc_bits + 1.76 + 10*np.log10(nchannels)
 # Experiment Starts Here #
 ##########################
 def main():
-    global roach, rf_generator, fig, line0, line1, line2, line3
+    global roach, roach_pool, rf_generator, tone_sweeper, live_plot
     start_time = time.time()
 
+    # start the plot process before opening connections or starting threads
+    live_plot = LivePlot(create_figure)
+
     roach = cd.initialize_roach(roach_ip)
+    roach_pool = RoachPool(roach, roach_ip, nconnections)
     rf_generator = cd.Instrument(rf_generator_ip)
+    tone_sweeper = ToneSweeper(rf_generator, rf_power, rf_list_sweep, 
+        rf_list_size)
 
     print("Setting up plotting and data saving elements...")
-    fig, line0, line1, line2, line3 = create_figure()
     make_data_directory()
     print("done")
 
@@ -81,7 +108,7 @@ def main():
     #####################
     # loading calibration constants
     if load_consts:
-        dbm_load_constants(roach, load_ideal, 1+0j, caldir)
+        dbm_load_constants(roach, load_ideal, 1+0j, caldir, roach_pool)
 
     print("Starting tone sweep in upper sideband...")
     sweep_time = time.time()
@@ -97,6 +124,8 @@ def main():
 
     print("Turning off instruments...")
     rf_generator.write("outp off")
+    roach_pool.close()
+    live_plot.close()
     print("done")
 
     print("Saving data...")
@@ -146,7 +175,7 @@ def create_figure():
     ax2.set_ylabel('LNR [dB]')       ; ax3.set_ylabel('LNR [dB]') 
     ax2.set_title('LNR USB')         ; ax3.set_title('LNR LSB')         
 
-    return fig, line0, line1, line2, line3
+    return fig, [line0, line1, line2, line3]
 
 def make_data_directory():
     """
@@ -164,6 +193,8 @@ def make_data_directory():
     testinfo["nchannels"]    = nchannels
     testinfo["acc len"]      = acc_len
     testinfo["chnl step"]    = chnl_step
+    testinfo["rawdata step"] = rawdata_step
+    testinfo["wait accs"]    = wait_accs
     testinfo["rf generator"] = rf_generator_ip
     testinfo["rf power"]     = rf_power
     testinfo["load consts"]  = load_consts
@@ -182,51 +213,65 @@ def get_lnrdata(rf_freqs, tone_sideband):
     Sweep a tone through a sideband and get the lnr data.
     The lnr data is the power of each tone after applying the calibration
     constants (rf), and the negative of the constants (lo).
-    The full sprecta measured for each tone is saved to data for debugging
-    purposes.
+    The full sprecta measured every rawdata_step tones is saved to data for 
+    debugging purposes. For the rest of the tones only the tone channel is 
+    read.
     :param rf_freqs: frequencies of the tones to perform the sweep.
     :param tone_sideband: sideband of the injected test tone. Either USB or LSB
     :return: lnr data: rf and lo.
     """
-    fig.canvas.set_window_title(tone_sideband.upper() + " Sweep")
-
-    rf_arr = []; lo_arr = []
+    live_plot.set_title(tone_sideband.upper() + " Sweep")
+
+    lnr_brams  = [bram_rf, bram_lo]
+    lnr_dtypes = [pow_data_type, pow_data_type]
+    pipeline = SweepPipeline()
+    acc_poller = AccPoller(roach, bram_rf, bram_addr_width, bram_word_width, 
+        pow_data_type, acc_cnt_reg)
+    rawdata = RawDataStore(datadir + "/rawdata_tone_" + tone_sideband, 
+        nsnapshots, nchannels, {'rf' : pow_data_type, 'lo' : pow_data_type})
+    rf_arr = np.zeros(len(test_channels))
+    lo_arr = np.zeros(len(test_channels))
+    lnr    = np.zeros(len(test_channels))
+
+    # clear the plot lines of the previous sweep
+    live_plot.update({2 if tone_sideband=='usb' else 3 : ([], [])})
+    tone_sweeper.start([rf_freqs[chnl]/1e3 for chnl in test_channels]) # GHz
     for i, chnl in enumerate(test_channels):
         # set test tone
-        freq = rf_freqs[chnl]
-        rf_generator.ask("freq " + str(freq*1e6) + ";*opc?") # freq must be in Hz
-        time.sleep(pause_time)
-
-        # read data
-        rf = cd.read_interleave_data(roach, bram_rf,  bram_addr_width, 
-                                     bram_word_width, pow_data_type)
-        lo = cd.read_interleave_data(roach, bram_lo,  bram_addr_width, 
-                                     bram_word_width, pow_data_type)
-
-        # append data to arrays
-        rf_arr.append(rf[chnl])
-        lo_arr.append(lo[chnl])
-
-        # scale and dBFS data for plotting
-        rf_plot = cd.scale_and_dBFS_specdata(rf, acc_len, dBFS)
-        lo_plot = cd.scale_and_dBFS_specdata(lo, acc_len, dBFS)
-
-        # compute lnr for plotting
-        lnr = np.divide(lo_arr, rf_arr)
-
-        # define sb plot line
-        line_sb = line2 if tone_sideband=='usb' else line3
-
-        # plot data
-        line0.set_data(if_freqs, rf_plot)
-        line1.set_data(if_freqs, lo_plot)
-        line_sb.set_data(if_test_freqs[:i+1], 10*np.log10(lnr))
-        fig.canvas.draw()
-        fig.canvas.flush_events()
+        tone_sweeper.next()
+
+        # wait for the tone to settle while plotting previous tone
+        if wait_accs:
+            acc_poller.mark(chnl)
+            pipeline.settle(pause_time, acc_poller.ready)
+        else:
+            pipeline.settle(pause_time)
+
+        # read data, full spectra only for debug snapshots
+        snapshot = rawdata_step > 0 and i % rawdata_step == 0
+        if snapshot:
+            rf, lo = roach_pool.read_interleave_groups(lnr_brams, 
+                bram_addr_width, bram_word_width, lnr_dtypes)
+            rf_chnl, lo_chnl = rf[chnl], lo[chnl]
+        else:
+            rf_chnl, lo_chnl = roach_pool.read_chnl_groups(lnr_brams, 
+                bram_addr_width, bram_word_width, lnr_dtypes, chnl)
+
+        # save data in arrays
+        rf_arr[i] = rf_chnl
+        lo_arr[i] = lo_chnl
+
+        # plot data in the next settle time
+        spectra = [rf, lo] if snapshot else None
+        pipeline.defer(plot_lnrdata, tone_sideband, i, rf_arr, lo_arr, lnr,
+            spectra)
         
-        # save data
-        np.savez(datadir+"/rawdata_tone_" + tone_sideband + "/chnl_" + str(chnl), 
-            rf=rf, lo=lo)
+        # save raw data in background
+        if snapshot:
+            pipeline.submit(rawdata.append, chnl, rf=rf, lo=lo)
+    tone_sweeper.stop()
+    pipeline.close()
+    rawdata.close()
 
     # compute interpolations
     rf_arr = np.interp(if_freqs, if_test_freqs, rf_arr)
@@ -234,6 +279,31 @@ def get_lnrdata(rf_freqs, tone_sideband):
 
     return rf_arr, lo_arr
 
+def plot_lnrdata(tone_sideband, i, rf_arr, lo_arr, lnr, spectra=None):
+    """
+    Plot the lnr data of the last tone measured in a sweep. Only the new 
+    tone is computed and sent to the plot.
+    :param tone_sideband: sideband of the injected test tone. Either USB or LSB
+    :param i: index of the tone in the sweep.
+    :param rf_arr: rf power of the sweep tones.
+    :param lo_arr: lo power of the sweep tones.
+    :param lnr: lnr of the sweep tones, updated with the new tone.
+    :param spectra: full rf and lo spectra of the last tone. If None, the
+        spectra plots are not updated.
+    """
+    # compute lnr of the new tone
+    lnr[i] = lo_arr[i] / rf_arr[i]
+
+    # define sb plot line
+    line_sb = 2 if tone_sideband=='usb' else 3
+
+    if spectra is not None:
+        # scale and dBFS data for plotting
+        rf_plot = cd.scale_and_dBFS_specdata(spectra[0], acc_len, dBFS)
+        lo_plot = cd.scale_and_dBFS_specdata(spectra[1], acc_len, dBFS)
+        live_plot.update({0 : (if_freqs, rf_plot), 1 : (if_freqs, lo_plot)})
+    live_plot.append({line_sb : ([if_test_freqs[i]], [10*np.log10(lnr[i])])})
+
 def print_data():
     """
     Print the saved data to .pdf images for an easy check.
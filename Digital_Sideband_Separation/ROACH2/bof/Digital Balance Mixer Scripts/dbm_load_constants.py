@@ -1,11 +1,20 @@
-import argparse, tarfile
+import os, sys, argparse, tarfile
 import numpy as np
 import calandigital as cd
+# shared modules (bram_io, live_plot, etc.)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    "..", "..", "..", "..", "Common_Scripts"))
+from consts_cache import ConstsCache, consts_key, consts2blobs
+from bram_io import BramWriter
 
 # model parameters
 nchannels      = 2048
 consts_nbits   = 32
 consts_binpt   = 27
+consts_cache_dir  = 'consts_cache' # fixed point constants cache directory
+consts_cache_size = 64 # number of constant sets kept in the cache
+consts_diff_upload = True # only write the constant words that changed since
+                          # the last load
 # constants where RF is maximized (LO is rejected)
 bram_consts_rf_re = ['bram_mult0_0_bram_re', 'bram_mult0_1_bram_re',
                      'bram_mult0_2_bram_re', 'bram_mult0_3_bram_re',
@@ -25,6 +34,9 @@ bram_consts_lo_im = ['bram_mult1_0_bram_im', 'bram_mult1_1_bram_im',
                      'bram_mult1_4_bram_im', 'bram_mult1_5_bram_im',
                      'bram_mult1_6_bram_im', 'bram_mult1_7_bram_im']
 
+consts_cache = ConstsCache(consts_cache_dir, consts_cache_size)
+bram_writer  = BramWriter(consts_nbits)
+
 if __name__ == '__main__':
     # if used as main script, read command line argmuments 
     # and starts roach communication
@@ -50,7 +62,8 @@ if __name__ == '__main__':
     roach = cd.initialize_roach(args.ip, boffile=args.boffile, upload=args.upload)
     dbm_load_constants(roach, args.load_ideal, complex(args.ideal_const), args.caldir)
 
-def dbm_load_constants(roach, load_ideal, ideal_const=1+0j, caldir=""):
+def dbm_load_constants(roach, load_ideal, ideal_const=1+0j, caldir="", 
+    roach_pool=None):
     """
     Load load digital balance mixer constants.
     :param roach: FpgaClient object to communicate with roach.
@@ -58,27 +71,33 @@ def dbm_load_constants(roach, load_ideal, ideal_const=1+0j, caldir=""):
         constants from caldir.
     :param ideal_const: ideal constant value to load.
     :param caldir: .tar.gz directory with the calibration data.
+    :param roach_pool: RoachPool used to write the constant brams 
+        concurrently. If None, roach is used.
     """
     if load_ideal:
         print("Using ideal constant " + str(ideal_const) + ".")
         consts = ideal_const * np.ones(nchannels, dtype=np.complex64)
+        blobs = get_consts_blobs(consts)
     else: # use calibrated constants
         print("Using constants from calibration directory.")
         if caldir.startswith("dbm_cal_tone"):
             print("Computing constants from tone calibration.")
-            consts = compute_tone_consts(caldir)
+            compute_consts = compute_tone_consts
 
         elif caldir.startswith("dbm_cal_noise"):
             print("Computing constants from noise calibration.")
-            consts = compute_noise_consts(caldir)
+            compute_consts = compute_noise_consts
 
         else:
             print("Unable to get calibration time :(")
             exit()
 
+        key = consts_key(caldir, "", consts_nbits, consts_binpt)
+        blobs = consts_cache.load(key, 
+            lambda: get_consts_blobs(compute_consts(caldir)))
+
     print("Loading constants...")
-    load_comp_constants(roach,    consts, bram_consts_rf_re, bram_consts_rf_im)
-    load_comp_constants(roach, -1*consts, bram_consts_lo_re, bram_consts_lo_im)
+    bram_writer.write(roach, blobs, roach_pool, consts_diff_upload)
     print("done")
 
 def compute_tone_consts(caldir):
@@ -121,23 +140,16 @@ def get_caldata(datadir):
 
     return caldata
 
-def load_comp_constants(roach, consts, bram_re, bram_im):
+def get_consts_blobs(consts):
     """
-    Load complex constants into ROACH bram. Real and imaginary parts
-    are loaded in separated bram blocks.
-    :param roach: FpgaClient object to communicate with roach
-    :param consts: complex constants array.
-    :param bram_re: bram block name for real part.
-    :param bram_im: bram block name for imaginary part.
+    Convert the constants into the fixed point data of the ROACH constant
+    brams. The negative of the constants is used for the LO brams.
+    :param consts: constants where RF is maximized.
+    :return: dictionary with the data of every bram as bytes.
     """
-    # separate real and imaginary
-    consts_re = np.real(consts)
-    consts_im = np.imag(consts)
-
-    # convert data into fixed point representation
-    consts_re_fixed = cd.float2fixed(consts_re, consts_nbits, consts_binpt, warn=True)
-    consts_im_fixed = cd.float2fixed(consts_im, consts_nbits, consts_binpt, warn=True)
+    blobs = consts2blobs(consts, bram_consts_rf_re, bram_consts_rf_im, 
+        consts_nbits, consts_binpt)
+    blobs.update(consts2blobs(-1*consts, bram_consts_lo_re, bram_consts_lo_im,
+        consts_nbits, consts_binpt))
 
-    # load data
-    cd.write_interleaved_data(roach, bram_re, consts_re_fixed)
-    cd.write_interleaved_data(roach, bram_im, consts_im_fixed)
+    return blobs
@@ -0,0 +1,126 @@
+# Accumulation length control for tone sweeps with a target SNR. Instead of
+# integrating every tone with the same accumulation length, the accumulation
+# length of each tone is chosen from its expected carrier to noise ratio per
+# spectrum: the tone power measured in the previous tone over the noise floor
+# of the new channel (measured once with the tones off). Strong tones are
+# integrated less and weak tones more. The readings are rescaled to the
+# reference accumulation length, so that the rest of the processing (power
+# scaling, ratios, interpolation) doesn't change.
+
+# imports
+import numpy as np
+
+class AccLenControl(object):
+    """
+    Accumulation length of the tones of a sweep. The accumulation lengths are
+    powers of 2, and the accumulation registers are only written when the
+    length changes.
+    """
+    def __init__(self, roach, acc_len_regs, ref_acc_len, snr_target,
+        acc_len_range):
+        """
+        :param roach: FpgaClient object to communicate with roach.
+        :param acc_len_regs: accumulation length registers. All the
+            accumulation registers of the model must be set, as the
+            accumulations share the period of the longest length.
+        :param ref_acc_len: reference accumulation length, the readings are
+            rescaled to it. It must be the length written in the register.
+        :param snr_target: target SNR of the tone readings (dB), the ratio
+            of the tone power to the noise power of the accumulated data.
+        :param acc_len_range: minimum and maximum accumulation lengths.
+        """
+        self.roach       = roach
+        self.acc_len_regs = acc_len_regs
+        self.ref_acc_len = ref_acc_len
+        self.snr_target  = 10**(snr_target/10.0)
+        self.min_acc_len, self.max_acc_len = acc_len_range
+        self.acc_len     = ref_acc_len
+        self.noise       = None # noise floor of each input per spectrum
+        self.tone_power  = None # tone power of each input per spectrum
+        self.acc_lens    = {} # {chnl : acc_len} of the measured tones
+
+    def set_noise_floor(self, a2, b2):
+        """
+        Set the noise floor of the inputs, measured with the tones off.
+        :param a2: power of input a, accumulated with the reference length.
+        :param b2: power of input b, accumulated with the reference length.
+        """
+        self.noise = [np.maximum(np.asarray(a2, dtype=float), 1) /
+            self.ref_acc_len, np.maximum(np.asarray(b2, dtype=float), 1) /
+            self.ref_acc_len]
+
+    def set_acc_len(self, chnls, reference=False):
+        """
+        Set the accumulation length of the next tones, from the last tone
+        power and the noise floor of the new channels (the weakest input of
+        the weakest channel decides).
+        :param chnls: channels of the next tones.
+        :param reference: if True, use the reference length (e.g. for full
+            spectra snapshots, saved without rescaling).
+        :return: accumulation length. The reference length is used until
+            the noise floor and the first tone are measured.
+        """
+        acc_len = self.ref_acc_len
+        if not reference and self.noise is not None and \
+            self.tone_power is not None:
+            cnr = min(self.tone_power[i] / self.noise[i][chnl]
+                for chnl in chnls for i in [0, 1])
+            acc_len = self.snr_target / max(cnr, 1e-12)
+            acc_len = 2**int(np.ceil(np.log2(max(acc_len, 1))))
+            acc_len = int(np.clip(acc_len, self.min_acc_len,
+                self.max_acc_len))
+        if acc_len != self.acc_len:
+            self.write_acc_len(acc_len)
+        for chnl in chnls:
+            self.acc_lens[chnl] = acc_len
+
+        return acc_len
+
+    def update(self, chnls, a2, b2):
+        """
+        Update the tone power with the readings of the last tones (the
+        weakest tone of each input is kept).
+        :param chnls: channels of the tones.
+        :param a2: power of input a in the tone channels (not rescaled).
+        :param b2: power of input b in the tone channels (not rescaled).
+        """
+        if self.noise is None:
+            return
+        self.tone_power = [max(min(float(power) / self.acc_len - noise[chnl]
+            for chnl, power in zip(chnls, powers)), 0) for powers, noise in
+            zip([a2, b2], self.noise)]
+
+    def rescale(self, data):
+        """
+        Rescale a reading to the reference accumulation length.
+        :param data: data accumulated with the current length.
+        :return: rescaled data.
+        """
+        if self.acc_len == self.ref_acc_len:
+            return data
+        return data * (float(self.ref_acc_len) / self.acc_len)
+
+    def time_ratio(self):
+        """
+        :return: integration time of the measured tones relative to the
+            reference accumulation length.
+        """
+        if len(self.acc_lens) == 0:
+            return 1.0
+        return float(np.mean(list(self.acc_lens.values()))) / self.ref_acc_len
+
+    def reset(self):
+        """
+        Restore the reference accumulation length in the registers.
+        """
+        if self.acc_len != self.ref_acc_len:
+            self.write_acc_len(self.ref_acc_len)
+
+    def write_acc_len(self, acc_len):
+        """
+        Write an accumulation length in the registers.
+        :param acc_len: accumulation length.
+        """
+        for acc_len_reg in self.acc_len_regs:
+            self.roach.write_int(acc_len_reg, acc_len)
+        self.acc_len = acc_len
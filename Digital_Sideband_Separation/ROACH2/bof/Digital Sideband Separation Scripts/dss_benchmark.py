@@ -0,0 +1,345 @@
+#!/usr/bin/python
+# Benchmark of the tone sweep scripts (DSS calibration and SRR computation,
+# their multi LO variants, and the DBM tone calibration), run end to end with
+# the emulated ROACH and generators of roach_emulator.py. Every run is made in
+# its own process and temporary directory, with the script parameters
+# overridden (number of channels, channel step, LO grid size, etc.). For every
+# run it reports the tones per second, the bytes read from the ROACH per tone,
+# the peak memory of the process, and the size and compress time of the data
+# archive. Results are saved as .json, so that changes in the readout or
+# storage code can be compared with --compare.
+
+# imports
+import os, sys, time, json, argparse, subprocess, tempfile, shutil, types
+import datetime, importlib, resource
+from collections import OrderedDict
+import numpy as np
+
+# benchmark parameters
+scripts_dir = os.path.dirname(os.path.abspath(__file__))
+script_dirs = {
+    'dss'  : scripts_dir,
+    'naoj' : os.path.join(scripts_dir, "..", "DSS NAOJ Scripts"),
+    'dbm'  : os.path.join(scripts_dir, "..", "Digital Balance Mixer Scripts")}
+# benchmark name : (scripts directory, script module, parameters module,
+#                   calibration benchmark needed by the script)
+benchmarks = OrderedDict([
+    ('dss_calibrate',           ('dss',  'dss_calibrate',
+                                 'dss_parameters', None)),
+    ('dss_compute_srr',         ('dss',  'dss_compute_srr',
+                                 'dss_parameters', 'dss_calibrate')),
+    ('dss_calibrate_multilo',   ('naoj', 'dss_calibrate_multilo',
+                                 'dss_multilo_parameters', None)),
+    ('dss_compute_srr_multilo', ('naoj', 'dss_compute_srr_multilo',
+                                 'dss_multilo_parameters',
+                                 'dss_calibrate_multilo')),
+    ('dbm_calibrate_tone',      ('dbm',  'dbm_calibrate_tone',
+                                 'dbm_calibrate_tone', None))])
+multilo_benchmarks = ['dss_calibrate_multilo', 'dss_compute_srr_multilo']
+lo1_start = 405 # GHz, first lo1 frequency of the LO grids
+lo1_step  = 16  # GHz
+lo2_start = 4   # GHz, first lo2 frequency of the LO grids
+lo2_step  = 1   # GHz
+date_time = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+metrics   = ["tones per s", "bytes read per tone", "peak rss mb",
+    "archive size bytes", "compress time s"]
+
+def main():
+    args = parse_args()
+    if args.child is not None:
+        run_child(args.child)
+        return
+
+    configs = make_configs(args)
+    results = []
+    print("Running " + str(len(configs)) + " benchmarks...")
+    for config in configs:
+        print("Running " + config_name(config) + "...")
+        result = run_benchmark(config, results, args)
+        results.append(result)
+        print_result(result)
+    print("done")
+
+    # the working directories are kept until the end, the SRR runs use the
+    # calibration archives of previous runs
+    if not args.keep:
+        for result in results:
+            shutil.rmtree(result.pop("workdir"))
+            result.pop("archive")
+
+    with open(args.output, "w") as f:
+        json.dump({"date time" : date_time, "results" : results}, f,
+            indent=4, sort_keys=True)
+    print("Results saved in " + args.output)
+
+    if args.compare is not None:
+        compare_results(args.compare, results)
+
+def parse_args():
+    """
+    Parse the command line arguments.
+    :return: parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description=
+        "Benchmark the tone sweep scripts with an emulated ROACH.")
+    parser.add_argument("--scripts", nargs="+", choices=list(benchmarks),
+        default=list(benchmarks), help="scripts to benchmark. SRR scripts "
+        "also run their calibration script, to get the constants.")
+    parser.add_argument("--nchannels", nargs="+", type=int, default=[None],
+        help="number of channels of the model (default: script parameters).")
+    parser.add_argument("--chnl-step", nargs="+", type=int, default=[None],
+        help="channel step of the tone sweeps (default: script parameters).")
+    parser.add_argument("--lo-grid", nargs="+", default=["2x2"],
+        help="lo1 x lo2 grid sizes of the multi LO scripts (e.g. 2x2).")
+    parser.add_argument("--time-scale", type=float, default=0.0,
+        help="emulated accumulation time per real time (0 for a new "
+        "accumulation on every read).")
+    parser.add_argument("--read-delay", type=float, default=0.0,
+        help="emulated katcp latency of every bram read (s).")
+    parser.add_argument("--set", action="append", default=[],
+        metavar="PARAM=VALUE", help="override a script parameter with a "
+        "python expression, e.g. --set 'rawdata_step=0'.")
+    parser.add_argument("--output", default="benchmark " + date_time +
+        ".json", help="results .json file.")
+    parser.add_argument("--compare", metavar="JSON", help="results .json "
+        "file of a previous benchmark to compare with.")
+    parser.add_argument("--keep", action="store_true",
+        help="keep the working directories of the runs.")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    for nchannels in args.nchannels:
+        if nchannels is not None and (nchannels % 8 != 0 or
+           2**int(np.log2(nchannels//8)) != nchannels//8):
+            parser.error("nchannels must be 8 times a power of 2.")
+    for lo_grid in args.lo_grid:
+        if len(lo_grid.split("x")) != 2:
+            parser.error("LO grids must be given as <lo1 size>x<lo2 size>.")
+
+    return args
+
+def make_configs(args):
+    """
+    Make the configuration of every benchmark run. Calibration scripts are
+    run before the SRR scripts that need them.
+    :param args: command line arguments.
+    :return: list of run configurations.
+    """
+    names = []
+    for name in benchmarks:
+        if name in args.scripts or any(benchmarks[script][3] == name
+            for script in args.scripts):
+            names.append(name)
+
+    configs = []
+    for nchannels in args.nchannels:
+        for chnl_step in args.chnl_step:
+            for name in names:
+                lo_grids = args.lo_grid if name in multilo_benchmarks \
+                    else [None]
+                for lo_grid in lo_grids:
+                    configs.append(OrderedDict([("script", name),
+                        ("nchannels", nchannels), ("chnl step", chnl_step),
+                        ("lo grid", lo_grid)]))
+
+    return configs
+
+def config_name(config):
+    """
+    :param config: run configuration.
+    :return: short description of the run.
+    """
+    name = config["script"]
+    for key in ["nchannels", "chnl step", "lo grid"]:
+        if config[key] is not None:
+            name += ", " + key + " " + str(config[key])
+    return name
+
+def get_overrides(config, caltar, args):
+    """
+    Get the parameter overrides of a run, as python statements.
+    :param config: run configuration.
+    :param caltar: calibration archive for SRR scripts (None if not needed).
+    :param args: command line arguments.
+    :return: list of statements.
+    """
+    overrides = ["roach_ip = None", "emulate = True",
+        "emulator_time_scale = " + repr(args.time_scale),
+        "emulator_read_delay = " + repr(args.read_delay)]
+    if config["nchannels"] is not None:
+        overrides.append("bram_addr_width = int(np.log2(" +
+            str(config["nchannels"]) + " // len(bram_a2)))")
+    if config["chnl step"] is not None:
+        overrides.append("chnl_step = " + str(config["chnl step"]))
+    if config["lo grid"] is not None:
+        lo1_size, lo2_size = [int(size) for size in
+            config["lo grid"].split("x")]
+        overrides.append("lo1_freqs = " +
+            repr([lo1_start + i*lo1_step for i in range(lo1_size)]))
+        overrides.append("lo2_freqs = " +
+            repr([lo2_start + i*lo2_step for i in range(lo2_size)]))
+    if caltar is not None:
+        overrides += ["caltar = " + repr(caltar), "load_ideal = False"]
+    overrides += args.set
+
+    return overrides
+
+def run_benchmark(config, results, args):
+    """
+    Run a benchmark in a child process, in a temporary directory.
+    :param config: run configuration.
+    :param results: results of the previous runs, to find the calibration
+        archive needed by SRR scripts.
+    :param args: command line arguments.
+    :return: dictionary with the configuration and results of the run.
+    """
+    scripts_key, script, params, calibration = benchmarks[config["script"]]
+    caltar = None
+    if calibration is not None:
+        for result in results:
+            if result["script"] == calibration and all(result[key] ==
+                config[key] for key in ["nchannels", "chnl step", "lo grid"]):
+                caltar = result["archive"]
+        if caltar is None:
+            raise Exception("No calibration archive for " +
+                config_name(config) + ".")
+
+    workdir = tempfile.mkdtemp(prefix="dss_benchmark_")
+    child_config = {"scriptdir" : os.path.abspath(script_dirs[scripts_key]),
+        "script" : script, "params" : params,
+        "overrides" : get_overrides(config, caltar, args)}
+    with open(os.path.join(workdir, "benchmark_config.json"), "w") as f:
+        json.dump(child_config, f)
+    # the multi LO parameters read the calibration archive from this file
+    with open(os.path.join(workdir, "last_caltar.txt"), "w") as f:
+        f.write((caltar or "") + "\n")
+
+    env = dict(os.environ, MPLBACKEND="Agg")
+    with open(os.path.join(workdir, "benchmark_log.txt"), "w") as log:
+        returncode = subprocess.call([sys.executable,
+            os.path.abspath(__file__), "--child", "benchmark_config.json"],
+            cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    if returncode != 0:
+        raise Exception("Benchmark " + config_name(config) + " failed, see " +
+            os.path.join(workdir, "benchmark_log.txt") + ".")
+
+    with open(os.path.join(workdir, "benchmark_result.json"), "r") as f:
+        result = OrderedDict(config)
+        result.update(json.load(f))
+    result["workdir"] = workdir
+
+    return result
+
+def run_child(config_file):
+    """
+    Run a benchmark script in this process, with its parameters overridden,
+    and save the results in benchmark_result.json in the current directory.
+    :param config_file: .json file with the child configuration.
+    """
+    with open(config_file, "r") as f:
+        config = json.load(f)
+    scriptdir = config["scriptdir"]
+    sys.path.insert(0, scriptdir)
+    sys.argv = [os.path.join(scriptdir, config["script"] + ".py")]
+
+    params = load_parameters(scriptdir, config["params"],
+        config["overrides"])
+    if config["script"] == config["params"]:
+        script = params
+    else:
+        script = importlib.import_module(config["script"])
+
+    # time the data compression
+    compress_times = []
+    compress_data = script.compress_data
+    def timed_compress_data(*args):
+        compress_time = time.time()
+        compress_data(*args)
+        compress_times.append(time.time() - compress_time)
+    script.compress_data = timed_compress_data
+
+    start_time = time.time()
+    script.main()
+    total_time = time.time() - start_time
+
+    stats = params.emulator.stats()
+    archives = [os.path.abspath(datafile) for datafile in os.listdir(".")
+        if datafile.endswith(".zip") or datafile.endswith(".tar.gz")]
+    peak_rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) # kB
+    sweep_time = total_time - sum(compress_times)
+    result = {
+        "nchannels used"      : int(params.nchannels),
+        "tones"               : stats["tones"],
+        "bram reads"          : stats["bram reads"],
+        "bytes read"          : stats["bytes read"],
+        "total time s"        : total_time,
+        "tones per s"         : stats["tones"] / sweep_time,
+        "bytes read per tone" : float(stats["bytes read"]) / 
+            max(stats["tones"], 1),
+        "peak rss mb"         : peak_rss / 1024.0,
+        "archive"             : archives[0] if archives else None,
+        "archive size bytes"  : sum(os.path.getsize(archive) for archive in
+            archives),
+        "compress time s"     : sum(compress_times)}
+    with open("benchmark_result.json", "w") as f:
+        json.dump(result, f, indent=4, sort_keys=True)
+
+def load_parameters(scriptdir, name, overrides):
+    """
+    Import a parameters module (or a script with its parameters inline),
+    executing the overrides right before its derivative parameters.
+    :param scriptdir: directory of the module.
+    :param name: module name.
+    :param overrides: list of python statements.
+    :return: imported module.
+    """
+    filename = os.path.join(scriptdir, name + ".py")
+    with open(filename, "r") as f:
+        source = f.read()
+    derivative = source.index("# derivative parameters")
+    source = source[:derivative] + "# benchmark parameters\n" + \
+        "\n".join(overrides) + "\n\n" + source[derivative:]
+
+    module = types.ModuleType(name)
+    module.__file__ = filename
+    sys.modules[name] = module
+    exec(compile(source, filename, "exec"), module.__dict__)
+
+    return module
+
+def print_result(result):
+    """
+    Print the metrics of a benchmark run.
+    :param result: run results.
+    """
+    print("    tones: " + str(result["tones"]) + ", " +
+        ", ".join(metric + ": " + "%.4g" % result[metric]
+        for metric in metrics))
+
+def compare_results(filename, results):
+    """
+    Print the change of the metrics with respect to a previous benchmark,
+    for the runs with the same configuration.
+    :param filename: results .json file of the previous benchmark.
+    :param results: results of the current benchmark.
+    """
+    with open(filename, "r") as f:
+        old_results = json.load(f)["results"]
+
+    print("Comparison with " + filename + ":")
+    for result in results:
+        for old_result in old_results:
+            if all(old_result[key] == result[key] for key in
+                ["script", "nchannels", "chnl step", "lo grid"]):
+                print(config_name(result) + ":")
+                for metric in metrics:
+                    old_value = old_result[metric]; value = result[metric]
+                    change = 100.0 * (value - old_value) / old_value \
+                        if old_value != 0 else float('nan')
+                    print("    " + metric + ": " + "%.4g" % old_value +
+                        " -> " + "%.4g" % value + " (" + "%+.1f" % change +
+                        "%)")
+
+if __name__ == "__main__":
+    main()
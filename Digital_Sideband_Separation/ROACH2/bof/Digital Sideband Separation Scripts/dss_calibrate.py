@@ -1,15 +1,30 @@
 #!/usr/bin/python
 # Script for tone calibration of digital sideband separating receiver. Computes 
 # the magnitude ratio and phase difference of backend by sweeping a tone with 
-# a signal generator.
+# a signal generator. With several generators per sideband, the tones are 
+# swept at the same time in separated channels (multi-tone sweep). With 
+# adaptive accumulation, the accumulation length of every tone is set from 
+# its expected SNR.
 # It then saves the data into a compress folder, for later be used as 
 # calibration constants with an srr computation script.
 
 # imports
-import os, time, tarfile, shutil, json
+import os, sys, time, json
 import numpy as np
 import matplotlib.pyplot as plt
 import calandigital as cd
+# shared modules (bram_io, live_plot, etc.)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    "..", "..", "..", "..", "Common_Scripts"))
+from bram_io import RoachPool, AccPoller
+from sweep_pipeline import SweepPipeline
+from live_plot import LivePlot
+from rawdata_store import RawDataStore
+from tone_sweeper import ToneSweeper
+from acc_len_control import AccLenControl
+from cal_interp import interp_caldata, estimate_interp_error, error2srr, \
+    save_interp_srr, refine_chnls
+from data_archive import compress_data
 from dss_parameters import *
 
 def main():
@@ -29,27 +44,39 @@ def make_pre_measurements_actions():
     - setting initial registers in FPGA
     - turning on generator power
     """
-    global roach, rf_generator, fig, lines
+    global roach, roach_pool, generators, tone_sweepers, live_plot
 
-    roach = cd.initialize_roach(roach_ip)
-    rf_generator = rm.open_resource(rf_generator_name)
+    # start the plot process before opening connections or starting threads
+    live_plot = LivePlot(create_figure)
+
+    roach = initialize_roach(roach_ip)
+    roach_pool = RoachPool(roach, roach_ip, nconnections,
+        initialize_roach=initialize_roach)
+    generators = {}
+    for name in sum(tone_generator_names.values(), []):
+        generators[name] = rm.open_resource(name)
+    tone_sweepers = dict((name, ToneSweeper(generator, rf_power, 
+        rf_list_sweep, rf_list_size)) for name, generator in 
+        generators.items())
 
     print("Setting up plotting and data saving elements...")
-    fig, lines = create_figure()
     make_data_directory()
     print("done")
 
     print("Setting accumulation register to " + str(acc_len) + "...")
     roach.write_int(cal_acc_len_reg, acc_len)
+    if adaptive_acc_len:
+        # the accumulations share the period of the longest length
+        roach.write_int(syn_acc_len_reg, acc_len)
     print("done")
     print("Resseting counter registers...")
     roach.write_int(cnt_rst_reg, 1)
     roach.write_int(cnt_rst_reg, 0)
     print("done")
     
-    print("Setting instruments power and outputs...")
-    rf_generator.write("power " + str(rf_power))
-    rf_generator.write("outp on")
+    print("Setting instruments power...")
+    for generator in generators.values():
+        generator.write("power " + str(rf_power))
     print("done")
 
 def make_dss_measurements():
@@ -83,8 +110,11 @@ def make_post_measurements_actions():
     - compress data
     """
     print("Turning off instruments...")
-    rf_generator.write("outp off")
+    for generator in generators.values():
+        generator.write("outp off")
     rm.close()
+    roach_pool.close()
+    live_plot.close()
     print("done")
 
     print("Compressing data...")
@@ -146,8 +176,20 @@ def make_data_directory():
     testinfo["nchannels"]         = nchannels
     testinfo["acc len"]           = acc_len
     testinfo["chnl step"]         = chnl_step
+    testinfo["rawdata step"]      = rawdata_step
+    testinfo["wait accs"]         = wait_accs
+    testinfo["interp method"]     = interp_method
+    testinfo["interp degree"]     = interp_degree
+    testinfo["consts nbits"]      = consts_nbits
+    testinfo["consts binpt"]      = consts_binpt
+    testinfo["adaptive sweep"]    = adaptive_sweep
     testinfo["lo freq ghz"]       = lo_freq
     testinfo["rf generator name"] = rf_generator_name
+    testinfo["tone generator names"] = tone_generator_names
+    testinfo["multitone guard"]   = multitone_guard
+    testinfo["adaptive acc len"]  = adaptive_acc_len
+    testinfo["acc snr target db"] = acc_snr_target
+    testinfo["acc len range"]     = acc_len_range
     testinfo["rf power dbm"]      = rf_power
 
     with open(cal_datadir + "/testinfo.json", "w") as f:
@@ -162,61 +204,331 @@ def get_caldata(rf_freqs, tone_sideband):
     Sweep a tone through a sideband and get the calibration data.
     The calibration data is the power of each tone in both inputs (a and b)
     and the cross-correlation of both inputs as a complex number (ab*).
-    The full sprecta measured for each tone is saved to data for debugging
-    purposes.
+    The full sprecta measured every rawdata_step tones is saved to data for 
+    debugging purposes. For the rest of the tones only the tone channel is 
+    read. In adaptive sweeps, after the test_channels tones, new tones are
+    added in passes where the calibration data is not resolved. In multi-tone
+    sweeps the generators of the sideband measure several tones per
+    accumulation, and the isolation of the tones is checked. With adaptive
+    accumulation, the noise floor is measured first with the tones off.
     :param rf_freqs: frequencies of the tones to perform the sweep (in GHz).
     :param tone_sideband: sideband of the injected test tone. Either USB or LSB
     :return: calibration data: a2, b2, and ab.
     """
-    fig.canvas.set_window_title(tone_sideband.upper() + " Tone Sweep")
-
-    a2_arr = []; b2_arr = []; ab_arr = []
-    for i, chnl in enumerate(test_channels):
-        # set test tone
-        freq = rf_freqs[chnl]
-        rf_generator.ask("freq " + str(freq) + " ghz; *opc?")
-        time.sleep(pause_time)
-
-        # read data
-        a2    = cd.read_interleave_data(roach, bram_a2,    bram_addr_width, 
-                                        bram_word_width,   pow_data_type)
-        b2    = cd.read_interleave_data(roach, bram_b2,    bram_addr_width, 
-                                        bram_word_width,   pow_data_type)
-        ab_re = cd.read_interleave_data(roach, bram_ab_re, bram_addr_width, 
-                                        bram_word_width,   crosspow_data_type)
-        ab_im = cd.read_interleave_data(roach, bram_ab_im, bram_addr_width, 
-                                        bram_word_width,   crosspow_data_type)
-
-        # append data to arrays
-        a2_arr.append(a2[chnl])
-        b2_arr.append(b2[chnl])
-        ab_arr.append(ab_re[chnl] + 1j*ab_im[chnl])
+    live_plot.set_title(tone_sideband.upper() + " Tone Sweep")
+    tone_generators = set_tone_generators(tone_sideband)
+    sweepers = [tone_sweepers[name] for name in 
+        tone_generator_names[tone_sideband]]
+
+    pipeline = SweepPipeline()
+    acc_poller = AccPoller(roach, bram_a2, bram_addr_width, bram_word_width, 
+        pow_data_type, acc_cnt_reg)
+    rawdata = RawDataStore(cal_datadir + "/rawdata_tone_" + tone_sideband, 
+        cal_nsnaps, nchannels, {'a2' : pow_data_type, 
+        'b2' : pow_data_type, 'ab_re' : crosspow_data_type, 
+        'ab_im' : crosspow_data_type})
+    caldata = {} # {chnl : (a2, b2, ab)}
+    isolation = {} # {chnl : isolation (dB)} of multi-tone steps
+    acc_control = None
+    if adaptive_acc_len:
+        acc_control = AccLenControl(roach, [cal_acc_len_reg, 
+            syn_acc_len_reg], acc_len, acc_snr_target, acc_len_range)
+        measure_noise_floor(tone_generators, acc_control, pipeline, 
+            acc_poller)
+
+    # clear the plot lines of the previous sweep
+    live_plot.update({2 : ([], []), 3 : ([], [])})
+    chnls = list(test_channels)
+    while len(chnls) > 0:
+        measure_tones(chnls, rf_freqs, sweepers, caldata, isolation,
+            pipeline, acc_poller, rawdata, acc_control)
+        if not adaptive_sweep:
+            break
+
+        # add tones where the interpolation is not good enough
+        sweep_chnls = sorted(caldata)
+        a2_arr, b2_arr, ab_arr = [np.array([caldata[chnl][j] for chnl in 
+            sweep_chnls]) for j in range(3)]
+        chnls = refine_chnls(sweep_chnls, a2_arr, b2_arr, ab_arr, 
+            tone_sideband, interp_srr_target, adaptive_min_step, 
+            interp_method, interp_degree)
+        chnls = chnls[:cal_ntones - len(caldata)]
+        if len(chnls) > 0:
+            print("Adaptive sweep: adding " + str(len(chnls)) + " tones...")
+    pipeline.close()
+    rawdata.close()
+
+    # get the data of the measured tones in channel order
+    sweep_chnls = sorted(caldata)
+    a2_arr, b2_arr, ab_arr = [np.array([caldata[chnl][j] for chnl in 
+        sweep_chnls]) for j in range(3)]
+    sweep_freqs = if_freqs[sweep_chnls]
+    save_sweep_info(tone_sideband, {"sweep chnls" : [int(chnl) for chnl in
+        sweep_chnls]})
+    if len(isolation) > 0:
+        save_sweep_info(tone_sideband, {"multitone isolation db" : 
+            min(isolation.values())})
+        print_isolation(isolation)
+    if acc_control is not None:
+        acc_control.reset()
+        save_sweep_info(tone_sideband, {"tone acc lens" : 
+            [acc_control.acc_lens[chnl] for chnl in sweep_chnls]})
+        print("Adaptive accumulation: integration time " + 
+            "%.1f" % (100*acc_control.time_ratio()) + 
+            "[%] of the acc_len sweep")
+
+    # estimate the interpolation error, and compute interpolations
+    interp_srr = error2srr(estimate_interp_error(sweep_freqs, a2_arr, 
+        b2_arr, ab_arr, tone_sideband, interp_method, interp_degree))
+    save_interp_srr(cal_datadir + "/testinfo.json", tone_sideband, interp_srr)
+    print_interp_srr(interp_srr)
+    a2_arr, b2_arr, ab_arr = interp_caldata(if_freqs, sweep_freqs, a2_arr,
+        b2_arr, ab_arr, interp_method, interp_degree)
 
-        # scale and dBFS data for plotting
-        a2_plot = cd.scale_and_dBFS_specdata(a2, acc_len, dBFS)
-        b2_plot = cd.scale_and_dBFS_specdata(b2, acc_len, dBFS)
-
-        # compute input ratios for plotting
-        ab_ratios = np.divide(ab_arr, b2_arr)
-
-        # plot data
-        lines[0].set_data(if_freqs, a2_plot)
-        lines[1].set_data(if_freqs, b2_plot)
-        lines[2].set_data(if_test_freqs[:i+1], np.abs(ab_ratios))
-        lines[3].set_data(if_test_freqs[:i+1], np.angle(ab_ratios, deg=True))
-        fig.canvas.draw()
-        fig.canvas.flush_events()
+    return a2_arr, b2_arr, ab_arr
+
+def set_tone_generators(tone_sideband):
+    """
+    Turn on the generators of the tones of a sideband, and turn off the
+    generators used only in the other sideband.
+    :param tone_sideband: sideband of the sweep.
+    :return: list of generators of the sideband.
+    """
+    names = tone_generator_names[tone_sideband]
+    for name, generator in generators.items():
+        generator.write("outp on" if name in names else "outp off")
+
+    return [generators[name] for name in names]
+
+def measure_noise_floor(tone_generators, acc_control, pipeline, acc_poller):
+    """
+    Measure the noise floor of both inputs with the tone generators off, for
+    the SNR estimation of the adaptive accumulation.
+    :param tone_generators: generators of the tones of the sweep.
+    :param acc_control: AccLenControl of the sweep.
+    :param pipeline: SweepPipeline of the sweep.
+    :param acc_poller: AccPoller of the sweep.
+    """
+    for generator in tone_generators:
+        generator.write("outp off")
+    if wait_accs:
+        acc_poller.mark(nchannels//2)
+        pipeline.settle(pause_time, acc_poller.ready)
+    else:
+        pipeline.settle(pause_time)
+    a2, b2 = roach_pool.read_interleave_groups([bram_a2, bram_b2], 
+        bram_addr_width, bram_word_width, [pow_data_type, pow_data_type])
+    acc_control.set_noise_floor(a2, b2)
+    for generator in tone_generators:
+        generator.write("outp on")
+
+def make_tone_steps(chnls, ntones):
+    """
+    Group the tones of a sweep into steps of simultaneous tones. The
+    channels are split into ntones contiguous segments, one per generator,
+    and every step takes a tone of each segment, so that the tones of a step
+    are far apart.
+    :param chnls: channels of the tones, sorted.
+    :param ntones: number of tones per step (number of generators).
+    :return: list of steps, each a list of channels in generator order. The
+        last steps can have less tones.
+    """
+    segments = [list(segment) for segment in np.array_split(chnls, ntones)]
+    nsteps = max(len(segment) for segment in segments)
+
+    return [[int(segment[j]) for segment in segments if j < len(segment)] 
+        for j in range(nsteps)]
+
+def measure_tones(chnls, rf_freqs, sweepers, caldata, isolation, 
+    pipeline, acc_poller, rawdata, acc_control=None):
+    """
+    Measure the calibration data of a list of tones.
+    :param chnls: channels of the tones.
+    :param rf_freqs: frequencies of the tones of every channel (in GHz).
+    :param sweepers: ToneSweeper of the generators of the tones. With more
+        than one generator, a step of several tones is measured per 
+        accumulation.
+    :param caldata: dictionary with the calibration data of every measured 
+        channel, updated with the new tones: {chnl : (a2, b2, ab)}.
+    :param isolation: dictionary with the isolation of the tones of 
+        multi-tone steps, updated with the new tones: {chnl : isolation}.
+    :param pipeline: SweepPipeline of the sweep.
+    :param acc_poller: AccPoller of the sweep.
+    :param rawdata: RawDataStore of the sweep.
+    :param acc_control: AccLenControl of the sweep for adaptive accumulation
+        (None for acc_len in all the tones). The readings are rescaled to 
+        acc_len.
+    """
+    cal_brams  = [bram_a2, bram_b2, bram_ab_re, bram_ab_im]
+    cal_dtypes = [pow_data_type, pow_data_type, crosspow_data_type, crosspow_data_type]
+    multitone = len(sweepers) > 1
+    steps = make_tone_steps(sorted(chnls), len(sweepers))
+    for j, sweeper in enumerate(sweepers):
+        sweeper.start([rf_freqs[step[j]] for step in steps if j < len(step)])
+    for step in steps:
+        # index of the first tone of the step in the whole sweep
+        i = len(caldata)
+        # read full spectra for debug snapshots and multi-tone steps (for 
+        # the isolation check)
+        # (when the sweep index of a tone of the step is a multiple of 
+        # rawdata_step)
+        snapshot = rawdata_step > 0 and (-i) % rawdata_step < len(step)
+
+        # set the accumulation length of the step, snapshots use acc_len
+        # (they are saved without rescaling). The accumulation running with
+        # the previous length must end, and then a full accumulation with
+        # the new length (pause_time covers two acc_len accumulations)
+        settle_time = pause_time
+        if acc_control is not None:
+            prev_ratio = float(acc_control.acc_len) / acc_len
+            acc_ratio  = float(acc_control.set_acc_len(step, snapshot)) / \
+                acc_len
+            settle_time = pause_time * (max(prev_ratio, acc_ratio) + 
+                acc_ratio/2)
+            if wait_accs:
+                settle_time = max(settle_time, pause_time)
+
+        # set test tones, generators without tone in the step keep their 
+        # last tone (far from the tones of the step)
+        for sweeper in sweepers[:len(step)]:
+            sweeper.next()
+
+        # wait for the tones to settle while plotting previous tones
+        if wait_accs:
+            acc_poller.mark(step[0])
+            pipeline.settle(settle_time, acc_poller.ready)
+        else:
+            pipeline.settle(settle_time)
+
+        # read data, full spectra only for debug snapshots and multi-tone
+        # steps
+        if snapshot or multitone:
+            a2, b2, ab_re, ab_im = roach_pool.read_interleave_groups(cal_brams,
+                bram_addr_width, bram_word_width, cal_dtypes)
+            step_data = [(a2[chnl], b2[chnl], ab_re[chnl], ab_im[chnl]) 
+                for chnl in step]
+        else:
+            step_data = [roach_pool.read_chnl_groups(cal_brams, 
+                bram_addr_width, bram_word_width, cal_dtypes, step[0])]
+
+        # rescale the readings to acc_len, and update the tone power for
+        # the next step
+        if acc_control is not None:
+            acc_control.update(step, [data[0] for data in step_data], 
+                [data[1] for data in step_data])
+            step_data = [acc_control.rescale(np.array(data, dtype=float)) 
+                for data in step_data]
+            if multitone and not snapshot:
+                a2, b2 = acc_control.rescale(a2.astype(float)), \
+                    acc_control.rescale(b2.astype(float))
+
+        for j, chnl in enumerate(step):
+            # save data
+            a2_chnl, b2_chnl, ab_re_chnl, ab_im_chnl = step_data[j]
+            caldata[chnl] = (a2_chnl, b2_chnl, ab_re_chnl + 1j*ab_im_chnl)
+
+            # plot data in the next settle time
+            spectra = [a2, b2] if (snapshot or multitone) and j == 0 else None
+            pipeline.defer(plot_caldata, if_freqs[chnl], b2_chnl, 
+                ab_re_chnl + 1j*ab_im_chnl, spectra)
+
+        # check isolation of the tones 
+        if multitone:
+            isolation.update(get_isolation(a2.astype(float) + b2, step))
         
-        # save data
-        np.savez(cal_datadir+"/rawdata_tone_" + tone_sideband + "/chnl_" + 
-        str(chnl), a2=a2, b2=b2, ab_re=ab_re, ab_im=ab_im)
+        # save raw data in background
+        if snapshot:
+            pipeline.submit(rawdata.append, step[(-i) % rawdata_step], 
+                a2=a2, b2=b2, ab_re=ab_re, ab_im=ab_im)
+    for sweeper in sweepers:
+        sweeper.stop()
+
+def get_isolation(power, step):
+    """
+    Compute the isolation of the tones of a multi-tone step: the power of
+    every tone over the maximum power of the multitone_guard channels at
+    each side of it. Leakage of the other tones (e.g. spurious or
+    intermodulation products) raises the guard channels.
+    :param power: power spectrum of the step (a2 + b2).
+    :param step: channels of the tones of the step.
+    :return: dictionary with the isolation of every tone (dB).
+    """
+    isolation = {}
+    for chnl in step:
+        guard = list(range(max(chnl-multitone_guard, 0), chnl)) + \
+            list(range(chnl+1, min(chnl+multitone_guard+1, nchannels)))
+        isolation[chnl] = 10*np.log10(power[chnl] / 
+            max(np.max(power[guard]), 1))
 
-    # compute interpolations
-    a2_arr = np.interp(if_freqs, if_test_freqs, a2_arr)
-    b2_arr = np.interp(if_freqs, if_test_freqs, b2_arr)
-    ab_arr = np.interp(if_freqs, if_test_freqs, ab_arr)
+    return isolation
 
-    return a2_arr, b2_arr, ab_arr
+def print_isolation(isolation):
+    """
+    Print the worst isolation of the tones of a multi-tone sweep, with a
+    warning if it is below the multitone_isolation limit.
+    :param isolation: dictionary with the isolation of every tone (dB).
+    """
+    bad_chnls = sorted(chnl for chnl, iso in isolation.items() 
+        if iso < multitone_isolation)
+    print("Multi-tone isolation: min " + 
+        str(round(min(isolation.values()), 1)) + "[dB]")
+    if len(bad_chnls) > 0:
+        print("Warning: multi-tone isolation below the " + 
+            str(multitone_isolation) + "[dB] limit in channels " + 
+            str(bad_chnls) + ", use fewer generators or a larger guard.")
+
+def save_sweep_info(tone_sideband, info):
+    """
+    Record information of a sweep in the test info file, e.g. the channels
+    of the measured tones (they are test_channels unless the sweep is
+    adaptive).
+    :param tone_sideband: sideband of the sweep.
+    :param info: dictionary with the information to save: 
+        {key : value}, saved as testinfo[key][tone_sideband] = value.
+    """
+    with open(cal_datadir + "/testinfo.json", "r") as f:
+        testinfo = json.load(f)
+    for key, value in info.items():
+        testinfo.setdefault(key, {})[tone_sideband] = value
+    with open(cal_datadir + "/testinfo.json", "w") as f:
+        json.dump(testinfo, f, indent=4, sort_keys=True)
+
+def print_interp_srr(interp_srr):
+    """
+    Print the SRR allowed by the interpolation of the calibration data of a
+    sweep, and warn if it is lower than interp_srr_target.
+    :param interp_srr: SRR estimate at every tone (dB, NaN if not estimated).
+    """
+    interp_srr = interp_srr[np.isfinite(interp_srr)]
+    if len(interp_srr) == 0:
+        return
+    print("Interpolation SRR estimate: min " + "%.1f" % np.min(interp_srr) +
+        "[dB], median " + "%.1f" % np.median(interp_srr) + "[dB]")
+    if np.min(interp_srr) < interp_srr_target:
+        print("Warning: interpolation SRR estimate below the " + 
+            str(interp_srr_target) + "[dB] target, use a smaller chnl_step.")
+
+def plot_caldata(if_freq, b2_chnl, ab_chnl, spectra=None):
+    """
+    Plot the calibration data of the last tone measured in a sweep. Only the
+    new tone is computed and sent to the plot.
+    :param if_freq: IF frequency of the tone.
+    :param b2_chnl: power of input b at the tone.
+    :param ab_chnl: crosspower of inputs a and b at the tone.
+    :param spectra: full a2 and b2 spectra of the last tone. If None, the
+        spectra plots are not updated.
+    """
+    # compute input ratio of the new tone
+    ab_ratio = ab_chnl / b2_chnl
+
+    if spectra is not None:
+        # scale and dBFS data for plotting
+        a2_plot = cd.scale_and_dBFS_specdata(spectra[0], acc_len, dBFS)
+        b2_plot = cd.scale_and_dBFS_specdata(spectra[1], acc_len, dBFS)
+        live_plot.update({0 : (if_freqs, a2_plot), 1 : (if_freqs, b2_plot)})
+    live_plot.append({
+        2 : ([if_freq], [np.abs(ab_ratio)]),
+        3 : ([if_freq], [np.angle(ab_ratio, deg=True)])})
 
 def print_data():
     """
@@ -250,17 +562,5 @@ def print_data():
     plt.ylabel('Angle diff [degrees]')     
     plt.savefig(cal_datadir+'/angle_diff.pdf')
 
-def compress_data(datadir):
-    """
-    Compress the data from the datadir directory into a .tar.gz
-    file and delete the original directory.
-    :param datair: directory to compress.
-    """
-    tar = tarfile.open(datadir + ".tar.gz", "w:gz")
-    for datafile in os.listdir(datadir):
-        tar.add(datadir + '/' + datafile, datafile)
-    tar.close()
-    shutil.rmtree(datadir)
-
 if __name__ == "__main__":
     main()
@@ -0,0 +1,287 @@
+#!/usr/bin/python
+# Script for broadband noise calibration of digital sideband separating
+# receiver. A noise source is injected into each sideband in turn, and the
+# power of each input and their crosspower are averaged over noise_naccs
+# accumulations in all the channels at once. This replaces the two tone
+# sweeps of dss_calibrate.py with two integrations.
+# The data is saved with the same format as the tone calibration (caldata.npz
+# with the *_toneusb and *_tonelsb arrays) into a compress folder, for later
+# be used as calibration constants with an srr computation script.
+
+# imports
+import os, sys, time, json
+import numpy as np
+import matplotlib.pyplot as plt
+import calandigital as cd
+# shared modules (bram_io, live_plot, etc.)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    "..", "..", "..", "..", "Common_Scripts"))
+from bram_io import RoachPool, AccPoller
+from sweep_pipeline import SweepPipeline
+from live_plot import LivePlot
+from data_archive import compress_data
+from dss_parameters import *
+
+def main():
+    start_time = time.time()
+
+    make_pre_measurements_actions()
+    make_dss_measurements()
+    make_post_measurements_actions()
+
+    print("Finished. Total time: " + str(int(time.time() - start_time)) + "[s]")
+
+def make_pre_measurements_actions():
+    """
+    Makes all the actions in preparation for the measurements:
+    - initizalize ROACH and noise source communications.
+    - creating plotting and data saving elements
+    - setting initial registers in FPGA
+    - turning off the noise source
+    """
+    global roach, roach_pool, noise_source, live_plot
+
+    # start the plot process before opening connections or starting threads
+    live_plot = LivePlot(create_figure)
+
+    roach = initialize_roach(roach_ip)
+    roach_pool = RoachPool(roach, roach_ip, nconnections,
+        initialize_roach=initialize_roach)
+    noise_source = rm.open_resource(noise_source_name)
+
+    print("Setting up plotting and data saving elements...")
+    make_data_directory()
+    print("done")
+
+    print("Setting accumulation register to " + str(acc_len) + "...")
+    roach.write_int(cal_acc_len_reg, acc_len)
+    print("done")
+    print("Resseting counter registers...")
+    roach.write_int(cnt_rst_reg, 1)
+    roach.write_int(cnt_rst_reg, 0)
+    print("done")
+
+    print("Turning noise source off...")
+    noise_source.write(noise_cmds['off'])
+    print("done")
+
+def make_dss_measurements():
+    """
+    Makes the measurements for dss noise calibration.
+    """
+    if noise_off_correction:
+        print("Integrating receiver noise...")
+        a2_off, b2_off, _ = get_caldata("off")
+        print("done")
+    else:
+        print("Warning: noise_off_correction is off, the receiver noise " +
+            "biases the constants magnitude by S/(S+N) (SRR limited to " +
+            "about twice the excess noise ratio in dB, plus 6 dB).")
+        a2_off, b2_off = 0, 0
+
+    print("Integrating noise in upper sideband...")
+    a2_toneusb, b2_toneusb, ab_toneusb = get_caldata("usb")
+    print("done")
+
+    print("Integrating noise in lower sideband...")
+    a2_tonelsb, b2_tonelsb, ab_tonelsb = get_caldata("lsb")
+    print("done")
+
+    # remove the receiver noise from the powers, the crosspower is not
+    # biased by the (uncorrelated) receiver noise
+    a2_toneusb = a2_toneusb - a2_off; a2_tonelsb = a2_tonelsb - a2_off
+    b2_toneusb = b2_toneusb - b2_off; b2_tonelsb = b2_tonelsb - b2_off
+
+    print("Saving data...")
+    np.savez(noise_datadir+"/caldata",
+        a2_toneusb=a2_toneusb, b2_toneusb=b2_toneusb, ab_toneusb=ab_toneusb,
+        a2_tonelsb=a2_tonelsb, b2_tonelsb=b2_tonelsb, ab_tonelsb=ab_tonelsb)
+    print("done")
+
+    print("Printing data...")
+    print_data()
+    print("done")
+
+def make_post_measurements_actions():
+    """
+    Makes all the actions required after measurements:
+    - turn off sources
+    - compress data
+    """
+    print("Turning off instruments...")
+    noise_source.write(noise_cmds['off'])
+    rm.close()
+    roach_pool.close()
+    live_plot.close()
+    print("done")
+
+    print("Compressing data...")
+    compress_data(noise_datadir)
+    print("done")
+
+def create_figure():
+    """
+    Creates figure for plotting.
+    """
+    fig, [[ax0, ax1], [ax2, ax3]] = plt.subplots(2,2)
+    fig.set_tight_layout(True)
+    fig.show()
+    fig.canvas.draw()
+
+    # get line objects
+    line0, = ax0.plot([],[])
+    line1, = ax1.plot([],[])
+    line2, = ax2.plot([],[])
+    line3, = ax3.plot([],[])
+    lines  = [line0, line1, line2, line3]
+
+    # set spectrometers axes
+    ax0.set_xlim((0, bandwidth))     ; ax1.set_xlim((0, bandwidth))
+    ax0.set_ylim((-85, 5))           ; ax1.set_ylim((-85, 5))
+    ax0.grid()                       ; ax1.grid()
+    ax0.set_xlabel('Frequency [MHz]'); ax1.set_xlabel('Frequency [MHz]')
+    ax0.set_ylabel('Power [dBFS]')   ; ax1.set_ylabel('Power [dBFS]')
+    ax0.set_title('ZDOK0 spec')      ; ax1.set_title('ZDOK1 spec')
+
+    # set magnitude diference axis
+    ax2.set_xlim((0, bandwidth))
+    ax2.set_ylim((0, 2))
+    ax2.grid()
+    ax2.set_xlabel('Frequency [MHz]')
+    ax2.set_ylabel('Mag ratio [lineal]')
+
+    # set magnitude diference axis
+    ax3.set_xlim((0, bandwidth))
+    ax3.set_ylim((-200, 200))
+    ax3.grid()
+    ax3.set_xlabel('Frequency [MHz]')
+    ax3.set_ylabel('Angle diff [degrees]')
+
+    return fig, lines
+
+def make_data_directory():
+    """
+    Make directory where to save all the calibration data.
+    """
+    os.mkdir(noise_datadir)
+
+    # make .json file with test info
+    testinfo = {}
+    testinfo["roach ip"]             = roach_ip
+    testinfo["date time"]            = date_time
+    testinfo["boffile"]              = boffile
+    testinfo["bandwidth mhz"]        = bandwidth
+    testinfo["nchannels"]            = nchannels
+    testinfo["acc len"]              = acc_len
+    testinfo["consts nbits"]         = consts_nbits
+    testinfo["consts binpt"]         = consts_binpt
+    testinfo["cal mode"]             = "noise"
+    testinfo["noise naccs"]          = noise_naccs
+    testinfo["noise off correction"] = noise_off_correction
+    testinfo["wait accs"]            = wait_accs
+    testinfo["lo freq ghz"]          = lo_freq
+    testinfo["noise source name"]    = noise_source_name
+
+    with open(noise_datadir + "/testinfo.json", "w") as f:
+        json.dump(testinfo, f, indent=4, sort_keys=True)
+
+def get_caldata(noise_sideband):
+    """
+    Get the calibration data with the noise source injected into a sideband.
+    The calibration data is the power of each input (a and b) and the
+    cross-correlation of both inputs as a complex number (ab*), of all the
+    channels, averaged over noise_naccs accumulations. Every accumulation is
+    plotted while waiting for the next one.
+    :param noise_sideband: sideband where the noise is injected. Either usb,
+        lsb or off (receiver noise only).
+    :return: calibration data: a2, b2, and ab.
+    """
+    live_plot.set_title(noise_sideband.upper() + " Noise Integration")
+
+    cal_brams  = [bram_a2, bram_b2, bram_ab_re, bram_ab_im]
+    cal_dtypes = [pow_data_type, pow_data_type, crosspow_data_type, crosspow_data_type]
+    pipeline = SweepPipeline()
+    acc_poller = AccPoller(roach, bram_a2, bram_addr_width, bram_word_width,
+        pow_data_type, acc_cnt_reg)
+    a2_sum = np.zeros(nchannels)
+    b2_sum = np.zeros(nchannels)
+    ab_sum = np.zeros(nchannels, dtype=complex)
+
+    # inject noise, the accumulation running during the change is discarded
+    noise_source.write(noise_cmds[noise_sideband])
+    for i in range(noise_naccs):
+        # wait for the next accumulation while plotting the previous one
+        if wait_accs:
+            acc_poller.mark(nchannels//2)
+            pipeline.settle(pause_time, acc_poller.ready)
+            acc_poller.naccs = 1
+        else:
+            pipeline.settle(pause_time)
+
+        # read data
+        a2, b2, ab_re, ab_im = roach_pool.read_interleave_groups(cal_brams,
+            bram_addr_width, bram_word_width, cal_dtypes)
+
+        # add data to the average
+        a2_sum += a2
+        b2_sum += b2
+        ab_sum += ab_re + 1j*ab_im
+
+        # plot data in the next wait
+        pipeline.defer(plot_caldata, a2, b2, ab_re + 1j*ab_im)
+    pipeline.close()
+
+    return a2_sum / noise_naccs, b2_sum / noise_naccs, ab_sum / noise_naccs
+
+def plot_caldata(a2, b2, ab):
+    """
+    Plot the calibration data of an accumulation.
+    :param a2: power of input a.
+    :param b2: power of input b.
+    :param ab: crosspower of inputs a and b.
+    """
+    # scale and dBFS data for plotting
+    a2_plot = cd.scale_and_dBFS_specdata(a2, acc_len, dBFS)
+    b2_plot = cd.scale_and_dBFS_specdata(b2, acc_len, dBFS)
+
+    # compute input ratios for plotting
+    ab_ratios = ab / np.maximum(b2, 1)
+
+    live_plot.update({0 : (if_freqs, a2_plot), 1 : (if_freqs, b2_plot),
+        2 : (if_freqs, np.abs(ab_ratios)),
+        3 : (if_freqs, np.angle(ab_ratios, deg=True))})
+
+def print_data():
+    """
+    Print the saved data to .pdf images for an easy check.
+    """
+    # get data
+    caldata = np.load(noise_datadir + "/caldata.npz")
+    a2_toneusb = caldata['a2_toneusb']; a2_tonelsb = caldata['a2_tonelsb']
+    b2_toneusb = caldata['b2_toneusb']; b2_tonelsb = caldata['b2_tonelsb']
+    ab_toneusb = caldata['ab_toneusb']; ab_tonelsb = caldata['ab_tonelsb']
+
+    # compute ratios
+    ab_ratios_usb = ab_toneusb / b2_toneusb
+    ab_ratios_lsb = ab_tonelsb / b2_tonelsb
+
+    # print magnitude ratios
+    plt.figure()
+    plt.plot(rf_freqs_usb, np.abs(ab_ratios_usb), 'b')
+    plt.plot(rf_freqs_lsb, np.abs(ab_ratios_lsb), 'r')
+    plt.grid()
+    plt.xlabel('Frequency [GHz]')
+    plt.ylabel('Mag ratio [lineal]')
+    plt.savefig(noise_datadir+'/mag_ratios.pdf')
+
+    # print angle difference
+    plt.figure()
+    plt.plot(rf_freqs_usb, np.angle(ab_ratios_usb, deg=True), 'b')
+    plt.plot(rf_freqs_lsb, np.angle(ab_ratios_lsb, deg=True), 'r')
+    plt.grid()
+    plt.xlabel('Frequency [GHz]')
+    plt.ylabel('Angle diff [degrees]')
+    plt.savefig(noise_datadir+'/angle_diff.pdf')
+
+if __name__ == "__main__":
+    main()
@@ -5,10 +5,18 @@
 # It then saves the results into a compress folder.
 
 # imports
-import os, time, tarfile, shutil, json
+import os, sys, time, tarfile, shutil, json
 import numpy as np
 import matplotlib.pyplot as plt
 import calandigital as cd
+# shared modules (bram_io, live_plot, etc.)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    "..", "..", "..", "..", "Common_Scripts"))
+from bram_io import RoachPool, AccPoller
+from sweep_pipeline import SweepPipeline
+from live_plot import LivePlot
+from rawdata_store import RawDataStore
+from tone_sweeper import ToneSweeper
 from dss_load_constants import dss_load_constants
 from dss_parameters import *
 
@@ -29,13 +37,19 @@ def make_pre_measurements_actions():
     - setting initial registers in FPGA
     - turning on generator power
     """
-    global roach, rf_generator, fig, lines
+    global roach, roach_pool, rf_generator, tone_sweeper, live_plot
 
-    roach = cd.initialize_roach(roach_ip)
+    # start the plot process before opening connections or starting threads
+    live_plot = LivePlot(create_figure)
+
+    roach = initialize_roach(roach_ip)
+    roach_pool = RoachPool(roach, roach_ip, nconnections,
+        initialize_roach=initialize_roach)
     rf_generator = rm.open_resource(rf_generator_name)
+    tone_sweeper = ToneSweeper(rf_generator, rf_power, rf_list_sweep, 
+        rf_list_size)
 
     print("Setting up plotting and data saving elements...")
-    fig, lines = create_figure()
     make_data_directory()
     print("done")
 
@@ -58,7 +72,8 @@ def make_dss_measurements():
     """
     # loading calibration constants
     if load_consts:
-        dss_load_constants(roach, load_ideal, 0-1j, caltar)
+        dss_load_constants(roach, load_ideal, 0-1j, caltar, 
+            roach_pool=roach_pool)
 
     print("Starting tone sweep in upper sideband...")
     sweep_time = time.time()
@@ -89,6 +104,8 @@ def make_post_measurements_actions():
     print("Turning off instruments...")
     rf_generator.write("outp off")
     rm.close()
+    roach_pool.close()
+    live_plot.close()
     print("done")
 
     print("Compressing data...")
@@ -144,6 +161,8 @@ def make_data_directory():
     testinfo["nchannels"]         = nchannels
     testinfo["acc len"]           = acc_len
     testinfo["chnl step"]         = chnl_step
+    testinfo["rawdata step"]      = rawdata_step
+    testinfo["wait accs"]         = wait_accs
     testinfo["lo freq ghz"]       = lo_freq
     testinfo["rf generator name"] = rf_generator_name
     testinfo["rf power dbm"]      = rf_power
@@ -163,54 +182,65 @@ def get_srrdata(rf_freqs, tone_sideband):
     Sweep a tone through a sideband and get the srr data.
     The srr data is the power of each tone after applying the calibration
     constants for each sideband (usb and lsb).
-    The full sprecta measured for each tone is saved to data for debugging
-    purposes.
+    The full sprecta measured every rawdata_step tones is saved to data for 
+    debugging purposes. For the rest of the tones only the tone channel is 
+    read.
     :param rf_freqs: frequencies of the tones to perform the sweep (in GHz).
     :param tone_sideband: sideband of the injected test tone. Either USB or LSB
     :return: srr data: usb and lsb.
     """
-    fig.canvas.set_window_title(tone_sideband.upper() + " Tone Sweep")
-
-    usb_arr = []; lsb_arr = []
+    live_plot.set_title(tone_sideband.upper() + " Tone Sweep")
+
+    srr_brams  = [bram_usb, bram_lsb]
+    srr_dtypes = [pow_data_type, pow_data_type]
+    pipeline = SweepPipeline()
+    acc_poller = AccPoller(roach, bram_usb, bram_addr_width, bram_word_width, 
+        pow_data_type, acc_cnt_reg)
+    rawdata = RawDataStore(srr_datadir + "/rawdata_tone_" + tone_sideband, 
+        nsnapshots, nchannels, {'usb' : pow_data_type, 'lsb' : pow_data_type})
+    usb_arr = np.zeros(len(test_channels))
+    lsb_arr = np.zeros(len(test_channels))
+    srr     = np.zeros(len(test_channels))
+
+    # clear the plot lines of the previous sweep
+    live_plot.update({2 if tone_sideband=='usb' else 3 : ([], [])})
+    tone_sweeper.start([rf_freqs[chnl] for chnl in test_channels])
     for i, chnl in enumerate(test_channels):
         # set test tone
-        freq = rf_freqs[chnl]
-        rf_generator.ask("freq " + str(freq) + " ghz; *opc?")
-        time.sleep(pause_time)
-
-        # read data
-        usb = cd.read_interleave_data(roach, bram_usb, bram_addr_width, 
-                                      bram_word_width, pow_data_type)
-        lsb = cd.read_interleave_data(roach, bram_lsb, bram_addr_width, 
-                                      bram_word_width, pow_data_type)
-
-        # append data to arrays
-        usb_arr.append(usb[chnl])
-        lsb_arr.append(lsb[chnl])
-
-        # scale and dBFS data for plotting
-        usb_plot = cd.scale_and_dBFS_specdata(usb, acc_len, dBFS)
-        lsb_plot = cd.scale_and_dBFS_specdata(lsb, acc_len, dBFS)
-
-        # compute srr for plotting
-        if tone_sideband=='usb':
-            srr = np.divide(usb_arr, lsb_arr)
-        else: # tone_sideband=='lsb
-            srr = np.divide(lsb_arr, usb_arr)
-
-        # define sb plot line
-        line_sb = lines[2] if tone_sideband=='usb' else lines[3]
-
-        # plot data
-        lines[0].set_data(if_freqs, usb_plot)
-        lines[1].set_data(if_freqs, lsb_plot)
-        line_sb.set_data(if_test_freqs[:i+1], 10*np.log10(srr))
-        fig.canvas.draw()
-        fig.canvas.flush_events()
+        tone_sweeper.next()
+
+        # wait for the tone to settle while plotting previous tone
+        if wait_accs:
+            acc_poller.mark(chnl)
+            pipeline.settle(pause_time, acc_poller.ready)
+        else:
+            pipeline.settle(pause_time)
+
+        # read data, full spectra only for debug snapshots
+        snapshot = rawdata_step > 0 and i % rawdata_step == 0
+        if snapshot:
+            usb, lsb = roach_pool.read_interleave_groups(srr_brams, 
+                bram_addr_width, bram_word_width, srr_dtypes)
+            usb_chnl, lsb_chnl = usb[chnl], lsb[chnl]
+        else:
+            usb_chnl, lsb_chnl = roach_pool.read_chnl_groups(srr_brams, 
+                bram_addr_width, bram_word_width, srr_dtypes, chnl)
+
+        # save data in arrays
+        usb_arr[i] = usb_chnl
+        lsb_arr[i] = lsb_chnl
+
+        # plot data in the next settle time
+        spectra = [usb, lsb] if snapshot else None
+        pipeline.defer(plot_srrdata, tone_sideband, i, usb_arr, lsb_arr, srr,
+            spectra)
         
-        # save data
-        np.savez(srr_datadir+"/rawdata_tone_" + tone_sideband + "/chnl_" + \
-        str(chnl), usb=usb, lsb=lsb)
+        # save raw data in background
+        if snapshot:
+            pipeline.submit(rawdata.append, chnl, usb=usb, lsb=lsb)
+    tone_sweeper.stop()
+    pipeline.close()
+    rawdata.close()
 
     # compute interpolations
     usb_arr = np.interp(if_freqs, if_test_freqs, usb_arr)
@@ -218,6 +248,34 @@ def get_srrdata(rf_freqs, tone_sideband):
 
     return usb_arr, lsb_arr
 
+def plot_srrdata(tone_sideband, i, usb_arr, lsb_arr, srr, spectra=None):
+    """
+    Plot the srr data of the last tone measured in a sweep. Only the new 
+    tone is computed and sent to the plot.
+    :param tone_sideband: sideband of the injected test tone. Either USB or LSB
+    :param i: index of the tone in the sweep.
+    :param usb_arr: usb power of the sweep tones.
+    :param lsb_arr: lsb power of the sweep tones.
+    :param srr: srr of the sweep tones, updated with the new tone.
+    :param spectra: full usb and lsb spectra of the last tone. If None, the
+        spectra plots are not updated.
+    """
+    # compute srr of the new tone
+    if tone_sideband=='usb':
+        srr[i] = usb_arr[i] / lsb_arr[i]
+    else: # tone_sideband=='lsb
+        srr[i] = lsb_arr[i] / usb_arr[i]
+
+    # define sb plot line
+    line_sb = 2 if tone_sideband=='usb' else 3
+
+    if spectra is not None:
+        # scale and dBFS data for plotting
+        usb_plot = cd.scale_and_dBFS_specdata(spectra[0], acc_len, dBFS)
+        lsb_plot = cd.scale_and_dBFS_specdata(spectra[1], acc_len, dBFS)
+        live_plot.update({0 : (if_freqs, usb_plot), 1 : (if_freqs, lsb_plot)})
+    live_plot.append({line_sb : ([if_test_freqs[i]], [10*np.log10(srr[i])])})
+
 def print_data():
     """
     Print the saved data to .pdf images for an easy check.
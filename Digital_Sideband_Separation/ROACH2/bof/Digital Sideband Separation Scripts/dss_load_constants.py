@@ -1,9 +1,19 @@
 #!/usr/bin/python
-import argparse, tarfile
+import os, sys, argparse
 import numpy as np
 import calandigital as cd
+# shared modules (bram_io, live_plot, etc.)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    "..", "..", "..", "..", "Common_Scripts"))
+from data_archive import DataArchive
+from consts_cache import ConstsCache, consts_key, consts2blobs
+from bram_io import BramWriter
+from cal_interp import caldata2consts
 from dss_parameters import *
 
+consts_cache = ConstsCache(consts_cache_dir, consts_cache_size)
+bram_writer  = BramWriter(consts_nbits)
+
 if __name__ == '__main__':
     # if used as main script, read command line argmuments 
     # and starts roach communication
@@ -22,9 +32,10 @@ if __name__ == '__main__':
     parser.add_argument("-ic", "--ideal_const", dest="ideal_const", default="0+1j",
         help="Ideal constant to load value to load.")
     parser.add_argument("-ct", "--caltar", dest="caltar",
-        help=".tar.gz file from where extract the calibration constants.")
+        help=".zip (or .tar.gz) file from where extract the calibration \
+        constants.")
     parser.add_argument("-cd", "--caldir", dest="caldir", default="",
-        help="Directory within the .tar.gz file where th constants are \
+        help="Directory within the compressed file where th constants are \
         located. Must end in / if not empty.")
     args = parser.parse_args()
 
@@ -32,76 +43,69 @@ if __name__ == '__main__':
     bm_load_constants(roach, args.load_ideal, complex(args.ideal_const), 
         args.caltar, args.caldir)
 
-def dss_load_constants(roach, load_ideal, ideal_const=0+1j, caltar="", caldir=""):
+def dss_load_constants(roach, load_ideal, ideal_const=0+1j, caltar="", caldir="",
+    roach_pool=None):
     """
     Load load digital sideband separation constants.
     :param roach: FpgaClient object to communicate with roach.
     :param load_ideal: if True, load ideal constant, else use calibration 
         constants from caldir.
     :param ideal_const: ideal constant value to load.
-    :param caltar: .tar.gz file with the calibration data.
-    :param caldir: directory with the calibration data within the tar file.
+    :param caltar: .zip (or .tar.gz) file with the calibration data.
+    :param caldir: directory with the calibration data within the compressed 
+        file.
+    :param roach_pool: RoachPool used to write the constant brams 
+        concurrently. If None, roach is used.
     """
     if load_ideal:
         print("Using ideal constant " + str(ideal_const) + ".")
         consts_usb = ideal_const * np.ones(nchannels, dtype=np.complex64)
         consts_lsb = ideal_const * np.ones(nchannels, dtype=np.complex64)
+        blobs = get_consts_blobs(consts_lsb, consts_usb)
     else: # use calibrated constants
         print("Using constants from calibration directory.")
-        consts_lsb, consts_usb = compute_consts(caltar, caldir)
+        key = consts_key(caltar, caldir, consts_nbits, consts_binpt)
+        blobs = consts_cache.load(key, 
+            lambda: get_consts_blobs(*compute_consts(caltar, caldir)))
 
     print("Loading constants...")
-    load_comp_constants(roach, consts_usb, bram_consts_usb_re, bram_consts_usb_im)
-    load_comp_constants(roach, consts_lsb, bram_consts_lsb_re, bram_consts_lsb_im)
+    bram_writer.write(roach, blobs, roach_pool, consts_diff_upload)
     print("done")
 
 def compute_consts(caltar, caldir):
     """
     Compute constants using tone calibration info.
-    :param caltar: calibration .tar.gz file.
+    :param caltar: calibration .zip (or .tar.gz) file.
     :param caldir: calibration directory.
     :return: calibration constants.
     """
     caldata = get_caldata(caltar, caldir)
-    
-    # get arrays
-    a2_toneusb = caldata['a2_toneusb']; a2_tonelsb = caldata['a2_tonelsb']
-    b2_toneusb = caldata['b2_toneusb']; b2_tonelsb = caldata['b2_tonelsb']
-    ab_toneusb = caldata['ab_toneusb']; ab_tonelsb = caldata['ab_tonelsb']
-
-    # consts usb are computed with tone in lsb, because you want to cancel out 
-    # lsb, the same for consts lsb
-    consts_usb =         -1 * ab_tonelsb  / b2_tonelsb #  ab*   / bb* = a/b
-    consts_lsb = -1 * np.conj(ab_toneusb) / a2_toneusb # (ab*)* / aa* = a*b / aa* = b/a
 
-    return consts_lsb, consts_usb
+    return caldata2consts(caldata)
 
 def get_caldata(datatar, datadir):
     """
-    Extract calibration data from directory compressed as .tar.gz.
+    Extract calibration data from a compressed directory. Only caldata.npz
+    is read from the archive. Old .tar.gz files are converted to .zip the
+    first time they are used.
     """
-    tar_file = tarfile.open(datatar)
-    caldata = np.load(tar_file.extractfile(datadir+'caldata.npz'))
+    calarch = DataArchive(datatar)
+    caldata = dict(calarch.load_npz(datadir+'caldata.npz'))
+    calarch.close()
 
     return caldata
 
-def load_comp_constants(roach, consts, bram_re, bram_im):
+def get_consts_blobs(consts_lsb, consts_usb):
     """
-    Load complex constants into ROACH bram. Real and imaginary parts
-    are loaded in separated bram blocks.
-    :param roach: FpgaClient object to communicate with roach
-    :param consts: complex constants array.
-    :param bram_re: bram block name for real part.
-    :param bram_im: bram block name for imaginary part.
+    Convert the constants of both sidebands into the fixed point data of
+    the ROACH constant brams.
+    :param consts_lsb: constants where LSB is maximized.
+    :param consts_usb: constants where USB is maximized.
+    :return: dictionary with the data of every bram as bytes.
     """
-    # separate real and imaginary
-    consts_re = np.real(consts)
-    consts_im = np.imag(consts)
-
-    # convert data into fixed point representation
-    consts_re_fixed = cd.float2fixed(consts_re, consts_nbits, consts_binpt, warn=True)
-    consts_im_fixed = cd.float2fixed(consts_im, consts_nbits, consts_binpt, warn=True)
+    blobs = consts2blobs(consts_usb, bram_consts_usb_re, bram_consts_usb_im, 
+        consts_nbits, consts_binpt)
+    blobs.update(consts2blobs(consts_lsb, bram_consts_lsb_re, 
+        bram_consts_lsb_im, consts_nbits, consts_binpt))
 
-    # load data
-    cd.write_interleaved_data(roach, bram_re, consts_re_fixed)
-    cd.write_interleaved_data(roach, bram_im, consts_im_fixed)
+    return blobs
@@ -1,14 +1,24 @@
 # File with all the basic parameters for multi LO scripts
 
 # imports
-import datetime, pyvisa
+import os, sys, datetime, pyvisa
+import calandigital as cd
 import numpy as np
+# shared modules (bram_io, live_plot, etc.)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    "..", "..", "..", "..", "Common_Scripts"))
 
 # communication parameters
 #roach_ip          = '133.40.220.2'
 roach_ip          = None
 boffile           = 'dss_2048ch_1520mhz.bof.gz'
 rf_generator_name = "TCPIP::192.168.1.34::INSTR"
+noise_source_name = "TCPIP::192.168.1.38::INSTR"
+multitone_generator_names = {'usb' : [], 'lsb' : []} # extra generators of 
+    # each sideband, that inject tones at the same time as the rf generator in
+    # the calibration sweep (multi-tone sweep), e.g. 
+    # {'usb' : ["TCPIP::192.168.1.35::INSTR"], 
+    #  'lsb' : ["TCPIP::192.168.1.36::INSTR"]}
 #rm = pyvisa.ResourceManager('@py')
 rm = pyvisa.ResourceManager('@sim')
 
@@ -18,12 +28,20 @@ bandwidth          = 1080 # MHz
 cal_acc_len_reg    = 'cal_acc_len'
 syn_acc_len_reg    = 'syn_acc_len'
 cnt_rst_reg        = 'cnt_rst'
+acc_cnt_reg        = None # accumulation counter register (None to detect new
+                          # accumulations from the spectra data)
 bram_addr_width    = 8  # bits
 bram_word_width    = 64 # bits
 pow_data_type      = '>u8'
 crosspow_data_type = '>i8'
 consts_nbits       = 32
 consts_binpt       = 27
+consts_cache_dir   = 'consts_cache' # fixed point constants cache directory
+consts_cache_size  = 64 # number of constant sets kept in the cache
+consts_diff_upload = True # only write the constant words that changed since
+                          # the last load
+nconnections       = 4 # katcp connections used to read bram groups 
+                       # concurrently (1 for serial reads)
 bram_a2    = ['dout_a2_0', 'dout_a2_1', 'dout_a2_2', 'dout_a2_3', 
               'dout_a2_4', 'dout_a2_5', 'dout_a2_6', 'dout_a2_7']
 bram_b2    = ['dout_b2_0', 'dout_b2_1', 'dout_b2_2', 'dout_b2_3', 
@@ -63,18 +81,107 @@ chnl_step   = 256
 date_time   =  datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 cal_datadir = "dss_cal "     + date_time
 srr_datadir = "dss_srr "     + date_time
+noise_datadir = "dss_cal_noise " + date_time
 pause_time  = 0.5 # should be > (1/bandwidth * FFT_size * acc_len * 2) in 
                       # order  for the spectra to be fully computed after a 
                       # tone change
+rawdata_step = 16 # full spectra are read and saved every rawdata_step tones 
+                  # for debugging (0 to only read the tone channels)
+wait_accs    = True # poll the ROACH for new accumulations after a tone 
+                    # change instead of always waiting pause_time (used as
+                    # timeout)
+rf_list_sweep = False # upload the tones of each sweep to the generators list
+                      # memory and step them with triggers (step mode is 
+                      # used if a generator doesn't support it). Not yet
+                      # verified with the lab generators
+rf_list_size  = 1601 # maximum number of points of the generators list
+interp_method     = 'spline' # interpolation of the calibration data between
+                             # tones: 'linear' (raw complex data), 'spline'
+                             # (cubic splines of magnitude and unwrapped
+                             # phase) or 'poly' (delay plus polynomial fit)
+interp_degree     = 5 # polynomial degree of the 'poly' interpolation
+interp_srr_target = 40 # dB, warn if the SRR allowed by the interpolation is
+                       # estimated lower (then use a smaller chnl_step)
+adaptive_sweep     = False # add calibration tones in passes after the 
+                           # test_channels tones, in the middle of the gaps 
+                           # where the interpolation SRR estimate is below 
+                           # interp_srr_target
+adaptive_min_step  = 8   # channels, minimum distance between adaptive tones
+adaptive_max_tones = 512 # maximum number of tones of an adaptive sweep
+multitone_guard     = 4  # channels at each side of every tone of a 
+                         # multi-tone step checked for leakage of the other 
+                         # tones
+multitone_isolation = 40 # dB, warn if a tone is less than this over the 
+                         # power of its guard channels
+adaptive_acc_len = False # set the accumulation length of every calibration
+                         # tone from its expected SNR (power of the previous 
+                         # tone over the noise floor, measured with the tones
+                         # off), the readings are rescaled to acc_len
+acc_snr_target   = 50 # dB, target SNR of the accumulated tone readings (the 
+                      # SRR allowed by the reading noise is a few dB higher)
+acc_len_range    = (2**10, 2**18) # minimum and maximum accumulation lengths
+                                  # of the adaptive accumulation
+noise_naccs = 16 # accumulations averaged per sideband in the noise 
+                 # calibration
+noise_cmds  = {'usb' : "rout:clos (@101); rout:open (@102)",
+               'lsb' : "rout:open (@101); rout:clos (@102)",
+               'off' : "rout:open (@101,102)"} # noise source commands that 
+               # inject the noise into each sideband (e.g. switches to the 
+               # sideband filters) and that turn it off
+noise_off_correction = True # also integrate with the noise source off, and 
+                            # subtract the receiver noise from the powers 
+                            # (without it the constants magnitude is biased
+                            # by S/(S+N), limiting the SRR)
 load_consts = True
 load_ideal  = False
 caltar      = 'dss_cal 2020-03-21 22:20:25.tar.gz'
 
+# emulation parameters
+emulate             = False # emulate the ROACH and the rf generator to run
+                            # the scripts without hardware (roach_emulator.py)
+emulator_time_scale = 1.0 # emulated accumulation time per real time (0 for
+                          # a new accumulation on every read)
+emulator_imbalance  = (1.0, 10.0) # (dB, degrees), analog front end mean
+                                  # magnitude and phase imbalance
+emulator_read_delay = 0.0 # s, emulated katcp latency of every bram read
+
 # derivative parameters
 nchannels     = 2**bram_addr_width * len(bram_a2)
 if_freqs      = np.linspace(0, bandwidth, nchannels, endpoint=False) # MHz
 test_channels = range(1, nchannels, chnl_step)
+nsnapshots    = len(test_channels[::rawdata_step]) if rawdata_step > 0 else 0
+cal_ntones    = max(adaptive_max_tones, len(test_channels)) if \
+                adaptive_sweep else len(test_channels) # max calibration tones
+cal_nsnaps    = len(range(0, cal_ntones, rawdata_step)) if rawdata_step > 0 \
+                else 0
 if_test_freqs = if_freqs[test_channels] # MHz
 rf_freqs_usb  = lo_freq + (if_freqs/1e3) # GHz
 rf_freqs_lsb  = lo_freq - (if_freqs/1e3) # GHz
+tone_generator_names = dict((sideband, [rf_generator_name] + names) for 
+    sideband, names in multitone_generator_names.items())
 dBFS          = 6.02*adc_bits + 1.76 + 10*np.log10(nchannels)
+
+# emulated ROACH and instruments
+if emulate:
+    from roach_emulator import DssEmulator
+    emulator = DssEmulator({'a2' : bram_a2, 'b2' : bram_b2, 
+        'ab_re' : bram_ab_re, 'ab_im' : bram_ab_im, 
+        'usb' : bram_usb, 'lsb' : bram_lsb,
+        'consts_usb_re' : bram_consts_usb_re, 
+        'consts_usb_im' : bram_consts_usb_im,
+        'consts_lsb_re' : bram_consts_lsb_re, 
+        'consts_lsb_im' : bram_consts_lsb_im},
+        nchannels, bandwidth, adc_bits, pow_data_type, crosspow_data_type,
+        sorted(set(sum(tone_generator_names.values(), []))), [lo_freq], 
+        noise_source_name=noise_source_name,
+        noise_source_cmds=noise_cmds, consts_nbits=consts_nbits,
+        consts_binpt=consts_binpt,
+        cal_acc_len_reg=cal_acc_len_reg, syn_acc_len_reg=syn_acc_len_reg,
+        cnt_rst_reg=cnt_rst_reg, acc_cnt_reg=acc_cnt_reg, acc_len=acc_len,
+        amp_imbalance=emulator_imbalance[0], 
+        phase_imbalance=emulator_imbalance[1],
+        time_scale=emulator_time_scale, read_delay=emulator_read_delay)
+    rm = emulator
+    initialize_roach = emulator.initialize_roach
+else:
+    initialize_roach = cd.initialize_roach
@@ -0,0 +1,465 @@
+#!/usr/bin/python
+# Script to predict the SRR of a calibrated receiver from its calibration
+# archive, without the SRR tone sweep. For every LO setting in the archive,
+# the constants computed from the calibration data are quantized to the fixed
+# point format of the constant brams, and applied to the input ratios of the
+# tones of each sideband. The input ratios are taken from the same
+# calibration (then only the quantization error remains), or from another
+# calibration archive (e.g. measured later, to include the drift of the
+# receiver). The errors of the calibration itself are added to that: the
+# interpolation error between tones (leave one out over the measured tones,
+# growing linearly with the distance outside the swept range), and the
+# reading noise of the tones (noise floor of the raw data snapshots over the
+# tone power). All the channels are predicted at once.
+# The channels with the worst predicted SRR in each part of the band are
+# listed, so that the SRR sweep is only needed to verify a few channels.
+# The format of the constants, the interpolation degree and the bandwidth are
+# taken from the testinfo.json of the archive, or else (older archives) from
+# the parameters file of the calibration script (--params). The same script
+# is used for the single LO and the multi LO (NAOJ) calibrations.
+# Usage: ./dss_predict_srr.py [archive] [options] (default: caltar of params)
+
+# imports
+import os, sys, re, time, json, argparse, importlib
+import numpy as np
+import matplotlib.pyplot as plt
+import calandigital as cd
+# shared modules (bram_io, live_plot, etc.)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    "..", "..", "..", "..", "Common_Scripts"))
+from data_archive import DataArchive
+from cal_interp import caldata2consts, estimate_interp_error, error2srr
+
+params = None # parameters module, only imported if a value is not in the 
+              # test info of the archive
+
+def main():
+    start_time = time.time()
+    args = parse_args()
+
+    archive = args.archive or load_params(args.params).caltar
+    print("Opening " + archive + "...")
+    calarch  = DataArchive(archive)
+    resparch = DataArchive(args.response) if args.response else calarch
+    # with the same data the constants cancel except for the quantization
+    self_response = os.path.abspath(resparch.archive) == \
+        os.path.abspath(calarch.archive)
+    print("done")
+
+    # fixed point format of the constants, as used in the calibration
+    testinfo = get_testinfo(calarch, "")
+    nbits = args.nbits if args.nbits is not None else get_param(testinfo, 
+        "consts nbits", "consts_nbits", args.params)
+    binpt = args.binpt if args.binpt is not None else get_param(testinfo, 
+        "consts binpt", "consts_binpt", args.params)
+
+    print("Predicting SRR...")
+    predsrr = {}
+    summary = {"archive" : calarch.archive, "response archive" :
+        resparch.archive, "consts nbits" : nbits, "consts binpt" : binpt, 
+        "ideal const" : args.ideal_const, "lo settings" : {}}
+    for caldir in get_caldirs(calarch):
+        measname = caldir.rstrip("/")
+        caldata  = calarch.load_npz(caldir + "caldata.npz")
+        respdata = resparch.load_npz(caldir + "caldata.npz")
+
+        # get constants as loaded into the ROACH
+        if args.ideal_const is not None:
+            consts_lsb = complex(args.ideal_const) * \
+                np.ones(len(caldata['a2_toneusb']), dtype=complex)
+            consts_usb = consts_lsb
+        else:
+            consts_lsb, consts_usb = caldata2consts(caldata)
+        consts_lsb, nsat_lsb = quantize_consts(consts_lsb, nbits, binpt)
+        consts_usb, nsat_usb = quantize_consts(consts_usb, nbits, binpt)
+
+        srr_usb, srr_lsb = predict_srr(respdata, consts_lsb, consts_usb)
+
+        # add the calibration errors, the ideal constant has none
+        srrs = {"usb" : srr_usb, "lsb" : srr_lsb}
+        lo_summary = {"saturated consts" : nsat_lsb + nsat_usb}
+        for sideband in ["usb", "lsb"]:
+            errors = {}
+            if args.ideal_const is None:
+                errors = estimate_cal_errors(calarch, caldir, caldata, 
+                    sideband, args.params)
+                if errors is None and self_response:
+                    raise Exception("The calibration errors of " + 
+                        calarch.archive + " can't be estimated (no tone " +
+                        "channels in testinfo.json), use --response with " +
+                        "another archive.")
+            srrs[sideband] = add_cal_errors(srrs[sideband], errors or {})
+            lo_summary[sideband] = srr_summary(srrs[sideband], args.nverify,
+                errors)
+        predsrr[measname] = (srrs["usb"], srrs["lsb"])
+        summary["lo settings"][measname] = lo_summary
+        print_summary(measname, summary["lo settings"][measname])
+    print("done")
+
+    print("Saving data...")
+    outname = os.path.splitext(calarch.archive)[0] + " predicted srr"
+    np.savez(outname, **dict((measname + "_" + sideband if measname else
+        sideband, srr) for measname, srrs in predsrr.items()
+        for sideband, srr in zip(["srr_usb", "srr_lsb"], srrs)))
+    with open(outname + ".json", "w") as f:
+        json.dump(summary, f, indent=4, sort_keys=True)
+    print_data(outname, predsrr, get_param(testinfo, "bandwidth mhz", 
+        "bandwidth", args.params))
+    print("done")
+
+    print("Finished. Total time: " + str(int(time.time() - start_time)) + "[s]")
+
+def parse_args():
+    """
+    Parse the command line arguments.
+    :return: parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description=
+        "Predict the SRR of a calibration archive without the SRR sweep.")
+    parser.add_argument("archive", nargs="?", help=".zip (or .tar.gz) "
+        "calibration archive (default: caltar of the parameters file).")
+    parser.add_argument("-p", "--params", default=os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "dss_parameters.py"),
+        help="parameters file of the calibration script, used for the values "
+        "missing in the testinfo.json of the archive (default: "
+        "dss_parameters.py). For the multi LO calibrations use "
+        "dss_multilo_parameters.py, running from its directory.")
+    parser.add_argument("-r", "--response", help="calibration archive used "
+        "as receiver response (default: the same archive, then only the "
+        "quantization and the estimated calibration errors are predicted). "
+        "Required if the archive has no tone channels in testinfo.json.")
+    parser.add_argument("-ic", "--ideal_const", help="predict the SRR with "
+        "an ideal constant (e.g. 0-1j) instead of the calibrated constants.")
+    parser.add_argument("--nbits", type=int, help="number of bits of the "
+        "fixed point constants (default: the one of the calibration).")
+    parser.add_argument("--binpt", type=int, help="binary point of the fixed "
+        "point constants (default: the one of the calibration).")
+    parser.add_argument("--nverify", type=int, default=8,
+        help="number of channels per sideband suggested for verification.")
+
+    return parser.parse_args()
+
+def load_params(params_file):
+    """
+    Import the parameters file of the calibration script (only once). Its 
+    directory is added to the path, for the modules that it imports.
+    :param params_file: parameters .py file.
+    :return: parameters module.
+    """
+    global params
+    if params is None:
+        paramsdir, filename = os.path.split(os.path.abspath(params_file))
+        sys.path.insert(0, paramsdir)
+        params = importlib.import_module(os.path.splitext(filename)[0])
+    return params
+
+def get_param(testinfo, key, name, params_file):
+    """
+    Get a parameter of the calibration from its test info, or else from the
+    parameters file (archives saved before the parameter was recorded).
+    :param testinfo: test info dictionary, or None.
+    :param key: key of the parameter in the test info.
+    :param name: name of the parameter in the parameters file.
+    :param params_file: parameters .py file.
+    :return: parameter value.
+    """
+    if testinfo is not None and key in testinfo:
+        return testinfo[key]
+    return getattr(load_params(params_file), name)
+
+def get_caldirs(calarch):
+    """
+    Get the directories of the LO settings of a calibration archive (the
+    directories with a caldata.npz file).
+    :param calarch: calibration DataArchive.
+    :return: sorted list of directories, with a trailing / if not empty.
+    """
+    caldirs = []
+    for name in calarch.names():
+        match = re.match(r"(.*/)?caldata\.npz$", name)
+        if match is not None:
+            caldirs.append(match.group(1) or "")
+
+    return sorted(caldirs)
+
+def quantize_consts(consts, nbits, binpt):
+    """
+    Quantize constants to the fixed point format of the constant brams,
+    saturating the constants out of range.
+    :param consts: complex constants array.
+    :param nbits: number of bits of the fixed point constants.
+    :param binpt: binary point of the fixed point constants.
+    :return: quantized constants, and number of saturated constants.
+    """
+    max_value = 2.0**(nbits-1-binpt)
+    min_value = -max_value
+    max_value = max_value - 2.0**-binpt
+    parts = [np.real(consts), np.imag(consts)]
+    nsat  = int(np.sum((parts[0] < min_value) | (parts[0] > max_value) |
+        (parts[1] < min_value) | (parts[1] > max_value)))
+    parts = [np.asarray(cd.float2fixed(np.clip(part, min_value, max_value),
+        nbits, binpt, warn=False), dtype=float) / 2**binpt for part in parts]
+
+    return parts[0] + 1j*parts[1], nsat
+
+def predict_srr(caldata, consts_lsb, consts_usb):
+    """
+    Predict the SRR of every channel. The input ratio b/a of the tones of
+    each sideband is taken from the calibration data, and the outputs are
+    computed as in the model: usb = a + consts_usb*b, lsb = b + consts_lsb*a.
+    The ratios are computed with the same powers used in compute_consts, so
+    that the unquantized constants of the same data cancel exactly.
+    :param caldata: calibration data with the receiver response.
+    :param consts_lsb: constants where LSB is maximized.
+    :param consts_usb: constants where USB is maximized.
+    :return: predicted SRR of each sideband (linear): usb/lsb with the tones
+        in USB, and lsb/usb with the tones in LSB.
+    """
+    ratio_usb = np.conj(caldata['ab_toneusb']) / caldata['a2_toneusb']
+    ratio_lsb = caldata['b2_tonelsb'] / caldata['ab_tonelsb']
+
+    srr_usb = np.abs(1 + consts_usb*ratio_usb)**2 / \
+        np.maximum(np.abs(ratio_usb + consts_lsb)**2, 1e-300)
+    srr_lsb = np.abs(ratio_lsb + consts_lsb)**2 / \
+        np.maximum(np.abs(1 + consts_usb*ratio_lsb)**2, 1e-300)
+
+    return srr_usb, srr_lsb
+
+def get_testinfo(calarch, caldir):
+    """
+    Load the test info of a LO setting of a calibration archive (the test
+    info of the LO setting directory, or else the one of the archive).
+    :param calarch: calibration DataArchive.
+    :param caldir: directory of the LO setting.
+    :return: test info dictionary, or None if the archive has no test info.
+    """
+    for name in [caldir + "testinfo.json", "testinfo.json"]:
+        if name in calarch.names():
+            return json.loads(calarch.read(name).decode())
+    return None
+
+def load_snapshots(calarch, rawdir):
+    """
+    Load the a2 and b2 raw data snapshots of a tone sweep from an archive,
+    saved with RawDataStore (.npy files) or as one .npz file per tone.
+    :param calarch: calibration DataArchive.
+    :param rawdir: directory of the raw data, e.g. 'rawdata_tone_usb/'.
+    :return: a2 and b2 arrays with one row per snapshot, or None if there
+        are no snapshots.
+    """
+    names = calarch.names()
+    if rawdir + "chnls.npy" in names:
+        rows = calarch.load_npz(rawdir + "chnls.npy") >= 0
+        if not np.any(rows):
+            return None
+        return [calarch.load_npz(rawdir + key + ".npy")[rows] for key in 
+            ["a2", "b2"]]
+    npz_names = [name for name in names if name.startswith(rawdir + "chnl_")
+        and name.endswith(".npz")]
+    if len(npz_names) == 0:
+        return None
+    snapshots = [calarch.load_npz(name) for name in sorted(npz_names)]
+    return [np.array([snapshot[key] for snapshot in snapshots]) for key in 
+        ["a2", "b2"]]
+
+def estimate_cal_errors(calarch, caldir, caldata, sideband, params_file):
+    """
+    Estimate the relative error of the constants computed from the tones of
+    a sideband, in every channel. The interpolation error is estimated with
+    leave one out over the tone channels (the interpolated calibration data
+    is the measured data at those channels, except for the 'poly' method that
+    smooths it). The reading noise error needs the raw data snapshots. 
+    Noise calibrations have no interpolation error.
+    :param calarch: calibration DataArchive.
+    :param caldir: directory of the LO setting.
+    :param caldata: calibration data of the LO setting.
+    :param sideband: sideband of the tones ('usb' or 'lsb').
+    :param params_file: parameters file, for the interpolation degree of the
+        archives that don't have it in the test info.
+    :return: dictionary with the error of every channel of each estimated
+        term: {"interp" : error, "noise" : error}, or None if the tone
+        channels are unknown.
+    """
+    testinfo = get_testinfo(calarch, caldir)
+    if testinfo is None:
+        return None
+    a2 = caldata['a2_tone' + sideband]
+    b2 = caldata['b2_tone' + sideband]
+    ab = caldata['ab_tone' + sideband]
+    nchannels = len(a2)
+    acc_len = testinfo.get("acc len", 1)
+    errors = {}
+
+    if testinfo.get("cal mode") == "noise":
+        # all the channels are measured, the noise is averaged over the
+        # accumulations (the receiver noise is assumed lower than the source)
+        errors["noise"] = np.ones(nchannels) / np.sqrt(acc_len * 
+            testinfo.get("noise naccs", 1))
+        return errors
+
+    # get the tone channels
+    if sideband in testinfo.get("sweep chnls", {}):
+        tone_chnls = testinfo["sweep chnls"][sideband]
+    elif "chnl step" in testinfo:
+        tone_chnls = range(1, nchannels, testinfo["chnl step"])
+    else:
+        return None
+    tone_chnls = np.array(sorted(tone_chnls), dtype=int)
+    method = testinfo.get("interp method", 'linear')
+    degree = get_param(testinfo, "interp degree", "interp_degree", 
+        params_file) if method == 'poly' else None
+    errors["interp"] = interp_error(tone_chnls, a2, b2, ab, sideband, method,
+        degree)
+
+    # reading noise, with the noise floor of the snapshots (and the
+    # accumulation length of every tone with adaptive accumulation)
+    acc_lens = testinfo.get("tone acc lens", {}).get(sideband)
+    if acc_lens is not None and len(acc_lens) == len(tone_chnls):
+        acc_len = np.interp(np.arange(nchannels), tone_chnls, acc_lens)
+    snapshots = load_snapshots(calarch, caldir + "rawdata_tone_" + sideband + 
+        "/")
+    if snapshots is not None:
+        noise = [np.median(snapshot, axis=0) if len(snapshot) >= 3 else 
+            np.median(snapshot) for snapshot in snapshots]
+        errors["noise"] = np.sqrt(sum(noise_i / np.maximum(power - noise_i, 
+            1e-300) for noise_i, power in zip(noise, [a2, b2])) / acc_len)
+
+    return errors
+
+def interp_error(tone_chnls, a2, b2, ab, sideband, method, degree):
+    """
+    Estimate the interpolation error of the constants in every channel.
+    Between tones the error is estimated from the leave one out error of the
+    two closest tones (see estimate_interp_error). As the removed tone
+    doubles the tone spacing, and the interpolation error grows as
+    spacing**order (2 for linear, about 3 for the cubic spline at coarse
+    spacings), it is divided by 2**order. The error is zero at the tones
+    and maximum in the middle of the gaps. Outside the swept range the data
+    is extrapolated with the edge values, and the error is the change of a
+    quadratic fit of the ratio of the edge tones.
+    :param tone_chnls: channels of the measured tones, sorted.
+    :param a2: power of input a of all the channels.
+    :param b2: power of input b of all the channels.
+    :param ab: crosspower of inputs a and b of all the channels.
+    :param sideband: sideband of the tones ('usb' or 'lsb').
+    :param method: interpolation method of the calibration.
+    :param degree: polynomial degree of the 'poly' interpolation (not used
+        by the other methods).
+    :return: relative error of every channel.
+    """
+    chnls = np.arange(len(a2))
+    error = np.zeros(len(chnls))
+    if len(tone_chnls) < 2:
+        return error
+    ratios = np.conj(ab) / a2 if sideband == 'usb' else ab / b2
+
+    # between tones, geometric mean of the error of the gap tones
+    loo_error = estimate_interp_error(tone_chnls, a2[tone_chnls], 
+        b2[tone_chnls], ab[tone_chnls], sideband, method, degree) / \
+        2**{'linear' : 2, 'spline' : 3}.get(method, 0)
+    valid = np.isfinite(loo_error) & (loo_error > 0)
+    if np.any(valid):
+        log_error = np.interp(tone_chnls, tone_chnls[valid], 
+            np.log(loo_error[valid]))
+        for i in range(len(tone_chnls) - 1):
+            gap = chnls[tone_chnls[i]:tone_chnls[i+1]+1]
+            pos = (gap - tone_chnls[i]) / float(tone_chnls[i+1] - 
+                tone_chnls[i])
+            error[gap] = np.exp((log_error[i] + log_error[i+1]) / 2) * \
+                4*pos*(1 - pos)
+
+    # outside the swept range
+    for edge_chnls, outside in [(tone_chnls[:3], chnls < tone_chnls[0]), 
+        (tone_chnls[-3:], chnls > tone_chnls[-1])]:
+        edge = tone_chnls[0] if edge_chnls[0] == tone_chnls[0] else \
+            tone_chnls[-1]
+        fit = np.polyfit(edge_chnls - edge, ratios[edge_chnls], 
+            len(edge_chnls) - 1)
+        error[outside] = np.abs(np.polyval(fit, chnls[outside] - edge) / 
+            ratios[edge] - 1)
+
+    return error
+
+def add_cal_errors(srr, errors):
+    """
+    Add the calibration errors to a predicted SRR. The SRR is converted to
+    a relative error of the constants (see cal_interp.error2srr), and the
+    independent errors are added in quadrature.
+    :param srr: predicted SRR (linear).
+    :param errors: dictionary with the relative error of every channel of
+        each error term.
+    :return: predicted SRR with the errors (linear).
+    """
+    error2 = 4 / srr
+    for error in errors.values():
+        error2 = error2 + error**2
+    return 4 / error2
+
+def srr_summary(srr, nverify, errors=None):
+    """
+    Summarize the predicted SRR of a sideband, and choose the channels to
+    verify with the SRR sweep: the worst channel of each of nverify equal
+    parts of the band.
+    :param srr: predicted SRR (linear).
+    :param nverify: number of channels to verify.
+    :param errors: dictionary with the estimated calibration errors, their
+        SRR limits are added to the summary.
+    :return: dictionary with the summary.
+    """
+    srr_db = 10*np.log10(srr)
+    verify_chnls = [int(chnls[np.argmin(srr_db[chnls])]) for chnls in
+        np.array_split(np.arange(len(srr_db)), nverify) if len(chnls) > 0]
+
+    summary = {"min db" : float(np.min(srr_db)),
+        "median db" : float(np.median(srr_db)),
+        "verify chnls" : verify_chnls}
+    for key, error in (errors or {}).items():
+        limit_db = error2srr(error)
+        summary[key + " limit db"] = {"min" : float(np.min(limit_db)), 
+            "median" : float(np.median(limit_db))}
+
+    return summary
+
+def print_summary(measname, lo_summary):
+    """
+    Print the predicted SRR summary of a LO setting.
+    :param measname: name of the LO setting.
+    :param lo_summary: summary of the LO setting.
+    """
+    line = (measname + ": " if measname else "")
+    for sideband in ["usb", "lsb"]:
+        line += sideband.upper() + " min " + \
+            str(round(lo_summary[sideband]["min db"], 1)) + "[dB], median " + \
+            str(round(lo_summary[sideband]["median db"], 1)) + "[dB]; "
+    print(line + "verify chnls USB " +
+        str(lo_summary["usb"]["verify chnls"]) + ", LSB " +
+        str(lo_summary["lsb"]["verify chnls"]))
+    if lo_summary["saturated consts"] > 0:
+        print("Warning: " + str(lo_summary["saturated consts"]) +
+            " constants saturated in the fixed point format.")
+
+def print_data(outname, predsrr, bandwidth):
+    """
+    Print the predicted SRR to a .pdf image for an easy check.
+    :param outname: name of the output files (without extension).
+    :param predsrr: dictionary with the predicted SRR of every LO setting:
+        {measname : (srr_usb, srr_lsb)}.
+    :param bandwidth: bandwidth of the IF (MHz).
+    """
+    fig, [ax0, ax1] = plt.subplots(1, 2, figsize=(12, 5))
+    for measname, (srr_usb, srr_lsb) in sorted(predsrr.items()):
+        if_freqs = np.linspace(0, bandwidth, len(srr_usb), endpoint=False)
+        ax0.plot(if_freqs, 10*np.log10(srr_usb), label=measname)
+        ax1.plot(if_freqs, 10*np.log10(srr_lsb), label=measname)
+    for ax, sideband in [(ax0, 'USB'), (ax1, 'LSB')]:
+        ax.grid()
+        ax.set_xlabel('IF Frequency [MHz]')
+        ax.set_ylabel('Predicted SRR [dB]')
+        ax.set_title(sideband)
+    if len(predsrr) > 1:
+        ax1.legend(fontsize='x-small')
+    fig.savefig(outname + '.pdf')
+    plt.close(fig)
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,7 @@
 # the spectrum of the primary signal, reference signal and
 # the filter output. Also add some user interface to control 
 # the filter and show additional plots.
-import time
+import os, sys, time, threading
 import numexpr
 import numpy as np
 import matplotlib.pyplot as plt
@@ -10,6 +10,10 @@ import matplotlib.animation as animation
 import Tkinter as Tk
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
 import calandigital as cd
+# shared modules (bram_io, live_plot, etc.)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    "..", "..", "..", "Common_Scripts"))
+from live_plot import FrameQueue
 from kestfilt_parameters import *
 
 def main():
@@ -32,22 +36,50 @@ def main():
     fig, lines = create_window(roach)
     print("done.")
 
-    # animation function
+    # start acquisition thread, with its own ROACH connection so that the
+    # GUI never waits for the bram reads
+    frames = FrameQueue()
+    acq_thread = threading.Thread(target=acquire_spectra, 
+        args=(cd.initialize_roach(roach_ip), frames))
+    acq_thread.daemon = True
+    acq_thread.start()
+
+    # animation function, plots the latest acquired spectra
     def animate(_):
-        for line, specbrams in zip(lines, specbrams_list):
-            # update acc_len
-            acc_len = roach.read_uint(acc_len_reg)
+        for i, (data, append) in frames.get().items():
+            lines[i].set_data(*data)
+        return lines
+
+    anim = animation.FuncAnimation(fig, animate, interval=plot_interval, 
+        blit=True)
+    Tk.mainloop()
+
+def acquire_spectra(roach, frames):
+    """
+    Read the spectra continuously and put them in the frame queue to be
+    plotted. Spectra not plotted on time are replaced by the newer ones.
+    The reads are paced to the slower of the accumulation period and the
+    plot refresh period. Runs in the acquisition thread.
+    :param roach: FpgaClient object to read the spectra.
+    :param frames: FrameQueue where to put the spectra.
+    """
+    while True:
+        start = time.time()
+        # update acc_len
+        acc_len = roach.read_uint(acc_len_reg)
+        for i, specbrams in enumerate(specbrams_list):
             # get spectral data
             specdata = cd.read_interleave_data(roach, 
                 specbrams, spec_addr_width, spec_word_width, 
                 spec_data_type)
             specdata = cd.scale_and_dBFS_specdata(specdata,
                 acc_len, dBFS)
-            line.set_data(freqs, specdata)
-        return lines
+            frames.put({i : (freqs, specdata)})
 
-    anim = animation.FuncAnimation(fig, animate, blit=True)
-    Tk.mainloop()
+        # wait for new spectra to read and plot
+        period = max(acc_len * nchannels / (bandwidth*1e6), 
+            plot_interval / 1000.0)
+        time.sleep(max(period - (time.time() - start), 0))
 
 def create_window(roach):
     """
@@ -46,6 +46,8 @@ acc_len     = 2**7
 filter_gain = 2**31
 filter_acc  = 2**0
 filter_chnl = 2**11
+plot_interval = 200 # ms, refresh period of the spectra plots (the spectra
+                    # are read at most once per refresh)
 
 # derivative parameters
 nchannels = 2**spec_addr_width * len(specbrams_list[0])